@@ -0,0 +1,225 @@
+"""Benchmark suite of 'calc_paths' on a synthetic market.
+
+Generates a reproducible market (see 'benchmarks.synthetic_market') into a
+local SQLite DB, runs a fixed list of searches through 'calc_paths' and
+reports, for each of them, the wall time, the SQL statements issued, the
+memory allocated and the paths found (no network needed):
+    python -m benchmarks.calc_paths_suite --exchanges 40 --coins 300
+
+Searches run as 'exch_results' does with '--top-k' (e.g. the 'MAX_PATHS'
+of the config) and with the NumPy evaluation with '--vectorised' (needs
+'--top-k').
+
+Results can be saved with '--output' and compared with a previous run with
+'--baseline': the exit status is 1 if a search got slower than
+'--tolerance', issued more SQL statements or found a different number of
+paths, so it can be used to gate releases.
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import tracemalloc
+from sqlalchemy import event
+from crypto_exchange_path import app, db
+from crypto_exchange_path.market_snapshot import refresh_snapshot
+from crypto_exchange_path.path_calculator import calc_paths
+from crypto_exchange_path.utils_db import get_coin, get_exchange
+from benchmarks.synthetic_market import (MarketConfig, FEE_MIX,
+                                         parse_fee_mix,
+                                         create_market_tables,
+                                         generate_market)
+
+"""Searches always run: (orig_coin, orig_loc, dest_coin, dest_loc).
+'None' locations are replaced by 'Wallet'/'Bank' and '*' by the exchange
+with most coins listed.
+"""
+FIXED_SEARCHES = [('btc-bitcoin', None, 'eth-ethereum', None),
+                  ('eth-ethereum', None, 'btc-bitcoin', None),
+                  ('usd-us-dollars', None, 'btc-bitcoin', None),
+                  ('btc-bitcoin', '*', 'eur-euro', None),
+                  ('c0-coin-0', None, 'c1-coin-1', None),
+                  ('c2-coin-2', '*', 'usd-us-dollars', '*')]
+
+"""Fee settings of the searches and amount searched (in USD).
+"""
+FEE_SETTINGS = {"CEP": "(CEP)", "Default": "(Avg)"}
+SEARCH_AMOUNT_USD = 3000
+
+"""Time differences below this (in seconds) are not reported as regressions
+(noise of the very fast searches).
+"""
+MIN_TIME_DIFF = 0.001
+
+
+def get_searches(usd_prices, n_random, seed):
+    """Returns the searches of the suite: 'FIXED_SEARCHES' (those whose
+    coins exist) plus 'n_random' random pairs drawn with 'seed'.
+    """
+    searches = [search for search in FIXED_SEARCHES
+                if search[0] in usd_prices and search[2] in usd_prices]
+    rnd = random.Random(seed)
+    coin_ids = sorted(usd_prices)
+    for _ in range(n_random):
+        orig_coin, dest_coin = rnd.sample(coin_ids, 2)
+        searches.append((orig_coin, None, dest_coin, None))
+    return searches
+
+
+def get_location(loc, coin, busiest_exch):
+    """Returns the 'Exchange' of the location 'loc' (see 'FIXED_SEARCHES').
+    """
+    if loc == '*':
+        return get_exchange(busiest_exch)
+    if loc:
+        return get_exchange(loc)
+    return get_exchange('bank' if coin.type == 'Fiat' else 'wallet')
+
+
+def run_search(search, usd_prices, busiest_exch, logger, counter,
+               max_hops, repeat, top_k=None, vectorised=False):
+    """Runs 'search' 'repeat' times (best time is kept) and once more
+    tracing the memory allocations.
+    Returns a dictionary with the measures.
+    """
+    orig_coin_id, orig_loc, dest_coin_id, dest_loc = search
+    orig_coin = get_coin(orig_coin_id)
+    dest_coin = get_coin(dest_coin_id)
+    orig_amt = round(SEARCH_AMOUNT_USD / usd_prices[orig_coin_id], 8)
+    args = (get_location(orig_loc, orig_coin, busiest_exch), orig_coin,
+            orig_amt, get_location(dest_loc, dest_coin, busiest_exch),
+            dest_coin, get_coin('usd-us-dollars'), FEE_SETTINGS, logger)
+    kwargs = {'max_hops': max_hops, 'top_k': top_k, 'vectorised': vectorised}
+    times = []
+    for _ in range(repeat):
+        counter['sql'] = 0
+        start = time.perf_counter()
+        paths = calc_paths(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+    sql = counter['sql']
+    tracemalloc.start()
+    calc_paths(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    name = "{}@{} > {}@{}".format(orig_coin_id, args[0].id, dest_coin_id,
+                                  args[3].id)
+    return {'search': name,
+            'time': min(times),
+            'sql': sql,
+            'peak_kb': round(peak / 1024, 1),
+            'paths': len(paths)}
+
+
+def compare_results(results, baseline, tolerance):
+    """Compares 'results' with the ones of a previous run.
+    Returns the list of regressions found.
+    """
+    previous = {result['search']: result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['search'])
+        if not old:
+            continue
+        if (result['time'] > old['time'] * (1 + tolerance) and
+                result['time'] - old['time'] > MIN_TIME_DIFF):
+            regressions.append("{}: time {:.4f}s -> {:.4f}s"
+                               .format(result['search'], old['time'],
+                                       result['time']))
+        if result['sql'] > old['sql']:
+            regressions.append("{}: SQL statements {} -> {}"
+                               .format(result['search'], old['sql'],
+                                       result['sql']))
+        if result['paths'] != old['paths']:
+            regressions.append("{}: paths {} -> {}"
+                               .format(result['search'], old['paths'],
+                                       result['paths']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--exchanges', type=int, default=40)
+    parser.add_argument('--coins', type=int, default=300)
+    parser.add_argument('--pair-density', type=float, default=0.7)
+    parser.add_argument('--fee-mix', default=None,
+                        help="Weights of the withdrawal fee types, e.g. "
+                             "'Absolute=4,Percentage=1' (types: {})"
+                             .format(', '.join(FEE_MIX)))
+    parser.add_argument('--price-coverage', type=float, default=0.9)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--random-searches', type=int, default=10)
+    parser.add_argument('--max-hops', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--top-k', type=int, default=None)
+    parser.add_argument('--vectorised', action='store_true')
+    parser.add_argument('--db', default='benchmark_market.db')
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    fee_mix = parse_fee_mix(args.fee_mix) if args.fee_mix else FEE_MIX
+    config = MarketConfig(args.exchanges, args.coins, args.pair_density,
+                          fee_mix, args.price_coverage, args.seed)
+    logger = logging.getLogger('Benchmark')
+    logger.setLevel(logging.ERROR)
+    # The engine is rebuilt with the new URI on its next use
+    app.config['SQLALCHEMY_DATABASE_URI'] = \
+        'sqlite:///' + os.path.abspath(args.db)
+    counter = {'sql': 0}
+
+    with app.app_context():
+        start = time.perf_counter()
+        create_market_tables(db)
+        usd_prices = generate_market(db, config)
+        print("Market generated in {:.2f}s: {}"
+              .format(time.perf_counter() - start, config))
+
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def count_sql(*args):
+            counter['sql'] += 1
+
+        start = time.perf_counter()
+        snapshot = refresh_snapshot()
+        print("Snapshot loaded in {:.2f}s ({} SQL statements): {}"
+              .format(time.perf_counter() - start, counter['sql'],
+                      snapshot))
+        busiest_exch = max(sorted(snapshot.adjacency),
+                           key=lambda exch: len(snapshot.adjacency[exch]))
+
+        results = []
+        for search in get_searches(usd_prices, args.random_searches,
+                                   args.seed):
+            result = run_search(search, usd_prices, busiest_exch, logger,
+                                counter, args.max_hops, args.repeat,
+                                args.top_k, args.vectorised)
+            results.append(result)
+            print("{:<50} {:>8.4f}s {:>5} SQL {:>10.1f} KB {:>6} paths"
+                  .format(result['search'], result['time'], result['sql'],
+                          result['peak_kb'], result['paths']))
+    print("TOTAL: {:.4f}s, {} SQL statements, {} paths"
+          .format(sum(result['time'] for result in results),
+                  sum(result['sql'] for result in results),
+                  sum(result['paths'] for result in results)))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': config._asdict(), 'results': results}, f,
+                      indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != json.loads(json.dumps(config._asdict())):
+            print("WARNING: Baseline generated with a different market")
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: {}".format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
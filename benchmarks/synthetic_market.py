@@ -0,0 +1,230 @@
+"""Reproducible synthetic markets written into the market tables ('Coin',
+'Exchange', 'Fee', 'TradePair' and 'Price'), so searches can be benchmarked
+on a local SQLite DB with no network (see 'benchmarks.calc_paths_suite').
+
+The same 'MarketConfig' always generates the same rows.
+"""
+import random
+from collections import namedtuple, OrderedDict
+from crypto_exchange_path.models import Coin, Exchange, Fee, TradePair, Price
+
+"""Parameters of a synthetic market:
+    - exchanges: number of exchanges (plus 'Wallet' and 'Bank').
+    - coins: number of cryptos (plus BTC, ETH, USDT, USD and EUR).
+    - pair_density: probability of listing each coin/base coin pair in an
+      exchange that lists both.
+    - fee_mix: relative weights of the withdrawal fee types (see 'FEE_MIX').
+    - price_coverage: share of cryptos with USD/EUR prices (the rest only
+      have a BTC price, so their FX must be triangulated or fails).
+    - seed: seed of the random generator.
+"""
+MarketConfig = namedtuple('MarketConfig', ['exchanges', 'coins',
+                                           'pair_density', 'fee_mix',
+                                           'price_coverage', 'seed'])
+
+"""Withdrawal fee types generated by default and their relative weights.
+'Other coin' fees are paid in BTC and 'Missing' fees have no amount yet
+(status 'Pending'), as found in the real tables.
+"""
+FEE_MIX = OrderedDict([('Absolute', 40),
+                       ('Percentage', 20),
+                       ('Other coin', 10),
+                       ('Less1kUSD', 5),
+                       ('1%+20', 5),
+                       ('Zero', 10),
+                       ('Missing', 10)])
+
+"""Coins used as base coins of the trade pairs, and their USD prices.
+"""
+BASE_COINS = OrderedDict([('btc-bitcoin', ('BTC', 'Crypto', 30000.0)),
+                          ('eth-ethereum', ('ETH', 'Crypto', 2000.0)),
+                          ('usdt-tether', ('USDT', 'Crypto', 1.0)),
+                          ('usd-us-dollars', ('USD', 'Fiat', 1.0)),
+                          ('eur-euro', ('EUR', 'Fiat', 1.1))])
+
+"""Scopes of the trade fees selectable in the search form.
+"""
+TRADE_FEE_SCOPES = ['(Maker)', '(Taker)', '(CEP)', '(BNB)']
+
+MARKET_TABLES = [Coin, Exchange, Fee, TradePair, Price]
+
+
+def parse_fee_mix(text):
+    """Parses a fee mix given as 'Absolute=4,Percentage=1,...'.
+    Types not given get weight 0.
+    """
+    fee_mix = OrderedDict((fee_type, 0) for fee_type in FEE_MIX)
+    for item in text.split(','):
+        fee_type, _, weight = item.partition('=')
+        fee_type = fee_type.strip()
+        if fee_type not in fee_mix:
+            raise ValueError("Unknown fee type '{}' (valid: {})"
+                             .format(fee_type, ', '.join(FEE_MIX)))
+        fee_mix[fee_type] = float(weight)
+    return fee_mix
+
+
+def create_market_tables(db):
+    """(Re)creates the market tables (only those, so the rest of the DB is
+    left untouched).
+    """
+    tables = [model.__table__ for model in MARKET_TABLES]
+    db.Model.metadata.drop_all(bind=db.engine, tables=tables)
+    db.Model.metadata.create_all(bind=db.engine, tables=tables)
+
+
+def generate_market(db, config):
+    """Fills the market tables with the market of 'config'.
+    Returns the USD price of each coin (used to size the searches).
+    """
+    rnd = random.Random(config.seed)
+    coins = []
+    usd_prices = {}
+    for coin_id, (symbol, coin_type, price) in BASE_COINS.items():
+        coins.append(Coin(id=coin_id, symbol=symbol, long_name=symbol,
+                          url_name=symbol.lower(), ranking=len(coins) + 1,
+                          local_fn=coin_id + '.png', type=coin_type,
+                          status='Active'))
+        usd_prices[coin_id] = price
+    for i in range(config.coins):
+        coin_id = 'c{}-coin-{}'.format(i, i)
+        coins.append(Coin(id=coin_id, symbol='C{}'.format(i),
+                          long_name='Coin {}'.format(i),
+                          url_name='coin-{}'.format(i),
+                          ranking=len(coins) + 1, local_fn=coin_id + '.png',
+                          type='Crypto', status='Active'))
+        usd_prices[coin_id] = round(10 ** rnd.uniform(-3, 3), 8)
+    prices = generate_prices(rnd, config, coins, usd_prices)
+    # 'Less1kUSD' fees need the USD price of the coin (as in the real data)
+    usd_priced = {price.coin for price in prices
+                  if price.base_coin == 'usd-us-dollars'}
+    usd_priced.update(coin.id for coin in coins if coin.type == 'Fiat')
+    exchanges = [Exchange(id='wallet', name='Wallet', type='Wallet',
+                          img_fn='wallet.png', site_url='', affiliate='No',
+                          status='Active'),
+                 Exchange(id='bank', name='Bank', type='Bank',
+                          img_fn='bank.png', site_url='', affiliate='No',
+                          status='Active')]
+    fees = [Fee(exchange='wallet', action='Withdrawal', scope=coin.id,
+                amount=0, fee_coin='-', type='Absolute', status='Active')
+            for coin in coins if coin.type == 'Crypto']
+    fees += [Fee(exchange='bank', action='Withdrawal', scope=coin.id,
+                 amount=0, fee_coin='-', type='Absolute', status='Active')
+             for coin in coins if coin.type == 'Fiat']
+    pairs = []
+    alt_ids = [coin.id for coin in coins[len(BASE_COINS):]]
+    for i in range(config.exchanges):
+        exch = 'exch-{}'.format(i)
+        exchanges.append(Exchange(id=exch, name='Exchange {}'.format(i),
+                                  type='Exchange', img_fn=exch + '.png',
+                                  site_url='https://{}.com'.format(exch),
+                                  affiliate=rnd.choice(['Yes', 'No']),
+                                  status='Active'))
+        # Popular coins (best ranking) are listed more often
+        n_listed = rnd.randint(1, max(1, len(alt_ids) // 2))
+        listed = {alt_ids[min(int(rnd.expovariate(3 / len(alt_ids))),
+                              len(alt_ids) - 1)]
+                  for _ in range(n_listed)} if alt_ids else set()
+        bases = ['btc-bitcoin'] + [coin for coin in list(BASE_COINS)[1:]
+                                   if rnd.random() < 0.5]
+        listed.update(bases)
+        for coin in sorted(listed):
+            for base_coin in bases:
+                # Base coins are only quoted in the ones listed before them
+                if (calc_base_order(base_coin) < calc_base_order(coin) and
+                        rnd.random() < config.pair_density):
+                    pairs.append(TradePair(exchange=exch, coin=coin,
+                                           base_coin=base_coin,
+                                           volume=round(rnd.uniform(0, 5),
+                                                        3)))
+            fees.append(generate_withdrawal_fee(rnd, config, exch, coin,
+                                                usd_prices[coin],
+                                                coin in usd_priced))
+            if rnd.random() < 0.2:
+                fee_type = rnd.choice(['Percentage', 'Less1kUSD'])
+                if coin not in usd_priced:
+                    fee_type = 'Percentage'
+                fees.append(Fee(exchange=exch, action='Deposit', scope=coin,
+                                amount=rnd.choice([0.1, 0.2]),
+                                fee_coin='-', type=fee_type,
+                                status='Active'))
+        fees += generate_trade_fees(rnd, exch)
+    db.session.add_all(coins + exchanges + fees + pairs + prices)
+    db.session.commit()
+    return usd_prices
+
+
+def calc_base_order(coin):
+    """Returns the position of 'coin' in 'BASE_COINS' (after all of them if
+    it is not a base coin).
+    """
+    base_coins = list(BASE_COINS)
+    if coin in base_coins:
+        return base_coins.index(coin)
+    return len(base_coins)
+
+
+def generate_prices(rnd, config, coins, usd_prices):
+    """Returns the 'Price's of 'coins': all of them are priced in BTC and
+    the share 'price_coverage' of them also in USD and EUR.
+    """
+    prices = []
+    btc_usd = usd_prices['btc-bitcoin']
+    for coin in coins:
+        if coin.type != 'Crypto':
+            continue
+        if coin.id in BASE_COINS or rnd.random() < config.price_coverage:
+            for fiat in ['usd-us-dollars', 'eur-euro']:
+                prices.append(Price(coin=coin.id, base_coin=fiat,
+                                    price=(usd_prices[coin.id] /
+                                           usd_prices[fiat])))
+        if coin.id != 'btc-bitcoin':
+            prices.append(Price(coin=coin.id, base_coin='btc-bitcoin',
+                                price=usd_prices[coin.id] / btc_usd))
+    return prices
+
+
+def generate_withdrawal_fee(rnd, config, exch, coin, usd_price,
+                            usd_priced):
+    """Returns the withdrawal 'Fee' of 'coin' in 'exch', with a type drawn
+    from 'config.fee_mix' ('Less1kUSD' becomes 'Absolute' if the coin has
+    no USD price).
+    """
+    fee_type = rnd.choices(list(config.fee_mix),
+                           weights=list(config.fee_mix.values()))[0]
+    if fee_type == 'Less1kUSD' and not usd_priced:
+        fee_type = 'Absolute'
+    fee = Fee(exchange=exch, action='Withdrawal', scope=coin,
+              amount=round(rnd.uniform(0.1, 5) / usd_price, 8),
+              fee_coin='-', type='Absolute', status='Active')
+    if fee_type == 'Percentage':
+        fee.type = 'Percentage'
+        fee.amount = round(rnd.uniform(0.1, 1), 3)
+        fee.min_amount = rnd.choice([None, round(1 / usd_price, 8)])
+    elif fee_type == 'Other coin':
+        fee.amount = 0.0001
+        fee.fee_coin = 'btc-bitcoin'
+    elif fee_type in ['Less1kUSD', '1%+20']:
+        fee.type = fee_type
+        fee.amount = rnd.choice([1, 2, 3])
+    elif fee_type == 'Zero':
+        fee.amount = 0
+    elif fee_type == 'Missing':
+        fee.amount = None
+        fee.status = 'Pending'
+    return fee
+
+
+def generate_trade_fees(rnd, exch):
+    """Returns the trade 'Fee's of 'exch' (maker, taker and, sometimes, the
+    discounted ones).
+    """
+    maker = rnd.choice([0.1, 0.15, 0.2, 0.25])
+    amounts = {'(Maker)': maker,
+               '(Taker)': rnd.choice([maker, 0.2, 0.3]),
+               '(CEP)': 0.05 if rnd.random() < 0.3 else None,
+               '(BNB)': 0.075 if rnd.random() < 0.2 else None}
+    return [Fee(exchange=exch, action='Trade', scope=scope,
+                amount=amounts[scope], fee_coin='-', type='Percentage',
+                status='Active')
+            for scope in TRADE_FEE_SCOPES if amounts[scope] is not None]
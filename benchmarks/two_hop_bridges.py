@@ -0,0 +1,201 @@
+"""Benchmark of the two-hop paths of 'calc_paths' (see 'RouteEngine') vs the
+nested loop of the baseline (exch_A x coinZ_A x exch_B x coinZ_B), which
+enumerated the bridge candidates before calculating any of them.
+
+Runs on a synthetic in-memory market (no DB, no network):
+    python -m benchmarks.two_hop_bridges --exchanges 100 --coins 5000
+
+The baseline is replayed on the same snapshot: candidates enumerated by the
+nested loop, then calculated one by one ('follow_paths'). Its DB queries are
+not included, so its time is a lower bound. It is linear in the number of
+origin exchanges, so it is timed on a sample of them ('--legacy-sample')
+and extrapolated to the full market. Both must find the same two-hop paths
+(with '--top-k', those of 'calc_paths' must be among the baseline ones).
+"""
+import time
+import random
+import logging
+import argparse
+from collections import namedtuple
+from crypto_exchange_path.market_snapshot import (MarketSnapshot, CoinRecord,
+                                                  ExchangeRecord, FeeRecord)
+from crypto_exchange_path.path_calculator import (calc_paths, calc_path_key,
+                                                  follow_paths)
+
+PairRecord = namedtuple('PairRecord', ['exchange', 'coin', 'base_coin',
+                                       'volume'])
+
+PriceRecord = namedtuple('PriceRecord', ['coin', 'base_coin', 'price'])
+
+BASE_COINS = ['btc-bitcoin', 'eth-ethereum', 'USDT', 'usd-us-dollars']
+
+"""Fee settings of the searches, amount searched (in USD) and USD price of
+all the crypto coins of the market.
+"""
+FEE_SETTINGS = {'Default': '(Avg)'}
+SEARCH_AMOUNT_USD = 3000
+USD_PRICE = 10.0
+
+logger = logging.getLogger('Benchmark')
+
+
+def generate_market(n_exchanges, n_coins, seed):
+    """Generates a 'MarketSnapshot' with 'n_exchanges' exchanges listing a
+    subset of 'n_coins' coins (popular coins are listed more often) against
+    BTC, ETH, USDT and USD. All the crypto coins are worth 'USD_PRICE'.
+    """
+    rnd = random.Random(seed)
+    coins = [CoinRecord('usd-us-dollars', 'USD', 'US Dollar', 'usd', 1,
+                        'usd.png', 'Fiat', 'Active')]
+    for i, coin_id in enumerate(BASE_COINS[:3]):
+        coins.append(CoinRecord(coin_id, coin_id[:4].upper(), coin_id,
+                                coin_id, i + 2, coin_id + '.png', 'Crypto',
+                                'Active'))
+    for i in range(n_coins):
+        coin_id = 'coin-{}'.format(i)
+        coins.append(CoinRecord(coin_id, 'C{}'.format(i), coin_id, coin_id,
+                                i + 5, coin_id + '.png', 'Crypto', 'Active'))
+    coin_ids = [coin.id for coin in coins[4:]]
+    exchanges = [ExchangeRecord('wallet', 'Wallet', 'Wallet', '', '', '', '',
+                                'Active')]
+    fees = []
+    pairs = []
+    for i in range(n_exchanges):
+        exch = 'exch-{}'.format(i)
+        exchanges.append(ExchangeRecord(exch, exch.upper(), 'Exchange',
+                                        exch + '.png', '', 'No', '',
+                                        'Active'))
+        for fee_type in ('(Maker)', '(Taker)'):
+            fees.append(FeeRecord(exch, 'Trade', fee_type,
+                                  rnd.choice([0.1, 0.2, 0.25]), None, '-',
+                                  'Percentage', 'Active'))
+        n_listed = min(len(coin_ids), rnd.randint(50, 600))
+        # Popular coins (low index) are more likely to be listed
+        listed = {coin_ids[min(int(rnd.expovariate(3 / len(coin_ids))),
+                               len(coin_ids) - 1)]
+                  for _ in range(n_listed)}
+        listed.update(BASE_COINS)
+        for coin in sorted(listed):
+            fees.append(FeeRecord(exch, 'Withdrawal', coin, 0.1, None, '-',
+                                  'Absolute', 'Active'))
+            for base_coin in BASE_COINS:
+                if coin != base_coin and rnd.random() < 0.6:
+                    pairs.append(PairRecord(exch, coin, base_coin,
+                                            rnd.uniform(0, 5)))
+    prices = [PriceRecord(coin.id, 'usd-us-dollars', USD_PRICE)
+              for coin in coins[1:]]
+    return MarketSnapshot(1, coins, exchanges, fees, pairs, prices)
+
+
+def legacy_bridges(snapshot, orig_coin, dest_coin, exchs_A, exchs_B):
+    """Nested loop of the baseline: returns the two-hop candidates.
+    """
+    coinZs_A = [(exch, list(snapshot.get_bridge_coins(exch, orig_coin)
+                            .items()))
+                for exch in exchs_A]
+    coinZs_B = [(exch, list(snapshot.get_bridge_coins(exch, dest_coin)
+                            .items()))
+                for exch in exchs_B]
+    found = []
+    for exch_A, coinZs in coinZs_A:
+        for coinZ_A in coinZs:
+            for exch_B, coinZs_2 in coinZs_B:
+                if exch_A == exch_B:
+                    continue
+                for coinZ_B in coinZs_2:
+                    if coinZ_A[0] == coinZ_B[0]:
+                        found.append((exch_A, coinZ_A[0], exch_B))
+    return found
+
+
+def follow_bridges(snapshot, bridges, orig_coin, dest_coin):
+    """Calculates the two-hop paths of 'bridges' one by one, as the baseline
+    did with all the candidates enumerated (see 'follow_paths').
+    """
+    wallet = snapshot.get_exchange('wallet')
+    route_keys = [((exch_A, (coinZ,)), (exch_B, (dest_coin,)))
+                  for exch_A, coinZ, exch_B in bridges]
+    return follow_paths(route_keys, wallet, snapshot.get_coin(orig_coin),
+                        SEARCH_AMOUNT_USD / USD_PRICE, wallet,
+                        snapshot.get_coin(dest_coin),
+                        snapshot.get_coin('usd-us-dollars'), FEE_SETTINGS,
+                        logger, snapshot)
+
+
+def search_bridges(snapshot, orig_coin, dest_coin, workers, top_k):
+    """Runs 'calc_paths' from the wallet to the wallet.
+    Returns the paths found and the candidates of its two-hop paths.
+    """
+    wallet = snapshot.get_exchange('wallet')
+    paths = calc_paths(wallet, snapshot.get_coin(orig_coin),
+                       SEARCH_AMOUNT_USD / USD_PRICE, wallet,
+                       snapshot.get_coin(dest_coin),
+                       snapshot.get_coin('usd-us-dollars'), FEE_SETTINGS,
+                       logger, snapshot=snapshot, workers=workers,
+                       top_k=top_k)
+    found = []
+    for path in paths:
+        legs = calc_path_key(path)
+        if len(legs) == 2 and len(legs[0][1]) == 1:
+            found.append((legs[0][0], legs[0][1][0], legs[1][0]))
+    return paths, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--exchanges', type=int, default=100)
+    parser.add_argument('--coins', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--legacy-sample', type=int, default=5)
+    parser.add_argument('--top-k', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+    logger.setLevel(logging.ERROR)
+
+    start = time.perf_counter()
+    snapshot = generate_market(args.exchanges, args.coins, args.seed)
+    print("Market generated in {:.2f}s: {}"
+          .format(time.perf_counter() - start, snapshot))
+
+    for orig_coin, dest_coin in [('btc-bitcoin', 'eth-ethereum'),
+                                 ('coin-0', 'coin-1'),
+                                 ('coin-10', 'btc-bitcoin')]:
+        # Exchanges that trade the pair directly are not used as in the
+        # baseline (nor in 'RouteEngine')
+        direct_pair_exch = snapshot.get_exch_by_pair(orig_coin, dest_coin,
+                                                     logger)
+        exchs_A = sorted(snapshot.get_exch_by_coin(orig_coin) -
+                         direct_pair_exch)
+        exchs_B = sorted(snapshot.get_exch_by_coin(dest_coin) -
+                         direct_pair_exch)
+        # Whole search on the whole market
+        start = time.perf_counter()
+        paths, found = search_bridges(snapshot, orig_coin, dest_coin,
+                                      args.workers, args.top_k)
+        search_time = time.perf_counter() - start
+        # Legacy search on a sample of origin exchanges
+        sample = exchs_A[:args.legacy_sample]
+        start = time.perf_counter()
+        legacy_found = legacy_bridges(snapshot, orig_coin, dest_coin,
+                                      sample, exchs_B)
+        legacy_paths = follow_bridges(snapshot, legacy_found, orig_coin,
+                                      dest_coin)
+        legacy_time = time.perf_counter() - start
+        legacy_time *= len(exchs_A) / max(len(sample), 1)
+        # Both searches must find the same two-hop paths
+        sample_found = {bridge for bridge in found if bridge[0] in sample}
+        legacy_found = {(legs[0][0], legs[0][1][0], legs[1][0])
+                        for legs in map(calc_path_key, legacy_paths)}
+        if args.top_k:
+            assert sample_found <= legacy_found
+        else:
+            assert sample_found == legacy_found
+        print("{} -> {}: {} paths ({} two-hop) | legacy {:.3f}s "
+              "(estimated) | calc_paths {:.4f}s | x{:.1f}"
+              .format(orig_coin, dest_coin, len(paths), len(found),
+                      legacy_time, search_time,
+                      legacy_time / max(search_time, 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -32,7 +32,7 @@ admin = Admin(app, name='CFS Admin',
               template_mode='bootstrap3')
 
 
-from crypto_exchange_path import routes
+from crypto_exchange_path import routes, query_stats
 from crypto_exchange_path.models import (User, Role, Exchange, Fee, Coin,
                                          TradePair, Mappings, Subscriber,
                                          Price, Feedback,
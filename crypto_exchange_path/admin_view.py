@@ -26,7 +26,27 @@ class MyModelView(ModelView):
                 return redirect(url_for('security.login', next=request.url))
 
 
-class ExchangeView(MyModelView):
+class MarketDataView(MyModelView):
+    """Views of the tables kept in the market snapshot. Changes are
+    published to all the workers and the snapshot is reloaded, so searches
+    use the edited data.
+    """
+
+    def after_model_change(self, form, model, is_created):
+        self.publish_changes()
+
+    def after_model_delete(self, model):
+        self.publish_changes()
+
+    def publish_changes(self):
+        # Imported here: the snapshot needs 'db', not available at import time
+        from crypto_exchange_path.market_snapshot import refresh_snapshot
+        from crypto_exchange_path.price_table import publish_market_data
+        publish_market_data()
+        refresh_snapshot()
+
+
+class ExchangeView(MarketDataView):
     can_create = True
     can_delete = False  # disable model deletion
     edit_modal = True
@@ -39,7 +59,7 @@ class ExchangeView(MyModelView):
                     'affiliate', 'language', 'status')
 
 
-class FeeView(MyModelView):
+class FeeView(MarketDataView):
     can_create = True
     can_delete = True
     edit_modal = True
@@ -55,7 +75,7 @@ class FeeView(MyModelView):
     form_columns = column_list
 
 
-class CoinView(MyModelView):
+class CoinView(MarketDataView):
     can_create = True
     can_delete = True
     edit_modal = True
@@ -66,7 +86,7 @@ class CoinView(MyModelView):
     column_display_pk = True
 
 
-class TradePairView(MyModelView):
+class TradePairView(MarketDataView):
     can_create = True
     can_delete = True  # disable model deletion
     edit_modal = True
@@ -102,7 +122,7 @@ class SubscriberView(MyModelView):
     column_display_pk = True
 
 
-class PriceView(MyModelView):
+class PriceView(MarketDataView):
     can_create = False
     can_delete = False  # disable model deletion
     edit_modal = True
@@ -112,6 +132,17 @@ class PriceView(MyModelView):
     can_export = True
     column_display_pk = True
 
+    def publish_changes(self):
+        # Edited prices are published as 'update_prices' does
+        from crypto_exchange_path.market_snapshot import refresh_snapshot
+        from crypto_exchange_path.price_table import publish_prices
+        from crypto_exchange_path.price_history import append_prices
+        from crypto_exchange_path.fx_manager import reset_fx
+        price_table = publish_prices()
+        append_prices(price_table.records())
+        reset_fx()
+        refresh_snapshot()
+
 
 class FeedbackView(MyModelView):
     can_create = False
@@ -132,12 +163,15 @@ class QueryRegisterView(MyModelView):
     page_size = 20  # the number of entries to display on the list view
     column_filters = ['session_id', 'orig_amt', 'orig_coin', 'orig_loc',
                       'dest_coin', 'dest_loc', 'currency', 'connection_type',
-                      'exchanges', 'results', 'start_time', 'finish_time']
+                      'exchanges', 'results', 'start_time', 'finish_time',
+                      'duration', 'cache_hit']
     can_export = True
     column_display_pk = True
+    column_default_sort = ('start_time', True)
     column_list = ('id', 'session_id', 'start_time', 'orig_amt', 'orig_coin',
                    'orig_loc', 'dest_coin', 'dest_loc', 'currency',
-                   'connection_type', 'results', 'finish_time', 'exchanges')
+                   'connection_type', 'results', 'finish_time', 'duration',
+                   'cache_hit', 'sections', 'candidates', 'exchanges')
 
 
 class UserView(MyModelView):
@@ -0,0 +1,73 @@
+""" ***********************************************************************
+***************************************************************************
+COIN TYPES
+***************************************************************************
+*********************************************************************** """
+
+"""Flags of the coin types ('Coin.type') and categories. Each coin gets a
+byte with its flags in 'CoinTypes'.
+"""
+CRYPTO = 1
+FIAT = 2
+STABLECOIN = 4
+
+"""Coins (symbols) of each category. Categories are flags added to the
+type of every coin with one of the symbols.
+"""
+COIN_CATEGORIES = {STABLECOIN: ['USDT']}
+
+"""Categories of the coins that are not used as intermediate coins of
+two-hop paths (cryptos that are not transferred between exchanges).
+"""
+BRIDGE_EXCLUDED = STABLECOIN
+
+
+class CoinTypes(object):
+    """Interning table of the coin ids with the flags of each coin (type
+    and categories), so sets of coins are checked or filtered by mask
+    without looking up the coin records.
+    """
+
+    TYPE_FLAGS = {'Crypto': CRYPTO, 'Fiat': FIAT}
+
+    def __init__(self, coins):
+        self.ids = []
+        self.index = {}
+        self.flags = bytearray()
+        categories = {}
+        for category, symbols in COIN_CATEGORIES.items():
+            for symbol in symbols:
+                categories[symbol] = categories.get(symbol, 0) | category
+        for coin in coins:
+            self.index[coin.id] = len(self.ids)
+            self.ids.append(coin.id)
+            self.flags.append(self.TYPE_FLAGS.get(coin.type, 0) |
+                              categories.get(coin.symbol, 0))
+
+    def __repr__(self):
+        return "CoinTypes({} coins)".format(len(self.ids))
+
+    def get_flags(self, coin_id):
+        """Returns the flags of 'coin_id' (0 if unknown).
+        """
+        i = self.index.get(coin_id)
+        return self.flags[i] if i is not None else 0
+
+    def is_crypto(self, coin_id):
+        return bool(self.get_flags(coin_id) & CRYPTO)
+
+    def filter(self, coin_ids, include, exclude=0):
+        """Returns the coins of 'coin_ids' with any flag of 'include' and
+        none of 'exclude'.
+        """
+        get_flags = self.get_flags
+        return [coin_id for coin_id in coin_ids
+                if get_flags(coin_id) & include and
+                not get_flags(coin_id) & exclude]
+
+    def is_bridge(self, coin_id):
+        """Checks whether 'coin_id' can be the intermediate coin of two-hop
+        paths: cryptos not in 'BRIDGE_EXCLUDED' categories.
+        """
+        flags = self.get_flags(coin_id)
+        return bool(flags & CRYPTO) and not flags & BRIDGE_EXCLUDED
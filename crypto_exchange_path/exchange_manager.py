@@ -1,19 +1,27 @@
-from crypto_exchange_path.models import Fee, TradePair
 from crypto_exchange_path.objects import Trade, CoinZ
-from crypto_exchange_path import db
-from crypto_exchange_path.utils_db import is_crypto, fx_exchange, get_coin
+from crypto_exchange_path.market_snapshot import get_snapshot
 
 
 class ExchangeManager(object):
+    """Trades and coinZs of an exchange for some fee settings. Managers are
+    shared by all the searches done with the same snapshot (see
+    'get_exchange_manager'), so the coinZs found are memoised for all of
+    them. The results returned must not be modified.
+    """
 
-    def __init__(self, exchange, fee_settings, logger):
+    def __init__(self, exchange, fee_settings, logger, snapshot=None):
         self.exchange = exchange
         self.logger = logger
         self.fee_settings = fee_settings
+        self.snapshot = snapshot if snapshot else get_snapshot()
         self.default_fee = self.get_fee_setting("Default")
         self.special_fee = self.get_fee_setting(exchange.id)
         self.cep_promo = self.get_fee_setting("CEP")
-        self.coinZs = None
+        self.trade_fees = self.snapshot.get_trade_fee_resolver(
+            exchange.id, self.cep_promo, self.special_fee, self.default_fee)
+        self.coinZs = {}
+        self.cryptoZs = {}
+        self.best_coinZs = {}
 
     def get_fee_setting(self, key):
         """Gets a fee setting from the 'fee_settings' dictionary.
@@ -23,101 +31,25 @@ class ExchangeManager(object):
         except KeyError as e:
             return None
 
-    def calc_fee_literal(self, fee, scope):
-        """Auxiliar function for 'get_trade_fee'.
-        Calcs the fee literal to be later shown in the website.
-        """
-        if scope == "(Maker)":
-            scope_str = "(for Market Makers)"
-        elif scope == "(Taker)":
-            scope_str = "(for Market Takers)"
-        elif scope == "(BNB)":
-            scope_str = "(when paid in BNB)"
-        else:
-            scope_str = "({} trades)".format(scope)
-        return "{}% {}".format(fee, scope_str)
-
     def get_trade_fee(self, sell_amt, sell_coin, buy_coin):
-        """Get the trade fee to be applied.
+        """Get the trade fee to be applied (see 'TradeFeeResolver').
         Returns a tuple: [<amount%>, <coin_object>, <fee_literal>].
         """
-        # Get trading fees for the exchange
-        exch_trade_fees = Fee.query.filter_by(exchange=self.exchange.id,
-                                              action='Trade').all()
-        # Check whether the query found fees
-        if not exch_trade_fees:
+        if not self.trade_fees.has_fees:
             self.logger.warning("perform_trade: No trade fees "
                                 "found for exchange'{}'. Skipping trade "
                                 "calculation for '{}/{}'"
                                 .format(self.exchange.id,
                                         sell_coin.id,
                                         buy_coin.id))
-            return None
-        # Generate trade_pair to look for it in fees
-        trade_pair = "{}/{}".format(sell_coin.id,
-                                    buy_coin.id)
-        # Find the trading fee for the given pair
-        return_fee = [None, None, None]
-        cep_promo_found = False
-        special_fee_found = False
-        pair_fee_found = False
-        maker_fee = None
-        taker_fee = None
-        fee_coin_avg = None
-        for fee in exch_trade_fees:
-            # Save 'Maker'/Taker fees in case they are needed latter
-            if fee.scope == '(Maker)':
-                maker_fee = fee.amount
-                fee_coin_avg = fee.fee_coin
-            elif fee.scope == '(Taker)':
-                taker_fee = fee.amount
-                fee_coin_avg = fee.fee_coin
-            # First look for our promos
-            if fee.scope == self.cep_promo:
-                cep_promo_found = True
-                fee_literal = self.calc_fee_literal(fee.amount, fee.scope)
-                return_fee = [fee.amount, fee.fee_coin, fee_literal]
-            # Then look for special fees of the exchange
-            elif fee.scope == self.special_fee:
-                if not cep_promo_found:
-                    special_fee_found = True
-                    fee_literal = self.calc_fee_literal(fee.amount, fee.scope)
-                    return_fee = [fee.amount, fee.fee_coin, fee_literal]
-            # Then look for special fees for given pairs
-            elif fee.scope in trade_pair:
-                if not cep_promo_found and not special_fee_found:
-                    pair_fee_found = True
-                    fee_literal = self.calc_fee_literal(fee.amount, fee.scope)
-                    return_fee = [fee.amount, fee.fee_coin, fee_literal]
-            # Finally, look for the default fee
-            elif fee.scope == self.default_fee:
-                if (not cep_promo_found and not special_fee_found
-                        and not pair_fee_found):
-                    fee_literal = self.calc_fee_literal(fee.amount, fee.scope)
-                    return_fee = [fee.amount, fee.fee_coin, fee_literal]
-        # If fee was found, return it
-        if return_fee[0] is not None:
-            return return_fee
-        # If fee was not found already, then it must be set as '(Avg)'
-        elif self.default_fee == '(Avg)':
-            avg_fee = round((maker_fee + taker_fee) / 2, 4)
-            if maker_fee == taker_fee:
-                fee_literal = "{}% (for both Market Makers & Market Takers)"\
-                    .format(avg_fee)
-            else:
-                fee_literal = "{}% (average of Market Makers fee - {}% -"\
-                    " and Market Takers fee - {}% -)"\
-                    .format(avg_fee, maker_fee, taker_fee)
-            return [avg_fee, fee_coin_avg, fee_literal]
-        # This else should work just if there are configuration errors
-        else:
-            return_fee
+            return [None, None, None]
+        return self.trade_fees.resolve(sell_coin.id, buy_coin.id)
 
     def perform_trade(self, sell_amt, sell_coin, buy_coin):
         """Performs the trade from 'sell_coin' to 'buy_coin'.
         Returns a 'Trade' object
         """
-        # Find the trading fee for the given pairget_trade_fee(
+        # Find the trading fee for the given pair
         fee_amt_perc, fee_coin, fee_literal = self.get_trade_fee(sell_amt,
                                                                  sell_coin,
                                                                  buy_coin)
@@ -129,10 +61,11 @@ class ExchangeManager(object):
                                         buy_coin.id))
             return None
         # Perform trade:
-        buy_amt = fx_exchange(sell_coin.id,
-                              buy_coin.id,
-                              sell_amt * (1 - fee_amt_perc / 100),
-                              self.logger)
+        net_sell_amt = sell_amt * (1 - fee_amt_perc / 100)
+        buy_amt = self.snapshot.fx_exchange(sell_coin.id,
+                                            buy_coin.id,
+                                            net_sell_amt,
+                                            self.logger)
         if buy_amt is None:
             self.logger.warning("perform_trade [2]: Trade could not be "
                                 "performed '{}[{}/{}]'. "
@@ -155,11 +88,11 @@ class ExchangeManager(object):
         fee_amt = fee_amt_perc / 100 * sell_amt
         # If 'FeeCoin' has a value, calculate fees in 'FeeCoin'
         if fee_coin and fee_coin is not '-':
-            fee_amt = fx_exchange(sell_coin.id,
-                                  fee_coin,
-                                  fee_amt,
-                                  self.logger)
-            fee_coin = get_coin(fee_coin)
+            fee_amt = self.snapshot.fx_exchange(sell_coin.id,
+                                                fee_coin,
+                                                fee_amt,
+                                                self.logger)
+            fee_coin = self.snapshot.get_coin(fee_coin)
         else:
             fee_coin = sell_coin
         # Return calculated trade
@@ -171,7 +104,7 @@ class ExchangeManager(object):
                                     fee_amt, fee_coin.id))
         return Trade(sell_amt, sell_coin,
                      buy_amt, buy_coin,
-                     fee_amt, fee_coin, fee_literal)
+                     fee_amt, fee_coin, fee_literal, self.snapshot)
 
     def get_all_coinZs(self, coin):
         """Gets all the coins (cryptos & fiat) that trade in the exchange
@@ -179,61 +112,62 @@ class ExchangeManager(object):
         The liquidity needs to be higher than the given liquidity.
         Returns a list: [[<coinZ_1>,<liq_1>],[<coinZ_2>,<liq_2>],...)
         """
-        # Get CoinZ's that trade against 'coin' (Coin='coin')
-        coinZs = db.session.query(TradePair)\
-                           .filter((TradePair.exchange == self.exchange.id) &
-                                   (TradePair.coin == coin)).all()
-        coinZs = [(item.base_coin, item.volume) for item in coinZs]
-        # Get CoinZ's that trade against 'coin' (BaseCoin='coin')
-        coinZs_aux = db.session.query(TradePair)\
-                               .filter((TradePair.exchange == self.exchange.id)
-                                       & (TradePair.base_coin == coin)).all()
-        coinZs_aux = [(item.coin, item.volume) for item in coinZs_aux]
-        if coinZs_aux:
-            coinZs += coinZs_aux
+        if coin in self.coinZs:
+            return self.coinZs[coin]
+        # Get CoinZ's that trade against 'coin' (as Coin or BaseCoin)
+        coinZs = self.snapshot.get_coinZs(self.exchange.id, coin)
+        self.coinZs[coin] = coinZs
         # Return results
         self.logger.debug("get_all_coinZs: [{}] CoinZ's against '{}' [{}]: {}"
                           .format(self.exchange.id, coin, len(coinZs), coinZs))
-        return set(coinZs)
+        return coinZs
 
     def get_all_cryptoZs(self, coin):
         """Gets all the cryptos (not Fiat) that trade in the exchange
-        against the given coin. Manually removes 'USDT' as well.
+        against the given coin, but 'coin_types.BRIDGE_EXCLUDED' (USDT).
         Returns a list: [[<coinZ_1>,<liq_1>],[<coinZ_2>,<liq_2>],...)
         """
-        # Get all coinZs (crypto & Fiat)
-        cryptoZs = self.get_all_coinZs(coin)
-        # Remove fiat coins & USDT
-        result_cryptoZs = []
-        for item in cryptoZs:
-            if is_crypto(item[0]) and (item[0] != 'USDT'):
-                result_cryptoZs.append(item)
-        return result_cryptoZs
+        if coin not in self.cryptoZs:
+            # Fiat coins & USDT are already filtered out in the bridge index
+            cryptoZs = self.snapshot.get_bridge_coins(self.exchange.id, coin)
+            self.cryptoZs[coin] = list(cryptoZs.items())
+        return self.cryptoZs[coin]
 
     def get_best_coinZ(self, coin, baseCoin):
         """Finds a coin that trades in the exchange against both given coins.
         Returns a 'CoinZ' object.
         """
-        # Get CoinZ's that trade against 'coin' & 'baseCoin'
-        coinZ_coin = self.get_all_coinZs(coin)
-        coinZ_baseCoin = self.get_all_coinZs(baseCoin)
-        # Find CoinZ that trades agains both coins with highest liquidity
-        winning_coinZ = CoinZ(None, -1, -1)
-        for coinZ in coinZ_coin:
-            for coinZ_2 in coinZ_baseCoin:
-                if coinZ[0] == coinZ_2[0]:
-                    if min(coinZ[1], coinZ_2[1]) < winning_coinZ.min_liq():
-                        continue
-                    # If same liquidity (or no available), BTC prevails
-                    elif min(coinZ[1], coinZ_2[1]) == winning_coinZ.min_liq():
-                        if (winning_coinZ.coin
-                                and winning_coinZ.coin.id == 'btc-bitcoin'):
-                            continue
-                    winning_coinZ = CoinZ(get_coin(coinZ[0]),
-                                          coinZ[1],
-                                          coinZ_2[1])
-        if not winning_coinZ.coin:
+        key = (coin, baseCoin)
+        if key not in self.best_coinZs:
+            self.best_coinZs[key] = self.find_best_coinZ(coin, baseCoin)
+        return self.best_coinZs[key]
+
+    def find_best_coinZ(self, coin, baseCoin):
+        """Calculation of 'get_best_coinZ' (not memoised), on the bridge
+        index of the snapshot (see 'MarketSnapshot.get_best_bridge').
+        """
+        bridge = self.snapshot.get_best_bridge(self.exchange.id, coin,
+                                               baseCoin)
+        if not bridge:
             return None
+        winning_coinZ = CoinZ(self.snapshot.get_coin(bridge[0]), bridge[1],
+                              bridge[2])
         self.logger.debug("[{}] Chosen CoinZ: {}"
                           .format(self.exchange.id, winning_coinZ))
         return winning_coinZ
+
+
+def get_exchange_manager(exch_id, fee_settings, logger, snapshot):
+    """Returns the 'ExchangeManager' of 'exch_id' for 'fee_settings', shared
+    by all the searches done with 'snapshot' (one manager per exchange and
+    fee settings used by it).
+    """
+    key = (exch_id, fee_settings.get("CEP"), fee_settings.get("Default"),
+           fee_settings.get(exch_id))
+    manager = snapshot.managers.get(key)
+    if manager is None:
+        manager = ExchangeManager(snapshot.get_exchange(exch_id),
+                                  fee_settings, logger, snapshot)
+        # If another thread created it meanwhile, use that one
+        manager = snapshot.managers.setdefault(key, manager)
+    return manager
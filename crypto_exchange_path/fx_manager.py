@@ -1,35 +1,87 @@
+from threading import Lock
+
 """ ***********************************************************************
 ***************************************************************************
 PRICE MANAGING FUNCTIONS
 ***************************************************************************
 *********************************************************************** """
 
-"""Dictionary where FX prices will be stored.
+"""Returned by 'FxCache.get' when the FX has not been calculated yet (None
+is a cached miss: the FX can not be calculated with the current prices).
 """
-fx_dictionary = {}
+NOT_CACHED = object()
 
 
-def reset_fx():
-    """Resets the dictionary of FX. To be called whenever the 'update_prices'
-    function is called.
+class FxCache(object):
+    """FX rates calculated by 'utils_db.fx_exchange' with the prices of one
+    'update_prices' run ('version'). Stores zero rates and misses (None) as
+    well, and counts hits, misses and hits of cached misses ('negative').
+    Caches are never cleared: 'reset_fx' replaces the current one, so
+    conversions running meanwhile keep the cache (and prices) they started
+    with.
     """
-    global fx_dictionary
-    fx_dictionary = {}
 
+    def __init__(self, version):
+        self.version = version
+        self.rates = {}
+        self.hits = 0
+        self.misses = 0
+        self.negative = 0
+        self.lock = Lock()
+
+    def __repr__(self):
+        return ("FxCache(v{}: {} rates, hits={}, misses={}, negative={})"
+                .format(self.version, len(self.rates), self.hits,
+                        self.misses, self.negative))
+
+    def get(self, coin, base_coin):
+        """Returns the FX to convert 'coin' into 'base_coin' (None if it can
+        not be calculated) or 'NOT_CACHED'.
+        """
+        rate = self.rates.get((coin, base_coin), NOT_CACHED)
+        with self.lock:
+            if rate is NOT_CACHED:
+                self.misses += 1
+            elif rate is None:
+                self.negative += 1
+            else:
+                self.hits += 1
+        return rate
+
+    def set(self, coin, base_coin, fx):
+        self.rates[(coin, base_coin)] = fx
+
+    def get_stats(self):
+        """Returns the cache counters as a dictionary (see the
+        'fx_cache_stats' route).
+        """
+        with self.lock:
+            return {'version': self.version,
+                    'rates': len(self.rates),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'negative': self.negative}
 
-def set_fx(coin, base_coin, fx):
-    """Adds a new FX to the FX dictionary.
+
+"""Cache of the current prices and lock that guards its replacement.
+"""
+_fx_cache = FxCache(0)
+_fx_lock = Lock()
+
+
+def get_fx_cache():
+    """Returns the current FX cache. Callers should keep the object for the
+    whole conversion instead of calling this function again.
     """
-    global fx_dictionary
-    if coin not in fx_dictionary.keys():
-        fx_dictionary[coin] = {}
-    fx_dictionary[coin][base_coin] = fx
+    return _fx_cache
 
 
-def get_fx(coin, base_coin):
-    """Gets a FX from the FX dictionary.
+def reset_fx():
+    """Replaces the FX cache with an empty one. To be called whenever the
+    'update_prices' function is called. Returns the replaced cache.
     """
-    try:
-        return fx_dictionary[coin][base_coin]
-    except KeyError as e:
-        return None
+    global _fx_cache
+    with _fx_lock:
+        old_cache = _fx_cache
+        _fx_cache = FxCache(old_cache.version + 1)
+    return old_cache
@@ -0,0 +1,162 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+""" ***********************************************************************
+***************************************************************************
+FX MATRIX
+***************************************************************************
+*********************************************************************** """
+
+"""Coins used to triangulate FX rates: cryptos are priced in USD and fiat
+coins are priced through the BTC price in each of them.
+"""
+USD = 'usd-us-dollars'
+BTC = 'btc-bitcoin'
+
+
+class FxMatrix(object):
+    """FX rates between all the coins of the 'Price' table, resolved when
+    the prices are loaded (same rules as 'utils_db.fx_exchange'):
+        1. Price of the pair ('coin'/'base_coin').
+        2. Inverse of the price of the reverse pair (if not 0).
+        3. Triangulation through USD prices (cryptos).
+        4. Triangulation through the BTC price in each coin (fiat).
+    Rates 3 and 4 are the ratio of two per-coin prices, so the matrix is
+    kept factored: one vector per triangulation (indexed by the interned
+    coin ids) plus the pairs with a price of their own. Any rate is then a
+    dictionary lookup or a division, and 'get_rates()' resolves many of
+    them at once with NumPy (if available).
+    """
+
+    def __init__(self, prices, coin_ids=()):
+        self.index = {}
+        self.ids = []
+        for coin_id in coin_ids:
+            self.intern(coin_id)
+        for coin, base_coin in prices:
+            self.intern(coin)
+            self.intern(base_coin)
+        # Pairs with a price of their own (direct prices prevail)
+        self.pair_rates = {}
+        for (coin, base_coin), price in prices.items():
+            if price and (base_coin, coin) not in prices:
+                self.pair_rates[(base_coin, coin)] = 1 / price
+        self.pair_rates.update(prices)
+        # Triangulation vectors (None if the coin has no price)
+        self.usd_prices = [None] * len(self.ids)
+        self.fiat_prices = [None] * len(self.ids)
+        for coin_id, i in self.index.items():
+            self.usd_prices[i] = prices.get((coin_id, USD))
+            self.fiat_prices[i] = prices.get((BTC, coin_id))
+        self.arrays = None
+        if np is not None:
+            self.arrays = self.build_arrays()
+
+    def __repr__(self):
+        return ("FxMatrix({} coins, {} pairs)"
+                .format(len(self.ids), len(self.pair_rates)))
+
+    def intern(self, coin_id):
+        if coin_id not in self.index:
+            self.index[coin_id] = len(self.ids)
+            self.ids.append(coin_id)
+
+    def build_arrays(self):
+        """Returns the NumPy version of the matrix used by 'get_rates()':
+        [<usd prices>, <fiat prices>, <sorted pair keys>, <pair rates>].
+        Missing prices are NaN and pair keys are 'i * <coins> + j'.
+        """
+        n = len(self.ids)
+        usd = np.array([np.nan if price is None else price
+                        for price in self.usd_prices], dtype=float)
+        fiat = np.array([np.nan if price is None else price
+                         for price in self.fiat_prices], dtype=float)
+        keys = np.array([self.index[coin] * n + self.index[base_coin]
+                         for coin, base_coin in self.pair_rates],
+                        dtype=np.int64)
+        rates = np.array([np.nan if rate is None else rate
+                          for rate in self.pair_rates.values()], dtype=float)
+        order = np.argsort(keys)
+        return [usd, fiat, keys[order], rates[order]]
+
+    def get_rate(self, orig_coin, dest_coin):
+        """Returns the rate to convert 'orig_coin' into 'dest_coin' (None if
+        it can not be calculated).
+        """
+        if orig_coin == dest_coin:
+            return 1
+        if (orig_coin, dest_coin) in self.pair_rates:
+            return self.pair_rates[(orig_coin, dest_coin)]
+        i = self.index.get(orig_coin)
+        j = self.index.get(dest_coin)
+        if i is None or j is None:
+            return None
+        if self.usd_prices[i] is not None and self.usd_prices[j]:
+            return self.usd_prices[i] / self.usd_prices[j]
+        if self.fiat_prices[i] and self.fiat_prices[j] is not None:
+            return self.fiat_prices[j] / self.fiat_prices[i]
+        return None
+
+    def get_rates(self, orig_coins, dest_coins):
+        """Returns the rates to convert each of 'orig_coins' into the coin
+        in the same position of 'dest_coins' (None if not available).
+        """
+        if self.arrays is None or not orig_coins:
+            return [self.get_rate(orig_coin, dest_coin)
+                    for orig_coin, dest_coin in zip(orig_coins, dest_coins)]
+        usd, fiat, keys, pair_rates = self.arrays
+        n = len(self.ids)
+        i = np.array([self.index.get(coin, -1) for coin in orig_coins])
+        j = np.array([self.index.get(coin, -1) for coin in dest_coins])
+        known = (i >= 0) & (j >= 0)
+        i = np.where(known, i, 0)
+        j = np.where(known, j, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Rules in reverse order: each one overrides the previous ones
+            fiat_ok = (np.nan_to_num(fiat[i]) != 0) & ~np.isnan(fiat[j])
+            rates = np.where(fiat_ok, fiat[j] / fiat[i], np.nan)
+            usd_ok = ~np.isnan(usd[i]) & (np.nan_to_num(usd[j]) != 0)
+            rates = np.where(usd_ok, usd[i] / usd[j], rates)
+        pair_keys = i * n + j
+        pos = np.minimum(np.searchsorted(keys, pair_keys), len(keys) - 1)
+        if len(keys):
+            has_pair = keys[pos] == pair_keys
+            rates = np.where(has_pair, pair_rates[pos], rates)
+        rates = np.where(i == j, 1.0, rates)
+        rates = np.where(known | (np.array(orig_coins, dtype=object) ==
+                                  np.array(dest_coins, dtype=object)),
+                         rates, np.nan)
+        return [None if np.isnan(rate) else float(rate) for rate in rates]
+
+    def convert(self, orig_coin, dest_coin, amount):
+        """Converts 'amount' of 'orig_coin' into 'dest_coin' (rounded as
+        'utils_db.fx_exchange'). Returns None if there is no rate.
+        """
+        if amount is None:
+            return None
+        if orig_coin == dest_coin:
+            return amount
+        rate = self.get_rate(orig_coin, dest_coin)
+        if rate is None:
+            return None
+        return round(rate * amount, 8)
+
+    def convert_many(self, orig_coins, dest_coins, amounts):
+        """Batch version of 'convert()'. 'dest_coins' can be a single coin.
+        Returns a list with the amounts converted.
+        """
+        if isinstance(dest_coins, str):
+            dest_coins = [dest_coins] * len(orig_coins)
+        rates = self.get_rates(orig_coins, dest_coins)
+        converted = []
+        for orig_coin, dest_coin, amount, rate in zip(orig_coins, dest_coins,
+                                                      amounts, rates):
+            if amount is None or rate is None:
+                converted.append(None)
+            elif orig_coin == dest_coin:
+                converted.append(amount)
+            else:
+                converted.append(round(rate * amount, 8))
+        return converted
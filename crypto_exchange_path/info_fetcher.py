@@ -14,14 +14,15 @@ from crypto_exchange_path.utils_db import (get_exch_by_coin,
                                            get_coins_in_pairs,
                                            get_coins_by_exchange,
                                            add_mapping,
-                                           make_unique_field,
-                                           get_coin_by_symbol,
-                                           get_coin_by_longname,
-                                           get_coin_by_urlname)
+                                           make_unique_field)
 from crypto_exchange_path.utils import (generate_file_path,
                                         resize_image,
                                         error_notifier)
 from crypto_exchange_path.fx_manager import reset_fx
+from crypto_exchange_path.price_table import (publish_prices,
+                                              publish_market_data)
+from crypto_exchange_path.price_history import append_prices
+from crypto_exchange_path.market_snapshot import refresh_snapshot
 
 """ ***********************************************************************
 ***************************************************************************
@@ -208,11 +209,12 @@ def update_coins(logger):
                  local_fn=local_fn,
                  type="Crypto",
                  status="Active")
-        # Check if for any reason Coin exists in DB (it shoudn't)
-        db_symbol_coin = get_coin_by_symbol(symbol)
-        db_longname_coin = get_coin_by_longname(long_name)
-        db_url_name_coin = get_coin_by_urlname(url_name)
-        if db_symbol_coin or db_longname_coin or db_url_name_coin:
+        # Check if for any reason Coin exists in DB (it shoudn't). Not
+        # checked in the snapshot: it does not have the coins added here
+        db_coin = Coin.query.filter((Coin.symbol == symbol) |
+                                    (Coin.long_name == long_name) |
+                                    (Coin.url_name == url_name)).first()
+        if db_coin:
             error_desc = ("update_coins: Error storing"
                           " {}. It already exists".format(c))
             continue
@@ -246,6 +248,10 @@ def update_coins(logger):
                                                  inactive_coins_count,
                                                  added_coins_count,
                                                  edited_coins_count))
+    # Publish new market data to all workers & reload snapshot (coins used
+    # by 'get_coin' and the searches)
+    publish_market_data()
+    refresh_snapshot(logger)
     return "ok"
 
 
@@ -434,6 +440,10 @@ def update_pairs(logger):
     body = added_pairs + removed_pairs
     print(body)
     # send_email_notification("'TradePair' table", body, mail, logger)
+    # Publish new market data to all workers & reload snapshot used by the
+    # path calculation
+    publish_market_data()
+    refresh_snapshot(logger)
     # Finish function
     logger.info("update_pairs: Pairs updated [{} rows inserted]"
                 .format(len(f_contents)))
@@ -542,6 +552,10 @@ def update_fees(logger):
     logger.info(body)
     logger.info("*****************************")
     # send_email_notification("'Coin' table", body, mail, logger)
+    # Publish new market data to all workers & reload snapshot used by the
+    # path calculation
+    publish_market_data()
+    refresh_snapshot(logger)
     # Finish function
     logger.info("update_fees: Fees updated [{} added / "
                 "{} flagged as inactive / "
@@ -646,8 +660,12 @@ def update_prices(logger):
     db.session.commit()
     logger.info("update_prices: Prices updated [{} rows inserted]"
                 .format(len(f_contents)))
-    # reset FX dictionary
-    reset_fx()
+    # Publish prices to all workers (and keep them in the price history),
+    # replace FX cache and reload snapshot
+    price_table = publish_prices()
+    append_prices(price_table.records())
+    logger.info("update_prices: FX cache replaced [{}]".format(reset_fx()))
+    refresh_snapshot(logger)
     # Finally, update coins in JSON file
     update_coins_file("crypto_exchange_path/static/data/coins.json")
     return "ok"
@@ -1133,6 +1151,9 @@ def import_exchanges(logger, file):
         db.session.add(exch)
     db.session.commit()
     logger.info("import_exchanges: {} rows inserted".format(len(f_contents)))
+    # Publish new market data to all workers & reload snapshot
+    publish_market_data()
+    refresh_snapshot(logger)
     return
 
 
@@ -1176,6 +1197,9 @@ def import_fees(logger, file):
         db.session.add(fee)
         db.session.commit()
     logger.info("import_fees: {} rows inserted".format(len(f_contents)))
+    # Publish new market data to all workers & reload snapshot
+    publish_market_data()
+    refresh_snapshot(logger)
     return
 
 
@@ -1215,6 +1239,9 @@ def import_coins(logger, file):
         db.session.add(coin)
     db.session.commit()
     logger.info("import_coins: {} rows inserted".format(len(f_contents)))
+    # Publish new market data to all workers & reload snapshot
+    publish_market_data()
+    refresh_snapshot(logger)
     return
 
 
@@ -1250,4 +1277,7 @@ def import_pairs(logger, file):
         db.session.add(pair)
         db.session.commit()
     logger.info("import_pairs: {} rows inserted".format(len(f_contents)))
+    # Publish new market data to all workers & reload snapshot
+    publish_market_data()
+    refresh_snapshot(logger)
     return
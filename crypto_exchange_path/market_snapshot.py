@@ -0,0 +1,372 @@
+import time
+from threading import Lock
+from collections import namedtuple
+from crypto_exchange_path.models import Coin, Exchange, Fee, TradePair, Price
+from crypto_exchange_path.utils_db import apply_fee
+from crypto_exchange_path.trade_fees import TradeFeeResolver
+from crypto_exchange_path.fx_matrix import FxMatrix
+from crypto_exchange_path.price_table import get_price_table
+from crypto_exchange_path.coin_types import (CoinTypes, CRYPTO,
+                                             BRIDGE_EXCLUDED)
+
+""" ***********************************************************************
+***************************************************************************
+MARKET SNAPSHOT
+***************************************************************************
+*********************************************************************** """
+
+"""Read-only copies of the rows used by the path calculation. They expose the
+same attributes as the models, so they can be used by the templates as well.
+"""
+CoinRecord = namedtuple('CoinRecord', ['id', 'symbol', 'long_name',
+                                       'url_name', 'ranking', 'local_fn',
+                                       'type', 'status'])
+ExchangeRecord = namedtuple('ExchangeRecord', ['id', 'name', 'type', 'img_fn',
+                                               'site_url', 'affiliate',
+                                               'language', 'status'])
+FeeRecord = namedtuple('FeeRecord', ['exchange', 'action', 'scope', 'amount',
+                                     'min_amount', 'fee_coin', 'type',
+                                     'status'])
+
+"""Seconds after which a snapshot is rebuilt even if no refresh was
+requested (e.g. when the tables were updated by another worker).
+"""
+SNAPSHOT_MAX_AGE = 15 * 60
+
+
+class MarketSnapshot(object):
+    """In-memory copy of 'Coin', 'Exchange', 'Fee', 'TradePair' and 'Price'
+    tables, indexed for the lookups done while calculating paths.
+    It is built once per data refresh and never modified afterwards (apart
+    from the FX rates, trade fee resolvers and 'ExchangeManager's it
+    memoises), so it can be shared between requests.
+    """
+
+    def __init__(self, version, coins, exchanges, fees, pairs, prices):
+        self.version = version
+        self.created = time.time()
+        self.coins = {}
+        self.coins_by_symbol = {}
+        self.coins_by_longname = {}
+        self.coins_by_urlname = {}
+        self.exchanges = {}
+        self.exchanges_by_name = {}
+        self.exchanges_by_type = {}
+        self.exchanges_by_status = {}
+        self.fees = {}
+        self.trade_fees = {}
+        self.trade_fee_resolvers = {}
+        self.managers = {}
+        self.exch_by_coin = {}
+        self.exch_by_pair = {}
+        self.adjacency = {}
+        self.bridges = {}
+        self.ranked_coinZs = {}
+        self.best_bridges = {}
+        self.exch_by_traded_coin = {}
+        self.prices = {}
+        for coin in coins:
+            self.coins[coin.id] = coin
+            self.coins_by_symbol[coin.symbol] = coin
+            self.coins_by_longname[coin.long_name] = coin
+            self.coins_by_urlname[coin.url_name] = coin
+        self.coin_types = CoinTypes(coins)
+        for exch in sorted(exchanges, key=lambda x: x.id):
+            self.exchanges[exch.id] = exch
+            self.exchanges_by_name[exch.name] = exch
+            self.exchanges_by_type.setdefault(exch.type, []).append(exch)
+            self.exchanges_by_status.setdefault(exch.status, []).append(exch)
+        for fee in fees:
+            if fee.action == 'Trade':
+                self.trade_fees.setdefault(fee.exchange, []).append(fee)
+            elif fee.status == 'Active':
+                self.fees[(fee.exchange, fee.action, fee.scope)] = fee
+                if fee.action == 'Withdrawal':
+                    self.exch_by_coin.setdefault(fee.scope, set())\
+                        .add(fee.exchange)
+        for pair in pairs:
+            exch_adjacency = self.adjacency.setdefault(pair.exchange, {})
+            for coin, coinZ in [(pair.coin, pair.base_coin),
+                                (pair.base_coin, pair.coin)]:
+                self.exch_by_pair.setdefault((coin, coinZ), set())\
+                    .add(pair.exchange)
+                coinZs = exch_adjacency.setdefault(coin, {})
+                # Pair listed in both directions: keep the most liquid one
+                if (coinZ not in coinZs or
+                        (pair.volume or 0) > (coinZs[coinZ] or 0)):
+                    coinZs[coinZ] = pair.volume
+        # Bridge candidates for two-hop paths: cryptos but 'BRIDGE_EXCLUDED'
+        for exch in self.adjacency:
+            for coin in self.adjacency[exch]:
+                self.exch_by_traded_coin.setdefault(coin, set()).add(exch)
+            self.bridges[exch] = {}
+            for coin, coinZs in self.adjacency[exch].items():
+                self.bridges[exch][coin] = {
+                    coinZ: coinZs[coinZ]
+                    for coinZ in self.coin_types.filter(coinZs, CRYPTO,
+                                                        BRIDGE_EXCLUDED)}
+        for price in prices:
+            self.prices[(price.coin, price.base_coin)] = price.price
+        self.fx = FxMatrix(self.prices, self.coin_types.ids)
+
+    def __repr__(self):
+        return ("MarketSnapshot(v{}: {} coins, {} exchanges, {} prices)"
+                .format(self.version,
+                        len(self.coins),
+                        len(self.exchanges),
+                        len(self.prices)))
+
+    def is_stale(self):
+        """Checks whether the snapshot is older than 'SNAPSHOT_MAX_AGE'.
+        """
+        return time.time() - self.created > SNAPSHOT_MAX_AGE
+
+    def get_coin(self, id):
+        """Returns the coin record with the given 'id'.
+        """
+        return self.coins.get(id)
+
+    def get_coin_by_symbol(self, symbol):
+        return self.coins_by_symbol.get(symbol)
+
+    def get_coin_by_longname(self, long_name):
+        return self.coins_by_longname.get(long_name)
+
+    def get_coin_by_urlname(self, url_name):
+        return self.coins_by_urlname.get(url_name)
+
+    def get_exchange(self, id):
+        """Returns the exchange record with the given 'id'.
+        """
+        return self.exchanges.get(id)
+
+    def get_exch_by_name(self, name):
+        return self.exchanges_by_name.get(name)
+
+    def get_exchanges(self, types=[], status=None):
+        """Returns the exchanges of the given 'types' and 'status' (all of
+        them if not given), sorted by id.
+        """
+        if types:
+            exchanges = [exch for type in types
+                         for exch in self.exchanges_by_type.get(type, [])]
+            if status:
+                exchanges = [exch for exch in exchanges
+                             if exch.status == status]
+            return sorted(exchanges, key=lambda x: x.id)
+        if status:
+            return list(self.exchanges_by_status.get(status, []))
+        return list(self.exchanges.values())
+
+    def get_price(self, coin, base_coin):
+        """Returns the price of 'coin' in 'base_coin' (None if not found).
+        """
+        return self.prices.get((coin, base_coin))
+
+    def is_crypto(self, coin_id):
+        """Checks whether a coin is a crypto(True) or a fiat coin(False).
+        """
+        return self.coin_types.is_crypto(coin_id)
+
+    def get_exch_by_pair(self, coin, base_coin, logger):
+        """Gets the exchanges that trade a given pair (in any direction).
+        """
+        exchs = self.exch_by_pair.get((coin, base_coin), set())
+        logger.debug("get_exch_by_pair: Returned '{}'exchanges that "
+                     "trade '{}-{}'".format(len(exchs), coin, base_coin))
+        return set(exchs)
+
+    def get_exch_by_traded_coin(self, coin):
+        """Gets the exchanges that have any pair with 'coin'.
+        """
+        return set(self.exch_by_traded_coin.get(coin, set()))
+
+    def get_exch_by_coin(self, coin):
+        """Gets the exchanges that allows deposit or withdrawal of 'coin'.
+        """
+        return set(self.exch_by_coin.get(coin, set()))
+
+    def get_trade_fees(self, exchange):
+        """Gets all the trading fees of 'exchange'.
+        """
+        return self.trade_fees.get(exchange, [])
+
+    def get_trade_fee_resolver(self, exchange, cep_promo, special_fee,
+                               default_fee):
+        """Returns the 'TradeFeeResolver' of 'exchange' for the given fee
+        settings (compiled the first time it is requested).
+        """
+        key = (exchange, cep_promo, special_fee, default_fee)
+        resolver = self.trade_fee_resolvers.get(key)
+        if resolver is None:
+            resolver = TradeFeeResolver(self.get_trade_fees(exchange),
+                                        cep_promo, special_fee, default_fee)
+            self.trade_fee_resolvers[key] = resolver
+        return resolver
+
+    def get_coinZs(self, exchange, coin):
+        """Gets all the coins that trade in 'exchange' against 'coin'.
+        Returns a set: {(<coinZ_1>,<liq_1>),(<coinZ_2>,<liq_2>),...}
+        """
+        return set(self.get_adjacent_coins(exchange, coin).items())
+
+    def get_adjacent_coins(self, exchange, coin):
+        """Gets the coins that trade in 'exchange' against 'coin'.
+        Returns the index itself (do not modify it): {<coinZ>: <liq>, ...}
+        """
+        return self.adjacency.get(exchange, {}).get(coin, {})
+
+    def get_ranked_coinZs(self, exchange, coin):
+        """Gets the coins that trade in 'exchange' against 'coin', by
+        liquidity (highest first; BTC first among equals, then by id).
+        Returns a list: [(<coinZ_1>, <liq_1>), (<coinZ_2>, <liq_2>), ...]
+        """
+        key = (exchange, coin)
+        ranked = self.ranked_coinZs.get(key)
+        if ranked is None:
+            ranked = sorted(self.get_adjacent_coins(exchange, coin).items(),
+                            key=lambda item: (-(item[1] or 0),
+                                              item[0] != 'btc-bitcoin',
+                                              item[0]))
+            self.ranked_coinZs[key] = ranked
+        return ranked
+
+    def get_best_bridge(self, exchange, coin, base_coin):
+        """Finds the coin that trades in 'exchange' against both 'coin' and
+        'base_coin' with the highest liquidity (the lowest of both pairs).
+        Among equals, BTC prevails (and then the lowest id).
+        Returns a tuple: (<coinZ>, <liq_vs_coin>, <liq_vs_base_coin>) or
+        None if there is no such coin.
+        """
+        key = (exchange, coin, base_coin)
+        if key in self.best_bridges:
+            return self.best_bridges[key]
+        base_coinZs = self.get_adjacent_coins(exchange, base_coin)
+        best = None
+        best_rank = None
+        for coinZ, liq in self.get_ranked_coinZs(exchange, coin):
+            # Coins left can not have higher liquidity than the best one
+            if best and (liq or 0) < best_rank[0]:
+                break
+            if coinZ not in base_coinZs:
+                continue
+            liq_base = base_coinZs[coinZ]
+            rank = (min(liq or 0, liq_base or 0), coinZ == 'btc-bitcoin')
+            if (not best or rank > best_rank or
+                    (rank == best_rank and coinZ < best[0])):
+                best = (coinZ, liq, liq_base)
+                best_rank = rank
+        self.best_bridges[key] = best
+        return best
+
+    def get_bridge_coins(self, exchange, coin):
+        """Same as 'get_adjacent_coins()', but only with the coins that can
+        be used as intermediate coin in two-hop paths (see 'coin_types').
+        """
+        return self.bridges.get(exchange, {}).get(coin, {})
+
+    def get_fee(self, action, exchange, coin):
+        """Gets the active deposit or withdrawal 'Fee' of 'exchange'/'coin'
+        (None if not found).
+        """
+        return self.fees.get((exchange, action, coin))
+
+    def calc_fee(self, action, exchange, coin, amt, logger):
+        """Gets the deposit or withdrawal fee of 'exchange'/'coin'.
+        Returns: [<fee_amt>, <fee_details>]
+        """
+        fee = self.get_fee(action, exchange, coin.id)
+        return apply_fee(fee, coin, amt, self.get_coin, self.fx_exchange,
+                         logger)
+
+    def get_fx_rate(self, orig_coin, dest_coin):
+        """Returns the FX rate to convert 'orig_coin' into 'dest_coin', using
+        the same triangulation rules as 'utils_db.fx_exchange'.
+        Returns None if the rate can not be calculated.
+        """
+        return self.fx.get_rate(orig_coin, dest_coin)
+
+    def fx_exchange(self, orig_coin, dest_coin, amount, logger):
+        """Converts 'amount' of 'orig_coin' into 'dest_coin'.
+        Same interface as 'utils_db.fx_exchange'.
+        """
+        if amount is None:
+            logger.warning("fx_exchange: FX could not be calculated for '{}"
+                           "-{}' (amount=None)".format(orig_coin, dest_coin))
+            return None
+        if orig_coin == dest_coin:
+            return amount
+        rate = self.get_fx_rate(orig_coin, dest_coin)
+        if rate is None:
+            logger.warning("fx_exchange: FX could not be calculated for '{}"
+                           "/{}'".format(orig_coin, dest_coin))
+            return None
+        return round(rate * amount, 8)
+
+
+""" ***********************************************************************
+***************************************************************************
+SNAPSHOT MANAGING FUNCTIONS
+***************************************************************************
+*********************************************************************** """
+
+"""Current snapshot and lock that guards its replacement.
+"""
+_snapshot = None
+_snapshot_version = 0
+_snapshot_lock = Lock()
+
+
+def load_snapshot(version):
+    """Reads the market tables and returns a new 'MarketSnapshot'.
+    """
+    coins = [CoinRecord(c.id, c.symbol, c.long_name, c.url_name, c.ranking,
+                        c.local_fn, c.type, c.status)
+             for c in Coin.query.all()]
+    exchanges = [ExchangeRecord(e.id, e.name, e.type, e.img_fn, e.site_url,
+                                e.affiliate, e.language, e.status)
+                 for e in Exchange.query.all()]
+    fees = [FeeRecord(f.exchange, f.action, f.scope, f.amount, f.min_amount,
+                      f.fee_coin, f.type, f.status)
+            for f in Fee.query.all()]
+    pairs = TradePair.query.all()
+    # Prices published by 'update_prices' are read from the shared table
+    price_table = get_price_table()
+    prices = price_table.records() if price_table else Price.query.all()
+    return MarketSnapshot(version, coins, exchanges, fees, pairs, prices)
+
+
+def refresh_snapshot(logger=None):
+    """Rebuilds the market snapshot. To be called whenever the market tables
+    are modified ('update_prices', 'update_pairs', admin edits...).
+    The new snapshot replaces the old one at once, so searches in progress
+    keep working with the snapshot they started with.
+    """
+    with _snapshot_lock:
+        snapshot = _replace_snapshot()
+    if logger:
+        logger.info("refresh_snapshot: {} loaded".format(snapshot))
+    return snapshot
+
+
+def get_snapshot():
+    """Returns the current market snapshot, building it if needed.
+    """
+    snapshot = _snapshot
+    if snapshot is None or snapshot.is_stale():
+        with _snapshot_lock:
+            # Another thread may have rebuilt it while waiting for the lock
+            if _snapshot is snapshot:
+                _replace_snapshot()
+            snapshot = _snapshot
+    return snapshot
+
+
+def _replace_snapshot():
+    """Loads a new snapshot and makes it the current one.
+    Must be called holding '_snapshot_lock'.
+    """
+    global _snapshot, _snapshot_version
+    _snapshot_version += 1
+    _snapshot = load_snapshot(_snapshot_version)
+    return _snapshot
@@ -145,6 +145,11 @@ class QueryRegister(db.Model):
     results = db.Column(db.Integer)
     start_time = db.Column(db.DateTime)
     finish_time = db.Column(db.DateTime)
+    # Search profile (existing databases: run 'migrate_query_register.py')
+    duration = db.Column(db.Float)
+    sections = db.Column(db.String(200))
+    candidates = db.Column(db.String(100))
+    cache_hit = db.Column(db.Boolean)
 
     def __repr__(self):
         return ("QueryRegister([{}] id={}, results={})".format(self.session_id,
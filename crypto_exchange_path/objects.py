@@ -1,40 +1,78 @@
 from secrets import token_hex
 from flask import Markup
 from crypto_exchange_path.config import Params
-from crypto_exchange_path.utils_db import calc_fee, fx_exchange
+from crypto_exchange_path.market_snapshot import get_snapshot
 from crypto_exchange_path.utils import (num_2_str, round_amount, str_2_float,
                                         round_amount_by_price,
                                         round_amount_by_price_str, is_number)
 
 
 class Path:
+    """Result of the path calculation. Only 'total_fees' is calculated when
+    created; the fee literals are formatted by the templates on demand.
+    """
+    __slots__ = ['id', 'type', 'origin', 'hops', 'hop_1', 'hop_2',
+                 'destination', 'currency', 'logger', 'snapshot',
+                 'total_fees']
 
-    def __init__(self, path_type, origin,
-                 hop_1, hop_2,
-                 destination, currency, logger):
+    def __init__(self, path_type, origin, hops,
+                 destination, currency, logger, snapshot=None):
         self.id = 'a' + token_hex(4)
         self.type = path_type
         self.origin = origin
-        self.hop_1 = hop_1
-        self.hop_2 = hop_2
+        self.hops = hops
+        # First two hops kept apart for the templates (paths of up to 2 hops)
+        self.hop_1 = hops[0]
+        self.hop_2 = hops[1] if len(hops) > 1 else None
         self.destination = destination
         self.currency = currency
         self.logger = logger
+        self.snapshot = snapshot if snapshot else get_snapshot()
         self.total_fees = self.calc_fees(currency, logger)
 
     def __repr__(self):
-        return "Result(Type='{}', Origin='{}', Hop_1='{}', Hop_2='{}', "\
+        return "Result(Type='{}', Origin='{}', Hops='{}', "\
                "Destination='{}')".format(self.type,
                                           self.origin,
-                                          self.hop_1,
-                                          self.hop_2,
+                                          self.hops,
                                           self.destination)
 
     def get_total_fees(self, currency):
         return num_2_str(self.total_fees, currency)
 
+    def as_dict(self):
+        """Returns the figures of the path (amounts and fees of each step, in
+        the coin they are paid) as a JSON serialisable dictionary (used by
+        the streaming search and the API).
+        """
+        return {'id': self.id,
+                'type': self.type,
+                'total_fees': self.total_fees,
+                'total_fees_str': self.get_total_fees(self.currency),
+                'currency': self.currency,
+                'origin': {'exchange': self.origin.exchange.id,
+                           'coin': self.origin.coin.id,
+                           'amount': self.origin.amount,
+                           'withdraw_fee': self.origin.withdraw_fee},
+                'hops': [{'exchange': hop.exchange.id,
+                          'deposit_fee': hop.deposit_fee,
+                          'sell_coin': hop.trade.sell_coin.id,
+                          'sell_amt': hop.trade.sell_amt,
+                          'buy_coin': hop.trade.buy_coin.id,
+                          'buy_amt': hop.trade.buy_amt,
+                          'fee_coin': hop.trade.fee_coin.id,
+                          'fee_amt': hop.trade.fee_amt,
+                          'withdraw_fee': hop.withdraw_fee}
+                         for hop in self.hops],
+                'destination': {'exchange': self.destination.exchange.id,
+                                'coin': self.destination.coin.id,
+                                'amount': self.destination.amount,
+                                'amount_str': self.destination.amount_str,
+                                'deposit_fee': self.destination.deposit_fee}}
+
     def fee_to_currency(self, amount, orig_coin):
-        fee_curr = fx_exchange(orig_coin, self.currency, amount, self.logger)
+        fee_curr = self.snapshot.fx_exchange(orig_coin, self.currency,
+                                             amount, self.logger)
         return num_2_str(fee_curr, self.currency)
 
     def calc_transfer_fees(self, fee_lst, coin, to_curr=False):
@@ -49,10 +87,10 @@ class Path:
             fee_sum = round(fee_sum)
         if fee_sum is not None:
             if to_curr:
-                fee_sum = fx_exchange(coin.id,
-                                      self.currency,
-                                      fee_sum,
-                                      self.logger)
+                fee_sum = self.snapshot.fx_exchange(coin.id,
+                                                    self.currency,
+                                                    fee_sum,
+                                                    self.logger)
                 return num_2_str(fee_sum, self.currency)
             else:
                 return "{} {}".format(fee_sum, coin.symbol)
@@ -62,132 +100,45 @@ class Path:
     def calc_fees(self, currency, logger):
         """Calculates the overall path fees in the given 'currency'. Adds up:
         - Origin Withdraw fees (origin.withdraw_fee)
-        - Hop 1 Deposit fees (hop_1.deposit_fee)
-        - Hop 1 Trade fees (hop_1.trade.fee_amt)
-        - Hop 1 Withdraw fees (hop_1.withdraw_fee)
-        - Hop 2 Deposit fees (hop_2.deposit_fee)
-        - Hop 2 Trade fees (hop_2.trade.fee_amt)
-        - Hop 2 Withdraw fees (hop_2.withdraw_fee)
+        - For each hop:
+            - Deposit fees (hop.deposit_fee)
+            - Trade fees (hop.trade.fee_amt)
+            - Withdraw fees (hop.withdraw_fee)
         - Destination Deposit fees (destination.deposit_fee)
         """
+        fees = [("origin.withdraw_fee",
+                 self.origin.withdraw_fee,
+                 self.origin.coin.id)]
+        for i, hop in enumerate(self.hops, 1):
+            fees.append(("hop_{}.deposit_fee".format(i),
+                         hop.deposit_fee,
+                         hop.trade.sell_coin.id))
+            fees.append(("hop_{}.trade.fee_amt".format(i),
+                         hop.trade.fee_amt,
+                         hop.trade.fee_coin.id))
+            fees.append(("hop_{}.withdraw_fee".format(i),
+                         hop.withdraw_fee,
+                         hop.trade.buy_coin.id))
+        fees.append(("destination.deposit_fee",
+                     self.destination.deposit_fee,
+                     self.destination.coin.id))
+        fees = [(name, amount, coin) for name, amount, coin in fees
+                if amount]
+        # All the fees are converted at once (see 'FxMatrix.convert_many')
+        converted = self.snapshot.fx.convert_many(
+            [coin for _, _, coin in fees], currency,
+            [amount for _, amount, _ in fees])
         total_fees = 0
-        # Add Origin Withdraw fees (origin.withdraw_fee)
-        if self.origin.withdraw_fee:
-            fee = fx_exchange(self.origin.coin.id,
-                              currency,
-                              self.origin.withdraw_fee,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("origin.withdraw_fee",
-                            self.origin.withdraw_fee,
-                            self.origin.coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Hop 1 Deposit fees (hop_1.deposit_fee)
-        if self.hop_1.deposit_fee:
-            fee = fx_exchange(self.hop_1.trade.sell_coin.id,
-                              currency,
-                              self.hop_1.deposit_fee,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("hop_1.deposit_fee",
-                            self.hop_1.deposit_fee,
-                            self.hop_1.trade.sell_coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Hop 1 Trade fees (hop_1.trade.fee_amt)
-        if self.hop_1.trade.fee_amt:
-            fee = fx_exchange(self.hop_1.trade.fee_coin.id,
-                              currency,
-                              self.hop_1.trade.fee_amt,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("hop_1.trade.fee_amt",
-                            self.hop_1.trade.fee_amt,
-                            self.hop_1.trade.fee_coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Add Hop 1 Withdraw fees (hop_1.withdraw_fee)
-        if self.hop_1.withdraw_fee:
-            fee = fx_exchange(self.hop_1.trade.buy_coin.id,
-                              currency,
-                              self.hop_1.withdraw_fee,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("hop_1.withdraw_fee",
-                            self.hop_1.withdraw_fee,
-                            self.hop_1.trade.buy_coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Add Hop 2 Deposit fees (hop_2.deposit_fee)
-        if self.hop_2 and self.hop_2.deposit_fee:
-            fee = fx_exchange(self.hop_2.trade.sell_coin.id,
-                              currency,
-                              self.hop_2.deposit_fee,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("hop_2.deposit_fee",
-                            self.hop_2.deposit_fee,
-                            self.hop_2.trade.sell_coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Add Hop 2 Trade fees (hop_2.trade.fee_amt)
-        if self.hop_2 and self.hop_2.trade.fee_amt:
-            fee = fx_exchange(self.hop_2.trade.fee_coin.id,
-                              currency,
-                              self.hop_2.trade.fee_amt,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("hop_2.trade.fee_amt",
-                            self.hop_2.trade.fee_amt,
-                            self.hop_2.trade.fee_coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Add Hop 2 Withdraw fees (hop_2.withdraw_fee)
-        if self.hop_2 and self.hop_2.withdraw_fee:
-            fee = fx_exchange(self.hop_2.trade.buy_coin.id,
-                              currency,
-                              self.hop_2.withdraw_fee,
-                              logger)
-            if fee:
+        for (name, amount, coin), fee in zip(fees, converted):
+            if fee is None:
+                logger.warning("fx_exchange: FX could not be calculated for"
+                               " '{}/{}'".format(coin, currency))
+            elif fee:
                 total_fees += fee
                 msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("hop_2.withdraw_fee",
-                            self.hop_2.withdraw_fee,
-                            self.hop_2.trade.buy_coin.id,
-                            fee,
-                            currency)
-                logger.debug(msg)
-        # Add Destination Deposit fees (destination.deposit_fee)
-        if self.destination.deposit_fee:
-            fee = fx_exchange(self.destination.coin.id,
-                              currency,
-                              self.destination.deposit_fee,
-                              logger)
-            if fee:
-                total_fees += fee
-                msg = "calc_fees: {} = {} {} ({} {})"\
-                    .format("destination.deposit_fee",
-                            self.destination.deposit_fee,
-                            self.destination.coin.id,
+                    .format(name,
+                            amount,
+                            coin,
                             fee,
                             currency)
                 logger.debug(msg)
@@ -195,43 +146,66 @@ class Path:
 
 
 class Location:
+    """Origin or destination of a path. Fees are calculated when created,
+    while their literals ('amount_str', 'deposit_details'...) are only
+    formatted when accessed (usually by the templates).
+    """
+    __slots__ = ['type', 'exchange', 'amount', 'coin', 'deposit_fee',
+                 'deposit_fee_array', 'withdraw_fee', 'withdraw_fee_array',
+                 'snapshot', 'logger']
 
-    def __init__(self, type, exchange, amount, coin, logger):
+    def __init__(self, type, exchange, amount, coin, logger, snapshot=None):
         self.type = type
         self.exchange = exchange
         self.amount = amount
         self.coin = coin
         self.deposit_fee = None
-        self.deposit_details = None
+        self.deposit_fee_array = None
         self.withdraw_fee = None
-        self.withdraw_details = None
-        self.amount_str = self.calc_amt_str()
+        self.withdraw_fee_array = None
+        self.snapshot = snapshot if snapshot else get_snapshot()
         self.logger = logger
         self.store_fee('Deposit', exchange.id, coin, amount)
         self.store_fee('Withdrawal', exchange.id, coin, amount)
 
+    @property
+    def amount_str(self):
+        return self.calc_amt_str()
+
+    @property
+    def deposit_details(self):
+        # No details at all if deposit fees were removed
+        if self.deposit_fee_array is None:
+            return None
+        return self.calc_fee_details('Deposit', self.deposit_fee_array)
+
+    @property
+    def withdraw_details(self):
+        return self.calc_fee_details('Withdrawal', self.withdraw_fee_array)
+
     def calc_amt_str(self):
-        amount = round_amount_by_price_str(self.amount, self.coin)
+        amount = round_amount_by_price_str(self.amount, self.coin,
+                                           self.snapshot)
         return "{} {}".format(amount, self.coin.symbol)
 
     def store_fee(self, action, exchange, coin, amount):
         """ Stores the deposit or withdrawal fee.
         """
-        fee_array = calc_fee(action, exchange, coin, amount, self.logger)
+        fee_array = self.snapshot.calc_fee(action, exchange, coin, amount,
+                                           self.logger)
         if action == 'Deposit':
             self.deposit_fee = fee_array[0]
-            self.deposit_details = self.calc_fee_details(action, fee_array)
+            self.deposit_fee_array = fee_array
             # If there are deposit fees for 'Destination', substract from amt
             if self.type == 'Destination' and self.deposit_fee:
                 self.amount -= self.deposit_fee
-                self.amount_str = self.calc_amt_str()
         if action == 'Withdrawal':
             self.withdraw_fee = fee_array[0]
-            self.withdraw_details = self.calc_fee_details(action, fee_array)
+            self.withdraw_fee_array = fee_array
 
     def remove_deposit_fees(self):
         self.deposit_fee = None
-        self.deposit_details = None
+        self.deposit_fee_array = None
 
     def calc_fee_details(self, action, fee_lit):
         if fee_lit and fee_lit[1] is not None:
@@ -255,19 +229,40 @@ class Location:
 
 
 class Hop:
+    """Trade done in an exchange, with the fees to deposit the sold coin and
+    to withdraw the bought one. As in 'Location', literals are formatted
+    only when accessed.
+    """
+    __slots__ = ['exchange', 'trade', 'deposit_fee', 'deposit_fee_array',
+                 'withdraw_fee', 'withdraw_fee_array', 'snapshot']
 
-    def __init__(self, exchange, trade, deposit_fee, withdraw_fee):
+    def __init__(self, exchange, trade, deposit_fee, withdraw_fee,
+                 snapshot=None):
         self.exchange = exchange
-        self.exch_promo = self.get_exch_promo(exchange)
         self.trade = trade
         self.deposit_fee = None
+        self.deposit_fee_array = deposit_fee
         self.withdraw_fee = None
-        self.trade_details = self.calc_trade_details()
-        self.deposit_details = self.calc_fee_details('Deposit', deposit_fee)
-        self.withdraw_details = self.calc_fee_details('Withdrawal',
-                                                      withdraw_fee)
+        self.withdraw_fee_array = withdraw_fee
+        self.snapshot = snapshot if snapshot else get_snapshot()
         self.store_fees(deposit_fee, withdraw_fee)
 
+    @property
+    def exch_promo(self):
+        return self.get_exch_promo(self.exchange)
+
+    @property
+    def trade_details(self):
+        return self.calc_trade_details()
+
+    @property
+    def deposit_details(self):
+        return self.calc_fee_details('Deposit', self.deposit_fee_array)
+
+    @property
+    def withdraw_details(self):
+        return self.calc_fee_details('Withdrawal', self.withdraw_fee_array)
+
     def get_exch_promo(self, exchange):
         """Checks whether the exchange has a user promo, in which case adds
         the promo text. Otherwise it returns None.
@@ -280,7 +275,8 @@ class Hop:
     def store_fees(self, deposit_fee, withdraw_fee):
         if deposit_fee and deposit_fee[0] is not None:
             rounded_fee = round_amount_by_price(deposit_fee[0],
-                                                self.trade.sell_coin.symbol)
+                                                self.trade.sell_coin.symbol,
+                                                self.snapshot)
             # Ensure that it is stored as a float
             if is_number(rounded_fee):
                 self.deposit_fee = rounded_fee
@@ -288,7 +284,8 @@ class Hop:
                 self.deposit_fee = str_2_float(rounded_fee)
         if withdraw_fee and withdraw_fee[0] is not None:
             rounded_fee = round_amount_by_price(withdraw_fee[0],
-                                                self.trade.buy_coin.symbol)
+                                                self.trade.buy_coin.symbol,
+                                                self.snapshot)
             # Ensure that it is stored as a float
             if is_number(rounded_fee):
                 self.withdraw_fee = rounded_fee
@@ -328,10 +325,15 @@ class Hop:
 
 
 class Trade:
+    """Numeric result of a trade. It is created for every candidate route,
+    so the amount literals are only formatted when accessed.
+    """
+    __slots__ = ['sell_amt', 'sell_coin', 'buy_amt', 'buy_coin', 'fee_amt',
+                 'fee_coin', 'fee_literal', 'snapshot']
 
     def __init__(self, sell_amt, sell_coin,
                  buy_amt, buy_coin,
-                 fee_amt, fee_coin, fee_literal):
+                 fee_amt, fee_coin, fee_literal, snapshot=None):
         self.sell_amt = sell_amt
         self.sell_coin = sell_coin
         self.buy_amt = buy_amt
@@ -339,15 +341,22 @@ class Trade:
         self.fee_amt = fee_amt
         self.fee_coin = fee_coin
         self.fee_literal = fee_literal
-        self.sell_amt_str = self.calc_amt_str(self.sell_amt,
-                                              self.sell_coin)
-        self.buy_amt_str = self.calc_amt_str(self.buy_amt,
-                                             self.buy_coin)
-        self.fee_amt_str = self.calc_amt_str(self.fee_amt,
-                                             self.fee_coin)
+        self.snapshot = snapshot if snapshot else get_snapshot()
+
+    @property
+    def sell_amt_str(self):
+        return self.calc_amt_str(self.sell_amt, self.sell_coin)
+
+    @property
+    def buy_amt_str(self):
+        return self.calc_amt_str(self.buy_amt, self.buy_coin)
+
+    @property
+    def fee_amt_str(self):
+        return self.calc_amt_str(self.fee_amt, self.fee_coin)
 
     def calc_amt_str(self, amt, coin):
-        amount = round_amount_by_price_str(amt, coin)
+        amount = round_amount_by_price_str(amt, coin, self.snapshot)
         return "{} {}".format(amount, coin.symbol)
 
     def __repr__(self):
@@ -0,0 +1,92 @@
+import time
+from threading import Lock
+from collections import OrderedDict
+
+""" ***********************************************************************
+***************************************************************************
+PATH CACHE
+***************************************************************************
+*********************************************************************** """
+
+"""Maximum number of searches kept in the cache and seconds they are valid.
+"""
+PATH_CACHE_SIZE = 1000
+PATH_CACHE_TTL = 10 * 60
+
+
+class PathCache(object):
+    """Bounded LRU cache of search results. Entries also expire after 'ttl'
+    seconds and all of them are dropped at once as soon as a search is done
+    with a new market data 'version' (see 'MarketSnapshot').
+    """
+
+    def __init__(self, size=PATH_CACHE_SIZE, ttl=PATH_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def __repr__(self):
+        return ("PathCache(v{}: {} entries, {} hits, {} misses)"
+                .format(self.version, len(self.entries), self.hits,
+                        self.misses))
+
+    def get(self, key, version):
+        """Returns the value stored for 'key' (None if not found).
+        """
+        with self.lock:
+            self.check_version(version)
+            entry = self.entries.get(key)
+            if entry and time.time() - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        """Stores 'value' for 'key', evicting the least recently used entry
+        if the cache is full. Values of an old 'version' are not stored.
+        """
+        with self.lock:
+            self.check_version(version)
+            if version != self.version:
+                return
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def check_version(self, version):
+        """Drops all the entries if 'version' is newer than the cached one.
+        Must be called holding 'lock'.
+        """
+        if self.version is None or version > self.version:
+            self.entries.clear()
+            self.version = version
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self):
+        """Returns the cache counters as a dictionary.
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {'version': self.version,
+                    'entries': len(self.entries),
+                    'size': self.size,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_ratio': round(self.hits / total, 4) if total else 0}
+
+
+"""Cache shared by all the requests of the process.
+"""
+path_cache = PathCache()
@@ -1,386 +1,296 @@
-from crypto_exchange_path.utils_db import (get_exch_by_pair, get_exch_by_coin,
-                                           get_coin, get_exchange,
-                                           calc_fee)
-from crypto_exchange_path.exchange_manager import ExchangeManager
+from crypto_exchange_path.market_snapshot import get_snapshot
+from crypto_exchange_path.route_engine import RouteEngine
+from crypto_exchange_path import route_batch, route_pool
+from crypto_exchange_path.path_cache import path_cache
 from crypto_exchange_path.objects import Location, Hop, Path
+from crypto_exchange_path.query_stats import sql_section
+from crypto_exchange_path.search_register import SearchProfile
 
 
 def calc_paths(orig_loc, orig_coin, orig_amt, dest_loc, dest_coin,
-               currency, fee_settings, logger):
+               currency, fee_settings, logger, snapshot=None,
+               max_hops=2, max_labels=None, top_k=None, vectorised=False,
+               workers=None, profile=None):
+    """Calculates the paths to convert 'orig_amt' of 'orig_coin' located in
+    'orig_loc' into 'dest_coin' located in 'dest_loc'.
+    'max_hops' bounds the connections of the paths: 0 (direct trades only),
+    1 (up to two trades in the same exchange), 2 (up to two trades in
+    different exchanges)... 'max_labels' enables dominance pruning for deep
+    searches (see 'RouteEngine').
+    If 'top_k' is given, only the 'top_k' paths with the lowest fees are
+    returned (sorted by fees), and 'Path' objects are only built for them.
+    If 'vectorised' (and 'top_k' is given), all the candidate routes are
+    evaluated at once with NumPy (see 'RouteBatch'). Without NumPy or
+    'top_k', the scalar search is used. Note the scalar 'top_k' search
+    stops expanding routes that can not be among the best ones, so it is
+    usually faster (see 'benchmarks.calc_paths_suite --vectorised').
+    Otherwise, big searches are split across 'workers' processes
+    (default: 'route_pool.PATH_WORKERS', see 'ParallelRouteEngine').
+    Timings and candidates of the search are added to 'profile' (see
+    'SearchProfile').
+    """
 
     # Paths container
     path_list = []
-
-    """ ***********************************************************************
-    ***************************************************************************
-    1. DIRECT EXCHANGE(NO HOPS)
-    ***************************************************************************
-    *********************************************************************** """
+    if not profile:
+        profile = SearchProfile()
+    # Market data used for the whole calculation (no DB queries from here on)
+    if not snapshot:
+        with sql_section('calc_paths|snapshot'), profile.section('snapshot'):
+            snapshot = get_snapshot()
 
     logger.info("\n\nSTARTING CALCULATION FOR: \norig_amt = {}\n"
                 "orig_coin = {}\norig_loc = {}\ndest_coin = {}\ndest_loc = {}"
-                "\ncurrency = {}\nfee_settings = {}"
+                "\ncurrency = {}\nfee_settings = {}\nmax_hops = {}"
+                "\ntop_k = {}\nsnapshot = {}"
                 .format(orig_amt, orig_coin, orig_loc, dest_coin, dest_loc,
-                        currency.id, fee_settings))
+                        currency.id, fee_settings, max_hops, top_k,
+                        snapshot))
 
-    logger.info("Main: CALCULATING '1. DIRECT EXCHANGE(NO HOPS)'")
-    # Get exchanges with direct pair exchange
-    direct_pair_exch = get_exch_by_pair(orig_coin.id,
-                                        dest_coin.id,
-                                        logger)
-    # Get exchanges that allow deposits of 'orig_coin'
-    exchs_allow_deposits = get_exch_by_coin(orig_coin.id)
     # Common parts of 'Path'
-    path_type = 0
-    origin = Location("Origin", orig_loc, orig_amt, orig_coin, logger)
-    # Loop for each exchange to calculate Path fees
-    for exch in direct_pair_exch:
-        # First, check if the exchange allows deposits
-        if exch not in exchs_allow_deposits:
-            continue
-        # If allows deposits, perform trade
-        trade_1_sell_amt = orig_amt
-        if origin.withdraw_fee:
-            trade_1_sell_amt -= origin.withdraw_fee
-        # Calc deposit fee 1 and substract it from sell amount
-        deposit_fee_1 = [None, None]
-        if exch != origin.exchange.id:
-            deposit_fee_1 = calc_fee('Deposit', exch, orig_coin,
-                                     trade_1_sell_amt, logger)
-            if deposit_fee_1 and deposit_fee_1[0] is not None:
-                trade_1_sell_amt -= deposit_fee_1[0]
-        # Perform Trade 1
-        exchange_1 = ExchangeManager(get_exchange(exch), fee_settings, logger)
-        trade_1 = exchange_1.perform_trade(trade_1_sell_amt,
-                                           orig_coin,
-                                           dest_coin)
-        # If 'perform_trade()' did not get results, skip path. Else continue
-        if not trade_1:
-            logger.warning("Main: Trade could not be performed for {}/{}[{}]. "
-                           "Path skipped.".format(orig_coin.id,
-                                                  dest_coin.id,
-                                                  exch))
-            continue
-        # Calc destination amount
-        dest_amt = trade_1.buy_amt
-        # Calc Withdraw fee and modify destination amount
-        withdraw_fee_1 = []
-        if exch != dest_loc.id:
-            withdraw_fee_1 = calc_fee('Withdrawal', exch, trade_1.buy_coin,
-                                      trade_1.buy_amt, logger)
-            if withdraw_fee_1 and withdraw_fee_1[0] is not None:
-                dest_amt -= withdraw_fee_1[0]
-                if dest_amt < 0:
-                    logger.warning("Main: Destination amount "
-                                   "lower than 0 for {} [{}]. "
-                                   " Path skipped."
-                                   .format(exch,
-                                           trade_1.buy_coin.id))
-                    continue
-            else:
-                logger.warning("Main: Withdraw Fee not found for {} [{}]. "
-                               "Path skipped.".format(exch,
-                                                      trade_1.buy_coin.id))
-                continue
-        # Generate Hop & destination location to finish 'Path'
-        hop_1 = Hop(get_exchange(exch),
-                    trade_1,
-                    deposit_fee_1,
-                    withdraw_fee_1)
-        destination = Location("Destination", dest_loc, dest_amt,
-                               dest_coin, logger)
-        if destination.exchange.id == exch:
-            destination.remove_deposit_fees()
-        # Generate 'Path' and add to 'path_list'
-        path = Path(path_type, origin, hop_1, None,
-                    destination, currency.id, logger)
-        path_list.append(path)
-        logger.debug(('Path Found: {}->{}({})').format(trade_1.sell_coin.id,
-                                                       trade_1.buy_coin.id,
-                                                       exch))
-    logger.info("End of '1. DIRECT EXCHANGE(NO HOPS)'")
-
-    """ ***********************************************************************
-    ***************************************************************************
-    2. INDIRECT EXCHANGE(ONE HOP)
-    ***************************************************************************
-    *********************************************************************** """
-    logger.info("Main: CALCULATING '2. INDIRECT EXCHANGE(ONE HOP)'")
-    # Get exchanges with indirect pair exchange
-    orig_coin_exchanges = get_exch_by_coin(orig_coin.id)
-    dest_coin_exchanges = get_exch_by_coin(dest_coin.id)
-    # Filter exchanges already used - Filter 'orig_coin_exchanges'
-    filtered_exch = set()
-    for exch in orig_coin_exchanges:
-        if exch not in direct_pair_exch:
-            filtered_exch.add(exch)
-    orig_coin_exchanges = filtered_exch
-    logger.debug("Main: 'orig_coin_exchanges' filtered: {}"
-                 .format(orig_coin_exchanges))
-    # Filter exchanges already used - Filter 'dest_coin_exchanges'
-    filtered_exch = set()
-    for exch in dest_coin_exchanges:
-        if exch not in direct_pair_exch:
-            filtered_exch.add(exch)
-    dest_coin_exchanges = filtered_exch
-    logger.debug("Main: 'dest_coin_exchanges' filtered: {}"
-                 .format(dest_coin_exchanges))
-    # Select exchanges that trade both coins, but not with a direct trade
-    indirect_pair_exch = [exch for exch in orig_coin_exchanges
-                          if exch in dest_coin_exchanges]
-    logger.debug("Exchanges with both pairs (but not direct trade) [{}]: {}"
-                 "".format(len(indirect_pair_exch), indirect_pair_exch))
-    # Common parts of 'Path'
-    path_type = 1
-    origin = Location("Origin", orig_loc, orig_amt, orig_coin, logger)
-    # Loop for each exchange with both pairs
-    for exch in indirect_pair_exch:
-        # Get CoinZ that trades against both pairs
-        exchange = ExchangeManager(get_exchange(exch), fee_settings, logger)
-        coinZ = exchange.get_best_coinZ(orig_coin.id,
-                                        dest_coin.id)
-        if not coinZ:
-            logger.warning("Main: No coinZ found in exchange '{}' to convert"
-                           "'{}' to '{}' Path skipped.".format(exch,
-                                                               orig_coin.id,
-                                                               dest_coin.id))
-            continue
-        # CALCULATE OUTPUTS FOR 'Hop 1'
-        trade_1_sell_amt = orig_amt
-        if origin.withdraw_fee:
-            trade_1_sell_amt -= origin.withdraw_fee
-        # Calc deposit fee 1 and substract it from sell amount
-        deposit_fee_1 = [None, None]
-        if exch != origin.exchange.id:
-            deposit_fee_1 = calc_fee('Deposit', exch, orig_coin,
-                                     trade_1_sell_amt, logger)
-            if deposit_fee_1 and deposit_fee_1[0] is not None:
-                trade_1_sell_amt -= deposit_fee_1[0]
-        # Perform Trade 1
-        trade_1 = exchange.perform_trade(trade_1_sell_amt,
-                                         orig_coin,
-                                         coinZ.coin)
-        # If 'perform_trade()' did not get results, skip path. Else continue
-        if not trade_1:
-            logger.warning("Main: Trade could not be performed for {}/{}[{}]. "
-                           "Path skipped.".format(orig_coin.id,
-                                                  coinZ.coin.id,
-                                                  exch))
-            continue
-        # Generate output object for 'Hop 1'
-        hop_1 = Hop(exchange.exchange,
-                    trade_1,
-                    deposit_fee_1,
-                    None)
-        # CALCULATE OUTPUTS FOR 'Hop 2'
-        trade_2 = exchange.perform_trade(trade_1.buy_amt,
-                                         trade_1.buy_coin,
-                                         dest_coin)
-        # If 'perform_trade()' did not get results, skip path. Else continue
-        if not trade_2:
-            logger.warning("Main: Trade could not be performed for {}/{}[{}]. "
-                           "Path skipped.".format(trade_1.buy_coin.id,
-                                                  dest_coin.id,
-                                                  exch))
-            continue
-        # Calc destination amount
-        dest_amt = trade_2.buy_amt
-        # Calc Withdraw fee and modify destination amount
-        withdraw_fee_2 = []
-        if exch != dest_loc.id:
-            withdraw_fee_2 = calc_fee('Withdrawal', exch, trade_2.buy_coin,
-                                      trade_2.buy_amt, logger)
-            if withdraw_fee_2 and withdraw_fee_2[0] is not None:
-                dest_amt -= withdraw_fee_2[0]
-            else:
-                logger.warning("Main: Withdraw Fee not found for {} [{}]. "
-                               "Path skipped.".format(exch,
-                                                      trade_2.buy_coin.id))
-                continue
-        # Generate Hop & destination location to finish 'Path'
-        deposit_fee_2 = [None, None]
-        hop_2 = Hop(exchange.exchange,
-                    trade_2,
-                    deposit_fee_2,
-                    withdraw_fee_2)
-        destination = Location("Destination", dest_loc, dest_amt,
-                               dest_coin, logger)
-        if destination.exchange.id == exch:
-            destination.remove_deposit_fees()
-        # Generate 'Path' and add to 'path_list'
-        path = Path(path_type, origin,
-                    hop_1, hop_2,
-                    destination, currency.id, logger)
-        path_list.append(path)
-        logger.debug('Path Found: {}->{}({})'
-                     ' --> {}->{}({})'.format(trade_1.sell_coin.id,
-                                              trade_1.buy_coin.id,
-                                              exch,
-                                              trade_2.sell_coin.id,
-                                              trade_2.buy_coin.id,
-                                              exch))
-    logger.info("End of '2. INDIRECT EXCHANGE(ONE HOP)'")
-
-    """ ***********************************************************************
-    ***************************************************************************
-    3. INDIRECT EXCHANGE(TWO HOPS)
-    ***************************************************************************
-    *********************************************************************** """
-    logger.info("Main: CALCULATING '3. INDIRECT EXCHANGE(TWO HOPS)'")
-    # Get all the coins that trade against 'orig_coin' for each exchange
-    orig_coin_exchanges_coinZs = []
-    for exch in orig_coin_exchanges:
-        exchange = ExchangeManager(get_exchange(exch), fee_settings, logger)
-        coinZs_A = exchange.get_all_cryptoZs(orig_coin.id)
-        exchange.coinZs = coinZs_A
-        orig_coin_exchanges_coinZs.append(exchange)
-        logger.debug("Pairs against [] {}: {}".format(exchange.exchange.id,
-                                                      orig_coin.id,
-                                                      exchange.coinZs))
-    # Get all the coins that trade against 'dest_coin' for each exchange
-    dest_coin_exchanges_coinZs = []
-    for exch in dest_coin_exchanges:
-        exchange = ExchangeManager(get_exchange(exch), fee_settings, logger)
-        coinZs_B = exchange.get_all_cryptoZs(dest_coin.id)
-        exchange.coinZs = coinZs_B
-        dest_coin_exchanges_coinZs.append(exchange)
-        logger.debug("Pairs against [] {}: {}".format(exchange.exchange.id,
-                                                      orig_coin.id,
-                                                      exchange.coinZs))
-    # Common parts of 'Path'
-    path_type = 2
-    origin = Location("Origin", orig_loc, orig_amt, orig_coin, logger)
-    # Loop through all the exchanges and coins
-    for exch_A in orig_coin_exchanges_coinZs:
-        for coinZ_A in exch_A.coinZs:
-            for exch_B in dest_coin_exchanges_coinZs:
-                if exch_A.exchange.id == exch_B.exchange.id:
-                    continue
-                for coinZ_B in exch_B.coinZs:
-                    # If coinZ_A==coinZ_B, calculate Exchange Path
-                    if coinZ_A[0] == coinZ_B[0]:
-                        # CALCULATE OUTPUTS FOR 'Hop 1'
-                        trade_1_sell_amt = orig_amt
-                        if origin.withdraw_fee:
-                            trade_1_sell_amt -= origin.withdraw_fee
-                        # Calc deposit fee 1 and substract it from sell amount
-                        deposit_fee_1 = [None, None]
-                        if exch_A.exchange.id != origin.exchange.id:
-                            deposit_fee_1 = calc_fee('Deposit',
-                                                     exch_A.exchange.id,
-                                                     orig_coin,
-                                                     trade_1_sell_amt,
-                                                     logger)
-                            if deposit_fee_1 and deposit_fee_1[0] is not None:
-                                trade_1_sell_amt -= deposit_fee_1[0]
-                        # Perform Trade 1
-                        trade_1 = exch_A.perform_trade(trade_1_sell_amt,
-                                                       orig_coin,
-                                                       get_coin(coinZ_A[0]))
-                        # If 'perform_trade()' did not get results, skip path
-                        if not trade_1:
-                            logger.warning("Main: Trade could not be performed"
-                                           " for {}/{}[{}]. Path skipped."
-                                           .format(orig_coin.id,
-                                                   coinZ_A[0],
-                                                   exch_A.exchange.id))
-                            continue
-                        # Calc destination amount
-                        in_amt_2 = trade_1.buy_amt
-                        # Calc Withdraw fee and modify destination amount
-                        withdraw_fee_1 = calc_fee('Withdrawal',
-                                                  exch_A.exchange.id,
-                                                  trade_1.buy_coin,
-                                                  trade_1.buy_amt,
-                                                  logger)
-                        if withdraw_fee_1 and withdraw_fee_1[0] is not None:
-                            in_amt_2 -= withdraw_fee_1[0]
-                        else:
-                            logger.warning("Main: Withdraw Fee not found for"
-                                           " {} [{}]. Path skipped."
-                                           .format(exch_A.exchange.id,
-                                                   trade_1.buy_coin.id))
-                            continue
-                        # Generate output object for 'Hop 1'
-                        hop_1 = Hop(exch_A.exchange,
-                                    trade_1,
-                                    deposit_fee_1,
-                                    withdraw_fee_1)
-                        # CALCULATE OUTPUTS FOR 'Hop 2'
-                        # Calc deposit fee 2 and substract it from sell amount
-                        deposit_fee_2 = calc_fee('Deposit',
-                                                 exch_B.exchange.id,
-                                                 trade_1.buy_coin,
-                                                 in_amt_2,
-                                                 logger)
-                        if deposit_fee_2 and deposit_fee_2[0] is not None:
-                            in_amt_2 -= deposit_fee_2[0]
-                        # Perform Trade 2
-                        trade_2 = exch_B.perform_trade(in_amt_2,
-                                                       trade_1.buy_coin,
-                                                       dest_coin)
-                        # If 'perform_trade()' did not get results, skip path
-                        if not trade_2:
-                            logger.warning("Main: Trade could not be performed"
-                                           " for {}/{}[{}]. Path skipped."
-                                           .format(trade_1.buy_coin.id,
-                                                   dest_coin.id,
-                                                   exch_B.exchange.id))
-                            continue
-                        # Calc destination amount
-                        dest_amt = trade_2.buy_amt
-                        # Calc Withdraw fee and modify destination amount
-                        withdraw_fee_2 = []
-                        if exch_B.exchange.id != dest_loc.id:
-                            withdraw_fee_2 = calc_fee('Withdrawal',
-                                                      exch_B.exchange.id,
-                                                      trade_2.buy_coin,
-                                                      trade_2.buy_amt,
-                                                      logger)
-                            if (withdraw_fee_2 and
-                                    withdraw_fee_2[0] is not None):
-                                dest_amt -= withdraw_fee_2[0]
-                                if dest_amt < 0:
-                                    logger.warning("Main: Destination amount "
-                                                   "lower than 0 for {} [{}]."
-                                                   " Path skipped."
-                                                   .format(exch_B.exchange.id,
-                                                           trade_2
-                                                           .buy_coin.id))
-                                    continue
-                            else:
-                                logger.warning("Main: Withdraw Fee not found "
-                                               "for {} [{}]. Path skipped."
-                                               .format(exch_B.exchange.id,
-                                                       trade_2.buy_coin.id))
-                                continue
-                        # Generate Hop & destination location to finish 'Path'
-                        hop_2 = Hop(exch_B.exchange,
-                                    trade_2,
-                                    deposit_fee_2,
-                                    withdraw_fee_2)
-                        destination = Location("Destination",
-                                               dest_loc,
-                                               dest_amt,
-                                               dest_coin,
-                                               logger)
-                        if destination.exchange.id == exch_B.exchange.id:
-                            destination.remove_deposit_fees()
-                        # Generate 'Path' and add to 'path_list'
-                        path = Path(path_type, origin,
-                                    hop_1, hop_2,
-                                    destination, currency.id, logger)
-                        path_list.append(path)
-                        logger.debug('Path Found: {}->{}({}) --> {}->{}({})'
-                                     .format(trade_1.sell_coin.id,
-                                             trade_1.buy_coin.id,
-                                             exch_A.exchange.id,
-                                             trade_2.sell_coin.id,
-                                             trade_2.buy_coin.id,
-                                             exch_B.exchange.id))
-    logger.info("End of '3. INDIRECT EXCHANGE(TWO HOPS)'")
+    origin = Location("Origin", orig_loc, orig_amt, orig_coin,
+                      logger, snapshot)
+    if vectorised and route_batch.np is None:
+        logger.warning("Main: NumPy not available. Using scalar search.")
+        vectorised = False
+    # Without 'top_k' all the candidates would be recalculated one by one
+    if vectorised and not top_k:
+        logger.warning("Main: Vectorised search needs 'top_k'. Using "
+                       "scalar search.")
+        vectorised = False
+    if vectorised:
+        engine = route_batch.RouteBatch(origin, dest_loc, dest_coin,
+                                        currency.id, fee_settings, logger,
+                                        snapshot, max_hops=max_hops)
+    else:
+        if workers is None:
+            workers = route_pool.PATH_WORKERS
+        engine = route_pool.ParallelRouteEngine(origin, dest_loc, dest_coin,
+                                                currency.id, fee_settings,
+                                                logger, snapshot,
+                                                max_hops=max_hops,
+                                                max_labels=max_labels,
+                                                workers=workers)
+    with sql_section('calc_paths|search'), profile.section('search'):
+        if top_k:
+            routes = engine.search_best(top_k)
+        else:
+            routes = engine.search()
+        for route in routes:
+            path = route_to_path(route, origin, dest_loc, dest_coin,
+                                 currency, logger, snapshot)
+            path_list.append(path)
+    profile.add_candidates(engine.found, engine.pruned)
+    profile.add_settle_times(engine.settle_times)
+    logger.info("Main: '{}' partial routes pruned".format(engine.pruned))
 
     # generate_paths_file(path_list, currency, logger)
     logger.info("Path calculation finished. '{}' results"
                 .format(len(path_list)))
     return path_list
+
+
+def iter_paths(orig_loc, orig_coin, orig_amt, dest_loc, dest_coin,
+               currency, fee_settings, logger, snapshot=None, max_hops=2,
+               profile=None):
+    """Generator version of 'calc_paths' that yields the 'Path's as they
+    are found: first the direct trades, then the paths with 1 connection,
+    then the ones with 2... Within each group, paths come roughly by fees.
+    There is one search: each group is yielded as soon as the search has
+    found all its paths (see 'RouteEngine.search_by_hops'), so the first
+    results do not wait for the deepest part of the search.
+    Timings and candidates of the search are added to 'profile'.
+    """
+    if not profile:
+        profile = SearchProfile()
+    if not snapshot:
+        with profile.section('snapshot'):
+            snapshot = get_snapshot()
+    origin = Location("Origin", orig_loc, orig_amt, orig_coin,
+                      logger, snapshot)
+    engine = RouteEngine(origin, dest_loc, dest_coin, currency.id,
+                         fee_settings, logger, snapshot, max_hops=max_hops)
+    routes = engine.search_by_hops()
+    while True:
+        # Time spent by the client between paths is not part of the search
+        with profile.section('search'):
+            route = next(routes, None)
+            if route is None:
+                break
+            path = route_to_path(route, origin, dest_loc, dest_coin,
+                                 currency, logger, snapshot)
+        yield path
+    profile.add_candidates(engine.found, engine.pruned)
+    profile.add_settle_times(engine.settle_times)
+
+
+def calc_paths_cached(orig_loc, orig_coin, orig_amt, dest_loc, dest_coin,
+                      currency, fee_settings, logger, snapshot=None,
+                      max_hops=2, max_labels=None, top_k=None,
+                      profile=None):
+    """Same as 'calc_paths', but searches with the same parameters done with
+    the same market data reuse the routes found in 'path_cache'.
+    The key includes the exact 'orig_amt': the routes feasible (and the
+    'top_k' best ones) depend on it, so they can not be shared by searches
+    of other amounts.
+    """
+    if not profile:
+        profile = SearchProfile()
+    if not snapshot:
+        with profile.section('snapshot'):
+            snapshot = get_snapshot()
+    key = (orig_loc.id, orig_coin.id, dest_loc.id, dest_coin.id,
+           currency.id, tuple(sorted(fee_settings.items())),
+           orig_amt, max_hops, max_labels, top_k)
+    route_keys = path_cache.get(key, snapshot.version)
+    if route_keys is None:
+        path_list = calc_paths(orig_loc, orig_coin, orig_amt, dest_loc,
+                               dest_coin, currency, fee_settings, logger,
+                               snapshot=snapshot, max_hops=max_hops,
+                               max_labels=max_labels, top_k=top_k,
+                               profile=profile)
+        path_cache.put(key, snapshot.version,
+                       [calc_path_key(path) for path in path_list])
+        return path_list
+    logger.info("Main: Cached search ({} routes). {}"
+                .format(len(route_keys), path_cache))
+    profile.cache_hit = True
+    with profile.section('cache'):
+        return follow_paths(route_keys, orig_loc, orig_coin, orig_amt,
+                            dest_loc, dest_coin, currency, fee_settings,
+                            logger, snapshot, max_hops=max_hops)
+
+
+def follow_paths(route_keys, orig_loc, orig_coin, orig_amt, dest_loc,
+                 dest_coin, currency, fee_settings, logger, snapshot=None,
+                 max_hops=2):
+    """Recalculates for 'orig_amt' the routes of 'route_keys' (see
+    'route_batch.route_key') found by a previous search.
+    Returns their 'Path's sorted by fees (routes that can not be done
+    anymore are skipped).
+    """
+    if not snapshot:
+        snapshot = get_snapshot()
+    origin = Location("Origin", orig_loc, orig_amt, orig_coin,
+                      logger, snapshot)
+    engine = RouteEngine(origin, dest_loc, dest_coin, currency.id,
+                         fee_settings, logger, snapshot, max_hops=max_hops)
+    routes = []
+    for route_key in route_keys:
+        legs = [(exch, [snapshot.get_coin(coin) for coin in coins])
+                for exch, coins in route_key]
+        # Coins or exchanges may have been removed since the search
+        if any(not snapshot.get_exchange(exch) or None in coins
+               for exch, coins in legs):
+            continue
+        route = engine.follow(legs)
+        if route:
+            routes.append(route)
+    routes.sort(key=lambda route: route.fees)
+    return [route_to_path(route, origin, dest_loc, dest_coin, currency,
+                          logger, snapshot)
+            for route in routes]
+
+
+def calc_paths_sweep(orig_loc, orig_coin, amounts, dest_loc, dest_coin,
+                     currency, fee_settings, logger, snapshot=None,
+                     max_hops=2, top_k=None):
+    """Calculates the fees of the paths of 'calc_paths' for each of
+    'amounts' of 'orig_coin'. Routes are enumerated once and all the amounts
+    are evaluated in one batch (see 'RouteBatch.sweep').
+    Returns: [<'FeeCurve's sorted by their lowest fees>,
+              <best 'Path' of each amount (None if there is no path)>]
+    If 'top_k' is given, only the routes among the 'top_k' best ones of any
+    amount get a 'FeeCurve'.
+    """
+    if not snapshot:
+        snapshot = get_snapshot()
+    logger.info("Main: Sweep of {} amounts of '{}' ({}) to '{}' ({})"
+                .format(len(amounts), orig_coin.id, orig_loc.id,
+                        dest_coin.id, dest_loc.id))
+    origins = [Location("Origin", orig_loc, amount, orig_coin, logger,
+                        snapshot)
+               for amount in amounts]
+    if route_batch.np is not None:
+        engine = route_batch.RouteBatch(origins[0], dest_loc, dest_coin,
+                                        currency.id, fee_settings, logger,
+                                        snapshot, max_hops=max_hops)
+        curves, routes = engine.sweep(origins, top_k)
+    else:
+        logger.warning("Main: NumPy not available. Sweeping with scalar "
+                       "search.")
+        curves, routes = sweep_scalar(origins, dest_loc, dest_coin,
+                                      currency, fee_settings, logger,
+                                      snapshot, max_hops, top_k)
+    best = [route_to_path(route, origin, dest_loc, dest_coin, currency,
+                          logger, snapshot) if route else None
+            for route, origin in zip(routes, origins)]
+    return [curves, best]
+
+
+def sweep_scalar(origins, dest_loc, dest_coin, currency, fee_settings,
+                 logger, snapshot, max_hops, top_k):
+    """Same results as 'RouteBatch.sweep', running the scalar 'RouteEngine'
+    once per amount.
+    """
+    curves = {}
+    ranked = set()
+    best = []
+    for i, origin in enumerate(origins):
+        engine = RouteEngine(origin, dest_loc, dest_coin, currency.id,
+                             fee_settings, logger, snapshot,
+                             max_hops=max_hops)
+        routes = sorted(engine.search(), key=lambda route: route.fees)
+        best.append(routes[0] if routes else None)
+        for j, route in enumerate(routes):
+            key = route_batch.route_key(route)
+            if key not in curves:
+                curves[key] = route_batch.FeeCurve(key, route.hops,
+                                                   [None] * len(origins))
+            curves[key].fees[i] = route.fees
+            if not top_k or j < top_k:
+                ranked.add(key)
+    curves = sorted([curves[key] for key in ranked],
+                    key=lambda curve: min(fee for fee in curve.fees
+                                          if fee is not None))
+    return [curves, best]
+
+
+def route_to_path(route, origin, dest_loc, dest_coin, currency, logger,
+                  snapshot):
+    """Generates the 'Path' object of a 'Route' found by 'RouteEngine'.
+    Each trade is a 'Hop': the first trade of each leg gets the deposit fee
+    of the leg and the last one its withdrawal fee.
+    """
+    hops = []
+    for leg in route.legs:
+        for i, trade in enumerate(leg.trades):
+            deposit_fee = leg.deposit_fee if i == 0 else [None, None]
+            withdraw_fee = None
+            if i == len(leg.trades) - 1:
+                withdraw_fee = leg.withdraw_fee
+            hops.append(Hop(leg.exchange,
+                            trade,
+                            deposit_fee,
+                            withdraw_fee,
+                            snapshot))
+    # Generate destination location to finish 'Path'
+    destination = Location("Destination", dest_loc, route.dest_amt,
+                           dest_coin, logger, snapshot)
+    if destination.exchange.id == route.legs[-1].exchange.id:
+        destination.remove_deposit_fees()
+    return Path(route.hops, origin, hops,
+                destination, currency.id, logger, snapshot)
+
+
+def calc_path_key(path):
+    """Returns the legs of 'path' in the format of 'route_batch.route_key'
+    (consecutive hops in the same exchange belong to the same leg).
+    """
+    legs = []
+    for hop in path.hops:
+        if legs and legs[-1][0] == hop.exchange.id:
+            legs[-1][1].append(hop.trade.buy_coin.id)
+        else:
+            legs.append((hop.exchange.id, [hop.trade.buy_coin.id]))
+    return tuple((exch, tuple(coins)) for exch, coins in legs)
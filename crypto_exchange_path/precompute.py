@@ -0,0 +1,217 @@
+import os
+import json
+import math
+import time
+import logging
+from threading import Lock
+from crypto_exchange_path import app
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.utils import round_big_number
+from crypto_exchange_path.market_snapshot import get_snapshot
+from crypto_exchange_path.path_calculator import (calc_paths, calc_path_key,
+                                                  follow_paths)
+from crypto_exchange_path import route_pool
+
+""" ***********************************************************************
+***************************************************************************
+PRECOMPUTED ROUTES
+***************************************************************************
+*********************************************************************** """
+
+"""File where the precomputed routes are stored and seconds they are valid
+(they are recalculated after every price update).
+"""
+PRECOMPUTED_ROUTES_FILE = os.path.join(app.instance_path,
+                                       'precomputed_routes.json')
+PRECOMPUTED_MAX_AGE = 3 * 60 * 60
+
+"""Amount (in USD) searched for each pair: the amount of the searches
+triggered by direct links to '/exchanges/search/<coinA>-to-<coinB>'.
+"""
+LANDING_AMOUNT_USD = 3000
+
+"""Coins whose pairs are precomputed if no coins file is given (by ranking)
+and worker processes used (0 or 1: serial).
+"""
+PRECOMPUTE_TOP_COINS = 30
+PRECOMPUTE_WORKERS = os.cpu_count() or 1
+
+"""Settings of the search form by default.
+"""
+DEFAULT_FEE_SETTINGS = {"CEP": "(CEP)",
+                        "Default": "(Avg)",
+                        "Binance": "(BNB)"}
+
+"""Contents of 'PRECOMPUTED_ROUTES_FILE' already read (and when it was
+modified), shared by the requests of the process.
+"""
+_precomputed = {'mtime': None, 'data': None}
+_precomputed_lock = Lock()
+
+
+def calc_landing_amount(amount_usd, coin, fx_function, logger):
+    """Returns the amount of 'coin' searched when landing with a direct link
+    ('amount_usd' rounded up to a 'big' number). None if there is no FX.
+    """
+    amount = fx_function('usd-us-dollars', coin, amount_usd, logger)
+    if not amount:
+        return None
+    return math.ceil(round_big_number(amount))
+
+
+def get_popular_coins(snapshot, logger, coins_file=None):
+    """Returns the coins whose pairs are precomputed: the ones whose symbols
+    are listed in 'coins_file' (one per line, as for the sitemap) or the
+    'PRECOMPUTE_TOP_COINS' active coins with the best ranking.
+    """
+    coins = [coin for coin in snapshot.coins.values()
+             if coin.status == 'Active']
+    if not coins_file:
+        coins.sort(key=lambda coin: coin.ranking or float('inf'))
+        return coins[:PRECOMPUTE_TOP_COINS]
+    try:
+        with open(coins_file, "r", encoding='utf-8') as f:
+            symbols = [line.strip().upper() for line in f if line.strip()]
+    except Exception as e:
+        logger.error("precompute_routes: Could not read '{}' [{}]"
+                     .format(coins_file, e))
+        return []
+    by_symbol = {coin.symbol.upper(): coin for coin in coins}
+    return [by_symbol[symbol] for symbol in symbols if symbol in by_symbol]
+
+
+def get_default_location(snapshot, coin):
+    """Returns the id of the location used when no exchange is selected
+    ('Wallet' for cryptos, 'Bank' for fiat, see 'set_default_exch').
+    """
+    name = 'Wallet' if snapshot.is_crypto(coin.id) else 'Bank'
+    for exch in snapshot.exchanges.values():
+        if exch.name == name:
+            return exch.id
+    return None
+
+
+def precompute_routes(logger, coins_file=None, workers=PRECOMPUTE_WORKERS):
+    """Searches the best routes for all the pairs of popular coins at
+    'LANDING_AMOUNT_USD', with the settings by default, and stores them in
+    'PRECOMPUTED_ROUTES_FILE'. To be run after updating prices (see
+    'precompute_routes.py'), with a pool of 'workers' processes of its own.
+    """
+    start = time.time()
+    snapshot = get_snapshot()
+    coins = get_popular_coins(snapshot, logger, coins_file)
+    tasks = []
+    for orig_coin in coins:
+        orig_loc = get_default_location(snapshot, orig_coin)
+        orig_amt = calc_landing_amount(LANDING_AMOUNT_USD, orig_coin.id,
+                                       snapshot.fx_exchange, logger)
+        if not orig_amt or not orig_loc:
+            continue
+        for dest_coin in coins:
+            dest_loc = get_default_location(snapshot, dest_coin)
+            if dest_coin.id == orig_coin.id or not dest_loc:
+                continue
+            tasks.append((orig_coin.id, dest_coin.id, LANDING_AMOUNT_USD,
+                          orig_amt, orig_loc, dest_loc,
+                          Params.DEFAULT_CURRENCY, logger.name))
+    logger.info("precompute_routes: {} searches for {} coins"
+                .format(len(tasks), len(coins)))
+    if workers > 1:
+        # Not the pool of the searches: it is shut down when done
+        with route_pool.create_pool(snapshot, workers) as pool:
+            results = list(pool.map(precompute_search, tasks, chunksize=8))
+    else:
+        results = (precompute_search(task, snapshot) for task in tasks)
+    routes = {}
+    for key, route_keys in results:
+        if route_keys is not None:
+            routes[key] = route_keys
+    # Write to a temporal file first, so readers never get half a file
+    data = {'created': time.time(),
+            'version': snapshot.version,
+            'currency': Params.DEFAULT_CURRENCY,
+            'routes': routes}
+    tmp_file = PRECOMPUTED_ROUTES_FILE + '.tmp'
+    os.makedirs(os.path.dirname(PRECOMPUTED_ROUTES_FILE), exist_ok=True)
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_file, PRECOMPUTED_ROUTES_FILE)
+    logger.info("precompute_routes: {} searches stored in {:.1f}s"
+                .format(len(routes), time.time() - start))
+    return len(routes)
+
+
+def calc_precomputed_key(orig_coin, dest_coin, amount_usd):
+    return "{}|{}|{}".format(orig_coin, dest_coin, amount_usd)
+
+
+def precompute_search(task, snapshot=None):
+    """Runs one search of 'precompute_routes' (in a worker of its pool if
+    no 'snapshot' is given).
+    Returns: [<key>, <route keys of the best paths (None if it failed)>]
+    """
+    (orig_coin, dest_coin, amount_usd, orig_amt, orig_loc, dest_loc,
+     currency, logger_name) = task
+    if not snapshot:
+        snapshot = route_pool.get_worker_snapshot()
+    logger = logging.getLogger(logger_name)
+    key = calc_precomputed_key(orig_coin, dest_coin, amount_usd)
+    try:
+        path_list = calc_paths(snapshot.get_exchange(orig_loc),
+                               snapshot.get_coin(orig_coin),
+                               orig_amt,
+                               snapshot.get_exchange(dest_loc),
+                               snapshot.get_coin(dest_coin),
+                               snapshot.get_coin(currency),
+                               DEFAULT_FEE_SETTINGS, logger,
+                               snapshot=snapshot,
+                               top_k=Params.MAX_PATHS)
+    except Exception as e:
+        logger.error("precompute_routes: Search failed for '{}' [{}]"
+                     .format(key, e))
+        return [key, None]
+    return [key, [calc_path_key(path) for path in path_list]]
+
+
+def load_precomputed_routes(logger):
+    """Returns the contents of 'PRECOMPUTED_ROUTES_FILE' (None if it does
+    not exist or is too old). The file is only read again if modified.
+    """
+    try:
+        mtime = os.path.getmtime(PRECOMPUTED_ROUTES_FILE)
+    except OSError:
+        return None
+    with _precomputed_lock:
+        if _precomputed['mtime'] != mtime:
+            try:
+                with open(PRECOMPUTED_ROUTES_FILE) as f:
+                    _precomputed['data'] = json.load(f)
+            except Exception as e:
+                logger.error("precompute: Could not read '{}' [{}]"
+                             .format(PRECOMPUTED_ROUTES_FILE, e))
+                _precomputed['data'] = None
+            _precomputed['mtime'] = mtime
+        data = _precomputed['data']
+    if not data or time.time() - data['created'] > PRECOMPUTED_MAX_AGE:
+        return None
+    return data
+
+
+def get_precomputed_paths(orig_loc, orig_coin, orig_amt, dest_loc,
+                          dest_coin, currency, logger,
+                          amount_usd=LANDING_AMOUNT_USD):
+    """Returns the 'Path's of the precomputed search of 'amount_usd' of
+    'orig_coin' into 'dest_coin' (recalculated for 'orig_amt'), or None if
+    the search was not precomputed.
+    """
+    data = load_precomputed_routes(logger)
+    if not data or data['currency'] != currency.id:
+        return None
+    key = calc_precomputed_key(orig_coin.id, dest_coin.id, amount_usd)
+    route_keys = data['routes'].get(key)
+    if route_keys is None:
+        return None
+    logger.info("Main: Precomputed search '{}' ({} routes)"
+                .format(key, len(route_keys)))
+    return follow_paths(route_keys, orig_loc, orig_coin, orig_amt, dest_loc,
+                        dest_coin, currency, DEFAULT_FEE_SETTINGS, logger)
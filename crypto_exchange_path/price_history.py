@@ -0,0 +1,218 @@
+import os
+import mmap
+import time
+import zlib
+import struct
+import datetime
+from array import array
+from bisect import bisect_right
+from threading import Lock
+from collections import OrderedDict
+from crypto_exchange_path import app
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.fx_matrix import FxMatrix
+from crypto_exchange_path.utils import set_logger
+
+""" ***********************************************************************
+***************************************************************************
+PRICE HISTORY
+***************************************************************************
+*********************************************************************** """
+
+"""Files where every price refresh is appended (never rewritten): the
+refreshes and the coin ids they refer to (one per line, in index order).
+"""
+PRICE_HISTORY_FILE = os.path.join(app.instance_path, 'price_history.bin')
+PRICE_HISTORY_COINS_FILE = os.path.join(app.instance_path,
+                                        'price_history_coins.txt')
+
+"""Each refresh is a header (magic, timestamp, number of prices, bytes of
+the payload) followed by its zlib-compressed columns: prices (float64) and
+indexes of 'coin' and 'base_coin' (uint32).
+"""
+PRICE_HISTORY_MAGIC = b'CEPHST01'
+PRICE_HISTORY_HEADER = struct.Struct('=8sdII')
+
+"""Refreshes kept decompressed (as 'FxMatrix') by each worker.
+"""
+PRICE_HISTORY_CACHE_SIZE = 32
+
+"""History mapped by this worker and lock that guards its replacement.
+"""
+_history = None
+_history_lock = Lock()
+
+logger = set_logger('PriceHistory', Params.LOGGER_DETAIL)
+
+
+class PriceHistory(object):
+    """Read-only, memory-mapped view of the price history. Only the headers
+    are read when mapped: refreshes are decompressed when first used to
+    convert an amount.
+    """
+
+    def __init__(self, path, coins_path):
+        self.coin_ids = read_coin_ids(coins_path)
+        with open(path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.timestamps = []
+        self.blocks = []
+        offset = 0
+        while offset + PRICE_HISTORY_HEADER.size <= self.size:
+            magic, timestamp, prices, payload_size = \
+                PRICE_HISTORY_HEADER.unpack_from(self.buffer, offset)
+            start = offset + PRICE_HISTORY_HEADER.size
+            # Stop at a refresh still being written
+            if magic != PRICE_HISTORY_MAGIC or \
+                    start + payload_size > self.size:
+                break
+            self.timestamps.append(timestamp)
+            self.blocks.append((start, prices, payload_size))
+            offset = start + payload_size
+        self.matrices = OrderedDict()
+        self.lock = Lock()
+
+    def __repr__(self):
+        return ("PriceHistory({} refreshes, {} coins)"
+                .format(len(self.timestamps), len(self.coin_ids)))
+
+    def find_refresh(self, as_of):
+        """Returns the position of the last refresh done at 'as_of' (None if
+        there is none). 'as_of' can be a datetime or a timestamp.
+        """
+        if isinstance(as_of, datetime.datetime):
+            as_of = as_of.timestamp()
+        pos = bisect_right(self.timestamps, as_of) - 1
+        return pos if pos >= 0 else None
+
+    def get_prices(self, pos):
+        """Returns the prices of the refresh in 'pos' as a dictionary
+        {(<coin>, <base_coin>): <price>}.
+        """
+        start, prices, payload_size = self.blocks[pos]
+        payload = zlib.decompress(self.buffer[start:start + payload_size])
+        columns = memoryview(payload)
+        rates = columns[:prices * 8].cast('d')
+        coin_index = columns[prices * 8:prices * 12].cast('I')
+        base_index = columns[prices * 12:prices * 16].cast('I')
+        ids = self.coin_ids
+        return {(ids[coin], ids[base_coin]): price
+                for coin, base_coin, price
+                in zip(coin_index, base_index, rates)}
+
+    def get_fx_matrix(self, pos):
+        """Returns the 'FxMatrix' of the refresh in 'pos'.
+        """
+        with self.lock:
+            matrix = self.matrices.get(pos)
+            if matrix is not None:
+                self.matrices.move_to_end(pos)
+                return matrix
+        matrix = FxMatrix(self.get_prices(pos))
+        with self.lock:
+            self.matrices[pos] = matrix
+            if len(self.matrices) > PRICE_HISTORY_CACHE_SIZE:
+                self.matrices.popitem(last=False)
+        return matrix
+
+    def get_fx_rate(self, orig_coin, dest_coin, as_of):
+        """Returns the FX rate at 'as_of' (None if not available).
+        """
+        pos = self.find_refresh(as_of)
+        if pos is None:
+            return None
+        return self.get_fx_matrix(pos).get_rate(orig_coin, dest_coin)
+
+    def convert_many(self, orig_coins, dest_coins, amounts, as_ofs):
+        """Converts each amount at its own 'as_ofs' date (see
+        'FxMatrix.convert_many'). Conversions are grouped by refresh, so
+        each refresh is looked up once.
+        """
+        groups = {}
+        for i, as_of in enumerate(as_ofs):
+            groups.setdefault(self.find_refresh(as_of), []).append(i)
+        converted = [None] * len(amounts)
+        for pos, items in groups.items():
+            if pos is None:
+                continue
+            results = self.get_fx_matrix(pos).convert_many(
+                [orig_coins[i] for i in items],
+                [dest_coins[i] for i in items],
+                [amounts[i] for i in items])
+            for i, amount in zip(items, results):
+                converted[i] = amount
+        return converted
+
+
+def append_prices(prices, timestamp=None, path=PRICE_HISTORY_FILE,
+                  coins_path=PRICE_HISTORY_COINS_FILE):
+    """Appends a refresh with 'prices' (records with 'coin', 'base_coin'
+    and 'price') to the price history. 'timestamp' defaults to now.
+    The coin indexes are read from 'coins_path' (not from the mapped
+    history, which may be missing): if there are refreshes but no coins,
+    nothing is appended. Returns True if the refresh has been appended.
+    """
+    try:
+        coin_ids = read_coin_ids(coins_path)
+    except FileNotFoundError:
+        if os.path.exists(path):
+            logger.error("append_prices: '{}' not found: refreshes of '{}' "
+                         "can not be extended".format(coins_path, path))
+            return False
+        coin_ids = []
+    index = {coin_id: i for i, coin_id in enumerate(coin_ids)}
+    new_coins = []
+    for price in prices:
+        for coin in (price.coin, price.base_coin):
+            if coin not in index:
+                index[coin] = len(index)
+                new_coins.append(coin)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Coins first: a refresh must never refer to coins not written yet
+    if new_coins:
+        with open(coins_path, 'a', encoding='utf-8') as f:
+            f.write(''.join('{}\n'.format(coin) for coin in new_coins))
+    payload = zlib.compress(
+        array('d', [price.price for price in prices]).tobytes() +
+        array('I', [index[price.coin] for price in prices]).tobytes() +
+        array('I', [index[price.base_coin] for price in prices]).tobytes())
+    with open(path, 'ab') as f:
+        f.write(PRICE_HISTORY_HEADER.pack(PRICE_HISTORY_MAGIC,
+                                          timestamp or time.time(),
+                                          len(prices), len(payload)) +
+                payload)
+    logger.info("append_prices: {} prices appended ({} bytes)"
+                .format(len(prices), len(payload)))
+    return True
+
+
+def read_coin_ids(coins_path):
+    """Returns the coin ids of the price history, in index order.
+    """
+    with open(coins_path, 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def get_price_history(path=PRICE_HISTORY_FILE,
+                      coins_path=PRICE_HISTORY_COINS_FILE):
+    """Returns the price history (None if empty), mapping it again if new
+    refreshes have been appended.
+    """
+    global _history
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        return None
+    history = _history
+    if history is not None and history.size == size:
+        return history
+    with _history_lock:
+        try:
+            _history = PriceHistory(path, coins_path)
+        # Catch generic exception: as-of conversions just fail
+        except Exception as e:
+            logger.error("get_price_history: '{}' could not be mapped [{}]"
+                         .format(path, e))
+            return None
+        return _history
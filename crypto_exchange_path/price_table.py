@@ -0,0 +1,200 @@
+import os
+import mmap
+import struct
+import hashlib
+from array import array
+from threading import Lock
+from collections import namedtuple
+from crypto_exchange_path import app, db
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.models import Price
+from crypto_exchange_path.fx_manager import reset_fx
+from crypto_exchange_path.utils import set_logger
+
+""" ***********************************************************************
+***************************************************************************
+SHARED PRICE TABLE
+***************************************************************************
+*********************************************************************** """
+
+"""File where 'update_prices' publishes the 'Price' table for all the
+workers of the host (and instances of the app sharing the folder). It also
+carries the version of the rest of the market data (coins, exchanges, fees
+and pairs), so workers reload their snapshot when it is edited by another.
+Tables published from another database are ignored (see 'get_db_key').
+The file pages are shared, but each worker still builds its own prices
+dictionary and 'FxMatrix' from them when loading its snapshot.
+"""
+PRICE_TABLE_FILE = os.path.join(app.instance_path, 'prices.bin')
+
+"""File layout: header (magic, version, number of coins, number of prices,
+bytes of the coin ids, version of the market data, key of the database),
+prices (float64), indexes of 'coin' and 'base_coin' in the coin ids
+(uint32) and coin ids (utf-8, one per line).
+"""
+PRICE_TABLE_MAGIC = b'CEPPRC02'
+PRICE_TABLE_HEADER = struct.Struct('=8sQIIII8s')
+
+PriceRecord = namedtuple('PriceRecord', ['coin', 'base_coin', 'price'])
+
+"""Price table mapped by this worker and lock that guards its replacement.
+"""
+_table = None
+_table_lock = Lock()
+
+logger = set_logger('PriceTable', Params.LOGGER_DETAIL)
+
+
+class PriceTable(object):
+    """Read-only, memory-mapped view of a published price table. The pages
+    of the file are shared by all the processes mapping it. The file is
+    replaced (never modified) when prices are published again, so a mapped
+    table stays valid while in use.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.version, coins, prices, ids_size, self.data_version,
+         self.db_key) = PRICE_TABLE_HEADER.unpack_from(self.buffer)
+        if magic != PRICE_TABLE_MAGIC:
+            raise ValueError("'{}' is not a price table".format(path))
+        view = memoryview(self.buffer)
+        start = PRICE_TABLE_HEADER.size
+        self.prices = view[start:start + prices * 8].cast('d')
+        start += prices * 8
+        self.coin_index = view[start:start + prices * 4].cast('I')
+        start += prices * 4
+        self.base_index = view[start:start + prices * 4].cast('I')
+        start += prices * 4
+        ids = bytes(view[start:start + ids_size]).decode('utf-8')
+        self.coin_ids = ids.split('\n') if coins else []
+
+    def __repr__(self):
+        return ("PriceTable(v{}/{}: {} coins, {} prices)"
+                .format(self.version, self.data_version, len(self.coin_ids),
+                        len(self.prices)))
+
+    def records(self):
+        """Returns the prices as 'PriceRecord's (same attributes as the
+        'Price' model).
+        """
+        ids = self.coin_ids
+        return [PriceRecord(ids[coin], ids[base_coin], price)
+                for coin, base_coin, price
+                in zip(self.coin_index, self.base_index, self.prices)]
+
+
+def publish_prices(path=PRICE_TABLE_FILE):
+    """Writes the 'Price' table in a new version of the price table file and
+    maps it. Other workers map it on their next request (see
+    'check_price_table'). Returns the new 'PriceTable'.
+    """
+    current = get_price_table(path)
+    return write_price_table(path,
+                             current.version + 1 if current else 1,
+                             current.data_version if current else 0)
+
+
+def publish_market_data(path=PRICE_TABLE_FILE):
+    """Publishes a new version of the market data (to be called after
+    changing coins, exchanges, fees or pairs): other workers reload their
+    snapshot on their next request. Prices keep their version.
+    Returns the new 'PriceTable'.
+    """
+    current = get_price_table(path)
+    return write_price_table(path,
+                             current.version if current else 1,
+                             current.data_version + 1 if current else 1)
+
+
+def write_price_table(path, version, data_version):
+    """Writes the 'Price' table in the price table file (with the given
+    versions) and maps it. Returns the new 'PriceTable'.
+    """
+    global _table
+    prices = Price.query.all()
+    index = {}
+    for price in prices:
+        for coin in (price.coin, price.base_coin):
+            index.setdefault(coin, len(index))
+    ids = '\n'.join(index).encode('utf-8')
+    # Replace the file at once: workers never see a partial table
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(PRICE_TABLE_HEADER.pack(PRICE_TABLE_MAGIC, version,
+                                        len(index), len(prices), len(ids),
+                                        data_version, get_db_key()))
+        array('d', [price.price for price in prices]).tofile(f)
+        array('I', [index[price.coin] for price in prices]).tofile(f)
+        array('I', [index[price.base_coin] for price in prices]).tofile(f)
+        f.write(ids)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    table = PriceTable(path)
+    with _table_lock:
+        _table = table
+    logger.info("write_price_table: {} published".format(table))
+    return table
+
+
+def get_price_table(path=PRICE_TABLE_FILE):
+    """Returns the last price table published for the current database
+    (None if there is none), mapping it again if the file has been replaced.
+    """
+    global _table
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    table = _table
+    if not table or \
+            table.key != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+        with _table_lock:
+            try:
+                _table = table = PriceTable(path)
+            # Catch generic exception: searches fall back to 'Price' table
+            except Exception as e:
+                logger.error("get_price_table: '{}' could not be mapped [{}]"
+                             .format(path, e))
+                return None
+    # Left over or published by another app (e.g. the benchmarks)
+    if table.db_key != get_db_key():
+        return None
+    return table
+
+
+def get_db_key():
+    """Returns the key of the database of the app (hash of its URL, without
+    password) stored in the tables published.
+    """
+    url = db.engine.url.render_as_string(hide_password=True)
+    return hashlib.sha1(url.encode('utf-8')).digest()[:8]
+
+
+@app.before_request
+def check_price_table():
+    """Reloads the FX cache and the market snapshot of this worker when
+    another one has published new prices, or only the snapshot when it has
+    published new market data (one 'stat' per request).
+    """
+    table = _table
+    new_table = get_price_table()
+    if new_table is None or new_table is table:
+        return
+    # Imported here: the snapshot loads its prices from this module
+    from crypto_exchange_path.market_snapshot import refresh_snapshot
+    if table is None or new_table.db_key != table.db_key or \
+            new_table.version != table.version:
+        logger.info("check_price_table: {} found (FX cache replaced [{}])"
+                    .format(new_table, reset_fx()))
+    elif new_table.data_version != table.data_version:
+        logger.info("check_price_table: {} found (market data changed)"
+                    .format(new_table))
+    else:
+        return
+    refresh_snapshot(logger)
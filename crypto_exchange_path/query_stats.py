@@ -0,0 +1,167 @@
+import time
+from threading import local
+from contextlib import contextmanager
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from crypto_exchange_path import app
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.utils import set_logger
+
+""" ***********************************************************************
+***************************************************************************
+SQL STATISTICS
+***************************************************************************
+*********************************************************************** """
+
+"""Maximum SQL statements per request of the endpoints listed. Requests
+above the budget are logged as warnings and, in test mode
+('app.testing'), fail with 'QueryBudgetExceeded'.
+"""
+QUERY_BUDGETS = {'exch_results': 25,
+                 'exchange_fees_by_coin': 25}
+
+"""Response header with the statistics of the request (only added in debug
+and test mode).
+"""
+SQL_STATS_HEADER = 'X-SQL-Stats'
+
+"""Statistics of the request (or job) being run by each thread.
+"""
+_local = local()
+
+logger = set_logger('SQLStats', Params.LOGGER_DETAIL)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryStats(object):
+    """SQL statements issued (and seconds spent running them) by a request,
+    in total and by section (see 'sql_section').
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.time = 0.0
+        self.sections = {}
+
+    def __repr__(self):
+        sections = ", ".join("{}: {} ({:.1f}ms)"
+                             .format(name, count, elapsed * 1000)
+                             for name, (count, elapsed)
+                             in sorted(self.sections.items()))
+        return ("QueryStats({}: {} statements in {:.1f}ms{})"
+                .format(self.name, self.count, self.time * 1000,
+                        " [{}]".format(sections) if sections else ""))
+
+    def as_header(self):
+        return "count={}; time={:.1f}ms".format(self.count, self.time * 1000)
+
+
+def start_stats(name):
+    """Starts counting the SQL statements issued by the current thread.
+    """
+    _local.stats = QueryStats(name)
+    return _local.stats
+
+
+def stop_stats():
+    """Stops counting and returns the 'QueryStats' (None if not started).
+    """
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+def get_stats():
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def sql_section(name):
+    """Adds the statements issued inside the block to the section 'name' of
+    the current 'QueryStats' (if any).
+    """
+    stats = get_stats()
+    if not stats:
+        yield
+        return
+    count, elapsed = stats.count, stats.time
+    try:
+        yield
+    finally:
+        section = stats.sections.setdefault(name, [0, 0.0])
+        section[0] += stats.count - count
+        section[1] += stats.time - elapsed
+
+
+def check_budget(stats, endpoint):
+    """Checks the statements of 'stats' against the budget of 'endpoint'.
+    Raises 'QueryBudgetExceeded' in test mode if it is exceeded.
+    """
+    budget = QUERY_BUDGETS.get(endpoint)
+    if budget is None or stats.count <= budget:
+        return
+    msg = ("check_budget: '{}' issued {} SQL statements (budget: {})"
+           .format(endpoint, stats.count, budget))
+    logger.warning(msg)
+    if app.testing:
+        raise QueryBudgetExceeded(msg)
+
+
+""" ***********************************************************************
+***************************************************************************
+ENGINE AND REQUEST HOOKS
+***************************************************************************
+*********************************************************************** """
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if get_stats():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    stats = get_stats()
+    starts = conn.info.get('query_start')
+    if stats and starts:
+        stats.count += 1
+        stats.time += time.perf_counter() - starts.pop()
+
+
+@event.listens_for(Engine, "handle_error")
+def handle_error(context):
+    """Drops the start time of a statement that failed (it never reaches
+    'after_cursor_execute').
+    """
+    conn = context.connection
+    starts = conn.info.get('query_start') if conn is not None else None
+    if starts:
+        starts.pop()
+
+
+@app.before_request
+def start_request_stats():
+    start_stats(request.endpoint)
+
+
+@app.after_request
+def log_request_stats(response):
+    """Logs the SQL statistics of the request and checks its budget.
+    Streamed responses only include the statements issued before streaming.
+    """
+    stats = stop_stats()
+    if not stats:
+        return response
+    logger.info("{} {}".format(request.path, stats))
+    if app.debug or app.testing:
+        response.headers[SQL_STATS_HEADER] = stats.as_header()
+    check_budget(stats, request.endpoint)
+    return response
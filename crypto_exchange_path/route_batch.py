@@ -0,0 +1,322 @@
+from collections import namedtuple
+from crypto_exchange_path.route_engine import RouteEngine, Leg, Route, Label
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+""" ***********************************************************************
+***************************************************************************
+BATCH (VECTORISED) ROUTE EVALUATION
+***************************************************************************
+*********************************************************************** """
+
+"""A 'Step' is one operation of a candidate route on the amount carried:
+    fee = max(pct * amount, minimum) + fixed    (rounded to 2 if 'rounded')
+The fee only applies while 'amount * thr_rate < thr_limit' ('Less1kUSD'
+fees); above it the route is invalid if 'thr_invalid' (withdrawals).
+The fee is added to the route fees converted with 'fee_rate', and then:
+    amount = (amount - deduct * fee) * scale
+A trade is a step with 'scale' = (1 - pct) * <FX rate> and 'deduct' = 0.
+If 'positive', the amount must be higher than 0 after the step.
+"""
+Step = namedtuple('Step', ['scale', 'pct', 'minimum', 'fixed', 'rounded',
+                           'thr_rate', 'thr_limit', 'thr_invalid',
+                           'fee_rate', 'deduct', 'positive'])
+
+"""Step that leaves the amount and the fees as they are (used as padding).
+"""
+NO_STEP = Step(1, 0, float('-inf'), 0, 0, 0, float('inf'), 0, 0, 0, 0)
+
+"""Trade of a candidate route (only the coins are known before evaluation).
+"""
+TradePlan = namedtuple('TradePlan', ['sell_coin', 'buy_coin'])
+
+"""Fees of a route for each amount of a sweep ('None' where the route is not
+valid). 'legs' identifies the route (see 'route_key').
+"""
+FeeCurve = namedtuple('FeeCurve', ['legs', 'hops', 'fees'])
+
+
+def route_key(route):
+    """Returns the legs of 'route' as ((<exchange_id>, (<coin_ids>)), ...).
+    """
+    return tuple((leg.exchange.id,
+                  tuple(trade.buy_coin.id for trade in leg.trades))
+                 for leg in route.legs)
+
+
+class RouteBatch(RouteEngine):
+    """Evaluates all the candidate routes of a search at once.
+
+    The graph is explored with the same rules as 'RouteEngine', but labels
+    carry the 'Step's of the route instead of amounts. Once all candidates
+    are enumerated, their destination amounts and fees are calculated in
+    one vectorised NumPy pass, and only the winners are recalculated with
+    the scalar 'RouteEngine' (the reference implementation), which builds
+    the 'Trade's shown in the results.
+    Steps are memoised in 'step_table' and labels only carry their
+    positions, so enumerating a candidate is mostly tuple concatenation.
+    """
+
+    """Margin (relative and absolute, in the calculation currency) under
+    which routes are recalculated as possible winners: the batch pass does
+    not round amounts as 'fx_exchange' does.
+    """
+    TOLERANCE = 1e-6
+
+    def __init__(self, origin, dest_loc, dest_coin, currency, fee_settings,
+                 logger, snapshot, max_hops=2):
+        super().__init__(origin, dest_loc, dest_coin, currency, fee_settings,
+                         logger, snapshot, max_hops=max_hops)
+        self.reference = RouteEngine(origin, dest_loc, dest_coin, currency,
+                                     fee_settings, logger, snapshot,
+                                     max_hops=max_hops)
+        self.reference.managers = self.managers
+        self.steps = {}
+        self.step_table = [NO_STEP]
+        self.candidates = 0
+
+    def search_best(self, top_k):
+        """Returns the 'top_k' 'Route's with the lowest fees, sorted by fees.
+        'top_k' is required: the winners are recalculated one by one, so all
+        of them would cost more than the scalar search.
+        """
+        if not top_k:
+            raise ValueError("'RouteBatch.search_best' needs 'top_k'")
+        routes = list(self.search())
+        self.candidates = len(routes)
+        if not routes:
+            return []
+        fees = self.evaluate([route.dest_amt for route in routes],
+                             [self.reference.start_label()])
+        return self.select(routes, fees[:, 0], self.reference, top_k)
+
+    def sweep(self, origins, top_k=None):
+        """Evaluates the candidate routes for each of 'origins' (the same
+        origin with different amounts).
+        Returns: [<FeeCurve>s, <best 'Route' of each origin (or None)>].
+        If 'top_k' is given, only the routes among the 'top_k' best ones of
+        any amount get a 'FeeCurve'.
+        """
+        routes = list(self.search())
+        self.candidates = len(routes)
+        if not routes:
+            return [[], [None] * len(origins)]
+        engines = []
+        for origin in origins:
+            engine = RouteEngine(origin, self.dest_loc, self.dest_coin,
+                                 self.currency, self.fee_settings,
+                                 self.logger, self.snapshot,
+                                 max_hops=self.max_hops)
+            engine.managers = self.managers
+            engines.append(engine)
+        fees = self.evaluate([route.dest_amt for route in routes],
+                             [engine.start_label() for engine in engines])
+        # Best route of each amount (recalculated by the scalar engine)
+        best = []
+        for i, engine in enumerate(engines):
+            winners = self.select(routes, fees[:, i], engine, 1)
+            best.append(winners[0] if winners else None)
+        # Fee curves of the routes that are valid for some amount
+        finite = np.isfinite(fees)
+        if top_k:
+            ranks = np.argsort(fees, axis=0, kind='stable')[:top_k]
+            ranked = np.zeros(fees.shape, dtype=bool)
+            ranked[ranks, np.arange(fees.shape[1])] = True
+            finite &= ranked
+        rows = np.flatnonzero(finite.any(axis=1))
+        rows = rows[np.argsort(fees[rows].min(axis=1), kind='stable')]
+        curves = [FeeCurve(route_key(routes[i]), routes[i].hops,
+                           [float(fee) if np.isfinite(fee) else None
+                            for fee in fees[i]])
+                  for i in rows]
+        return [curves, best]
+
+    def select(self, routes, fees, engine, top_k):
+        """Recalculates with the scalar 'engine' the routes whose 'fees' are
+        within 'TOLERANCE' of the 'top_k' best ones.
+        Returns the 'top_k' best 'Route's, sorted by fees.
+        """
+        order = np.argsort(fees, kind='stable')
+        order = order[np.isfinite(fees[order])]
+        if top_k and len(order) > top_k:
+            limit = fees[order[top_k - 1]]
+            limit += max(abs(limit), 1) * self.TOLERANCE
+            order = order[fees[order] <= limit]
+        best = []
+        for i in order:
+            legs = [(leg.exchange.id,
+                     [trade.buy_coin for trade in leg.trades])
+                    for leg in routes[i].legs]
+            route = engine.follow(legs)
+            if route:
+                best.append(route)
+        best.sort(key=lambda route: route.fees)
+        return best[:top_k] if top_k else best
+
+    def evaluate(self, programs, starts):
+        """Calculates the fees of the routes of 'programs' (tuples of
+        positions in 'step_table') in the calculation currency, for each of
+        the 'starts' labels (origin amounts).
+        Returns a matrix (routes x starts). Invalid routes get 'inf'.
+        """
+        length = max(len(program) for program in programs)
+        table = np.array(self.step_table, dtype=float)
+        # Padding with 'NO_STEP' (position 0)
+        positions = np.array([program + (0,) * (length - len(program))
+                              for program in programs], dtype=np.intp)
+        shape = (len(programs), len(starts))
+        amount = np.empty(shape)
+        amount[:] = [float(start.amount) for start in starts]
+        fees = np.empty(shape)
+        fees[:] = [float(start.fees) for start in starts]
+        invalid = np.zeros(shape, dtype=bool)
+        for i in range(length):
+            (scale, pct, minimum, fixed, rounded, thr_rate, thr_limit,
+             thr_invalid, fee_rate, deduct, positive) = \
+                table[positions[:, i]].T[:, :, np.newaxis]
+            fee = np.maximum(pct * amount, minimum) + fixed
+            fee = np.where(rounded > 0, np.round(fee, 2), fee)
+            applies = amount * thr_rate < thr_limit
+            invalid |= ~applies & (thr_invalid > 0)
+            fee = np.where(applies, fee, 0)
+            fees += fee * fee_rate
+            amount = (amount - deduct * fee) * scale
+            invalid |= (positive > 0) & (amount <= 0)
+        invalid |= amount < 0
+        return np.where(invalid, np.inf, fees)
+
+    def get_rate(self, orig_coin, dest_coin):
+        """FX rate used by the steps (0 if it can not be calculated).
+        """
+        rate = self.snapshot.get_fx_rate(orig_coin, dest_coin)
+        return rate if rate else 0
+
+    def add_step(self, key, step):
+        """Memoises 'step' and returns its position in 'step_table' (None if
+        there is no step).
+        """
+        position = None
+        if step is not None:
+            position = len(self.step_table)
+            self.step_table.append(step)
+        self.steps[key] = position
+        return position
+
+    def trade_step(self, exch, sell_coin, buy_coin):
+        """Returns the position of the 'Step' of the trade (None if it can
+        not be done).
+        Same calculation as 'ExchangeManager.perform_trade'.
+        """
+        key = ('Trade', exch, sell_coin.id, buy_coin.id)
+        if key in self.steps:
+            return self.steps[key]
+        step = None
+        trade_fee = self.get_manager(exch).get_trade_fee(None, sell_coin,
+                                                         buy_coin)
+        rate = self.snapshot.get_fx_rate(sell_coin.id, buy_coin.id)
+        if trade_fee and trade_fee[0] is not None and rate is not None:
+            pct, fee_coin = trade_fee[0] / 100, trade_fee[1]
+            # Fees are paid in 'FeeCoin' (if any) and then converted
+            if fee_coin and fee_coin != '-':
+                fee_rate = (self.get_rate(sell_coin.id, fee_coin) *
+                            self.get_rate(fee_coin, self.currency))
+            else:
+                fee_rate = self.get_rate(sell_coin.id, self.currency)
+            step = NO_STEP._replace(scale=(1 - pct) * rate, pct=pct,
+                                    fee_rate=fee_rate, positive=1)
+        return self.add_step(key, step)
+
+    def fee_step(self, action, exch, coin, deduct=True):
+        """Returns the position of the 'Step' of the deposit or withdrawal
+        fee (None if the fee is not found).
+        Same calculation as 'utils_db.apply_fee'.
+        """
+        key = (action, exch, coin.id, deduct)
+        if key in self.steps:
+            return self.steps[key]
+        step = None
+        fee = self.snapshot.get_fee(action, exch, coin.id)
+        if fee and fee.amount is not None:
+            step = NO_STEP._replace(
+                fee_rate=self.get_rate(coin.id, self.currency),
+                deduct=1 if deduct else 0)
+            if fee.type == 'Absolute':
+                # Fixed amount (it may need a conversion from 'FeeCoin')
+                fixed = self.snapshot.calc_fee(action, exch, coin, 0,
+                                               self.logger)[0]
+                step = step._replace(fixed=fixed)
+            elif fee.type == 'Percentage':
+                step = step._replace(pct=fee.amount / 100)
+                if fee.min_amount:
+                    step = step._replace(minimum=fee.min_amount)
+            elif fee.type == 'Less1kUSD':
+                step = step._replace(
+                    fixed=fee.amount,
+                    thr_rate=self.get_rate(coin.id, 'usd-us-dollars'),
+                    thr_limit=1000,
+                    thr_invalid=1 if action == 'Withdrawal' else 0)
+            elif fee.type == '1%+20':
+                step = step._replace(pct=0.01, fixed=20, rounded=1)
+            else:
+                step = None
+        return self.add_step(key, step)
+
+    def start_label(self):
+        """Label of 'orig_coin' withdrawn from the origin (the amount and
+        the fees are the ones of the reference engine).
+        """
+        return Label(None, self.origin.coin, (), None, 0, (), (),
+                     (self.origin.coin.id,), 0)
+
+    def deposit(self, label, exch):
+        """Adds the deposit fee of 'exch' to the steps of 'label'.
+        """
+        steps = label.amount
+        if label.legs or exch != self.origin.exchange.id:
+            step = self.fee_step('Deposit', exch, label.coin)
+            if step is not None:
+                steps += (step,)
+        return label._replace(exchange=exch,
+                              amount=steps,
+                              exchanges=label.exchanges + (exch,))
+
+    def perform_leg(self, label, coins, is_last):
+        """Adds the steps of the trades and the withdrawal of the leg.
+        Returns: [<Leg>, <steps>, 0] ([None, None, None] if the leg can not
+        be done).
+        """
+        exch = label.exchange
+        steps = label.amount
+        sell_coin = label.coin
+        trades = []
+        for buy_coin in coins:
+            step = self.trade_step(exch, sell_coin, buy_coin)
+            if step is None:
+                return [None, None, None]
+            steps += (step,)
+            trades.append(TradePlan(sell_coin, buy_coin))
+            sell_coin = buy_coin
+        if not is_last or exch != self.dest_loc.id:
+            step = self.fee_step('Withdrawal', exch, sell_coin)
+            if step is None:
+                return [None, None, None]
+            steps += (step,)
+        leg = Leg(self.get_manager(exch).exchange, trades, None, None)
+        return [leg, steps, 0]
+
+    def finish_route(self, label, coins):
+        """Returns the candidate 'Route', with its steps as 'dest_amt'.
+        """
+        leg, steps, fees = self.perform_leg(label, coins, True)
+        if not leg:
+            return None
+        # Deposit fee in destination (not substracted from the amount)
+        if self.dest_loc.id != label.exchange:
+            step = self.fee_step('Deposit', self.dest_loc.id, self.dest_coin,
+                                 deduct=False)
+            if step is not None:
+                steps += (step,)
+        return Route(label.legs + (leg,), self.calc_hops(label, len(coins)),
+                     steps, 0)
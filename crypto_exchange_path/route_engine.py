@@ -0,0 +1,462 @@
+import time
+import heapq
+from collections import namedtuple
+from crypto_exchange_path.exchange_manager import get_exchange_manager
+
+""" ***********************************************************************
+***************************************************************************
+ROUTE ENGINE
+***************************************************************************
+*********************************************************************** """
+
+"""A 'Leg' is the part of a route done inside one exchange: the coin is
+deposited (optional 'deposit_fee'), traded once ('direct') or twice through
+the exchange's best CoinZ ('bridged') and withdrawn ('withdraw_fee').
+"""
+Leg = namedtuple('Leg', ['exchange', 'trades', 'deposit_fee',
+                         'withdraw_fee'])
+
+"""A 'Route' is a complete solution of the search. 'hops' is the number of
+connections of the route: (trades - 1) + (exchanges - 1). It matches the
+path types: 0 (direct trade), 1 (two trades in the same exchange) and
+2 (two trades in different exchanges).
+"""
+Route = namedtuple('Route', ['legs', 'hops', 'dest_amt', 'fees'])
+
+"""A 'Label' is a partial route: 'amount' of 'coin' deposited in 'exchange'
+and ready to be traded. 'legs' are the legs already completed and 'fees'
+the fees paid so far, in the calculation currency.
+"""
+Label = namedtuple('Label', ['exchange', 'coin', 'amount', 'deposit_fee',
+                             'trades', 'legs', 'exchanges', 'coins',
+                             'fees'])
+
+
+class RouteEngine(object):
+    """Searches the routes to convert 'origin' into 'dest_coin' delivered in
+    'dest_loc', going through up to 'max_hops' connections.
+
+    The graph nodes are (location, coin) and the edges are trades inside an
+    exchange and transfers (withdrawal + deposit) between locations. Labels
+    are expanded best-first (lowest fees paid so far) and, if 'max_labels'
+    is given, a label is discarded when its node already has 'max_labels'
+    labels with fewer or equal hops and a higher or equal amount (dominance
+    pruning). With 'max_labels=None' the search is exhaustive.
+
+    'search_best()' keeps only the 'top_k' cheapest routes: as fees can only
+    grow along a route, labels that already paid more than the current K-th
+    best route are discarded, and the search stops as soon as the cheapest
+    label left in the queue can not improve the results.
+
+    Routes do not come by number of hops, but a label can only end in
+    routes with at least the hops of its next trade: the hops below the
+    ones of every label left ('settled_hops') will not get more routes
+    (see 'search_by_hops()'). 'settle_times' has the seconds it took to
+    find all the routes of each number of hops.
+
+    Besides the graph, these rules of the original 0/1/2-hop search apply:
+    - The first exchange must allow deposits of 'orig_coin'.
+    - Exchanges that trade the pair directly are only used for the direct
+      trade (neither as first nor last exchange of an indirect route).
+    - The last exchange of an indirect route must allow withdrawals of
+      'dest_coin'.
+    - Coins transferred between exchanges must be cryptos (but the ones in
+      'coin_types.BRIDGE_EXCLUDED', e.g. 'USDT') with a withdrawal fee in
+      the exchange they leave.
+    """
+
+    def __init__(self, origin, dest_loc, dest_coin, currency, fee_settings,
+                 logger, snapshot, max_hops=2, max_labels=None):
+        self.origin = origin
+        self.dest_loc = dest_loc
+        self.dest_coin = dest_coin
+        self.currency = currency
+        self.fee_settings = fee_settings
+        self.logger = logger
+        self.snapshot = snapshot
+        self.max_hops = max_hops
+        self.max_labels = max_labels
+        self.managers = {}
+        self.node_labels = {}
+        self.queue = []
+        self.counter = 0
+        self.bound = float('inf')
+        self.pruned = 0
+        self.found = {}
+        self.queued_hops = {}
+        self.settled_hops = 0
+        self.settle_times = {}
+        self.start_time = None
+        self.direct_pair_exch = snapshot.get_exch_by_pair(origin.coin.id,
+                                                          dest_coin.id,
+                                                          logger)
+        self.dest_coin_exchanges = snapshot.get_exch_by_coin(dest_coin.id)
+
+    def get_manager(self, exch):
+        """Returns the 'ExchangeManager' of 'exch' (shared by the searches
+        with the same snapshot and fee settings).
+        """
+        if exch not in self.managers:
+            self.managers[exch] = get_exchange_manager(exch,
+                                                       self.fee_settings,
+                                                       self.logger,
+                                                       self.snapshot)
+        return self.managers[exch]
+
+    def search(self):
+        """Generator that yields the 'Route's as they are found.
+        """
+        for routes in self.expand_labels():
+            for route in routes:
+                # Candidate routes found, by number of hops
+                self.found[route.hops] = self.found.get(route.hops, 0) + 1
+                yield route
+
+    def search_by_hops(self):
+        """Generator that yields the 'Route's grouped by number of hops
+        (direct trades first), in one search: each group is yielded as soon
+        as it is settled, so short routes do not wait for the deepest part
+        of the search. Within each group, routes come as they were found.
+        """
+        groups = {}
+        hops = 0
+        for routes in self.expand_labels():
+            while hops < self.settled_hops:
+                for route in groups.pop(hops, []):
+                    yield route
+                hops += 1
+            for route in routes:
+                self.found[route.hops] = self.found.get(route.hops, 0) + 1
+                groups.setdefault(route.hops, []).append(route)
+        for hops in sorted(groups):
+            for route in groups[hops]:
+                yield route
+
+    def expand_labels(self):
+        """Generator that expands the labels best-first. For each label,
+        'settled_hops' is updated and the generator of the routes it ends in
+        is yielded (see 'expand()').
+        """
+        self.start_time = time.perf_counter()
+        # First legs: exchanges that allow deposits of 'orig_coin'
+        label = self.start_label()
+        for exch in self.get_first_exchanges():
+            self.push(self.deposit(label, exch))
+        # Expand labels best-first
+        while self.queue:
+            label = heapq.heappop(self.queue)[-1]
+            label_hops = self.calc_hops(label, 1)
+            self.queued_hops[label_hops] -= 1
+            # Labels come by fees: none of the rest can improve the results
+            if label.fees >= self.bound:
+                self.pruned += len(self.queue) + 1
+                break
+            # New labels can not end in fewer hops than the one expanded
+            self.settle(min([label_hops] +
+                            [hops for hops, count in self.queued_hops.items()
+                             if count]))
+            yield self.expand(label)
+        self.settle(self.max_hops + 1)
+
+    def settle(self, hops):
+        """Flags the routes with fewer than 'hops' hops as all found.
+        """
+        if hops <= self.settled_hops:
+            return
+        elapsed = time.perf_counter() - self.start_time
+        for settled in range(self.settled_hops, min(hops,
+                                                    self.max_hops + 1)):
+            self.settle_times[settled] = elapsed
+        self.settled_hops = hops
+
+    def follow(self, legs):
+        """Recalculates the route that goes through 'legs', a list of
+        (<exchange_id>, <coins bought in the exchange>).
+        Returns the 'Route' (None if it can not be done).
+        """
+        label = self.start_label()
+        for i, (exch, coins) in enumerate(legs):
+            label = self.deposit(label, exch)
+            if i == len(legs) - 1:
+                return self.finish_route(label, coins)
+            leg, amount, fees = self.perform_leg(label, coins, False)
+            if not leg:
+                return None
+            label = self.next_label(label, leg, amount, fees)
+
+    def search_best(self, top_k):
+        """Returns the 'top_k' 'Route's with the lowest fees, sorted by fees.
+        """
+        best = []
+        for route in self.search():
+            if route.fees >= self.bound:
+                continue
+            self.counter += 1
+            heapq.heappush(best, (-route.fees, -self.counter, route))
+            if len(best) > top_k:
+                heapq.heappop(best)
+            # Routes with higher fees than the K-th best are useless
+            if len(best) == top_k:
+                self.bound = -best[0][0]
+        return [item[-1] for item in sorted(best, reverse=True)]
+
+    def to_currency(self, coin, amount):
+        """Converts a fee of 'amount' of 'coin' into the calculation currency
+        (0 if there is no fee or it can not be converted).
+        """
+        if not amount:
+            return 0
+        fee = self.snapshot.fx_exchange(coin.id, self.currency, amount,
+                                        self.logger)
+        return fee if fee else 0
+
+    def push(self, label):
+        """Adds 'label' to the queue unless it is dominated.
+        """
+        if label.fees >= self.bound or self.is_dominated(label):
+            self.pruned += 1
+            return
+        self.counter += 1
+        heapq.heappush(self.queue, (label.fees, self.counter, label))
+        hops = self.calc_hops(label, 1)
+        self.queued_hops[hops] = self.queued_hops.get(hops, 0) + 1
+
+    def is_dominated(self, label):
+        """Checks whether 'label' is dominated by 'max_labels' labels already
+        accepted in the same (location, coin) node. If not, it is accepted.
+        """
+        if self.max_labels is None:
+            return False
+        node = (label.exchange, label.coin.id)
+        hops = self.calc_hops(label, 0)
+        accepted = self.node_labels.setdefault(node, [])
+        dominating = [item for item in accepted
+                      if item[0] <= hops and item[1] >= label.amount]
+        if len(dominating) >= self.max_labels:
+            return True
+        accepted.append((hops, label.amount))
+        return False
+
+    def calc_hops(self, label, trades, transfers=0):
+        """Returns the hops of 'label' after doing 'trades' more trades and
+        'transfers' more transfers.
+        """
+        return (label.trades + trades - 1 +
+                len(label.exchanges) + transfers - 1)
+
+    def get_first_exchanges(self):
+        """Returns the exchanges where routes can start (sorted).
+        """
+        return sorted(self.snapshot.get_exch_by_coin(self.origin.coin.id))
+
+    def start_label(self):
+        """Returns the label of 'orig_coin' withdrawn from the origin, not
+        deposited in any exchange yet.
+        """
+        orig_coin = self.origin.coin
+        amount = self.origin.amount
+        if self.origin.withdraw_fee:
+            amount -= self.origin.withdraw_fee
+        fees = self.to_currency(orig_coin, self.origin.withdraw_fee)
+        return Label(None, orig_coin, amount, None, 0, (), (),
+                     (orig_coin.id,), fees)
+
+    def deposit(self, label, exch):
+        """Returns 'label' deposited in 'exch'. There is no deposit fee if the
+        origin coin is already in 'exch'.
+        """
+        amount = label.amount
+        fees = label.fees
+        deposit_fee = [None, None]
+        if label.legs or exch != self.origin.exchange.id:
+            deposit_fee = self.snapshot.calc_fee('Deposit', exch, label.coin,
+                                                 amount, self.logger)
+            if deposit_fee and deposit_fee[0] is not None:
+                amount -= deposit_fee[0]
+                fees += self.to_currency(label.coin, deposit_fee[0])
+        return label._replace(exchange=exch,
+                              amount=amount,
+                              deposit_fee=deposit_fee,
+                              exchanges=label.exchanges + (exch,),
+                              fees=fees)
+
+    def expand(self, label):
+        """Generates the legs that start from 'label'. Legs ending in
+        'dest_coin' are yielded as 'Route's, the others are transferred to
+        new exchanges and queued.
+        """
+        exch = label.exchange
+        coin = label.coin
+        is_first = not label.legs
+        adjacency = self.snapshot.get_adjacent_coins(exch, coin.id)
+        # Exchanges that trade the pair directly are only used for that trade
+        indirect_allowed = exch not in self.direct_pair_exch
+        # 1. Final leg: direct trade to 'dest_coin'
+        if self.dest_coin.id in adjacency:
+            hops = self.calc_hops(label, 1)
+            if hops <= self.max_hops and (hops == 0 or
+                                          self.is_last_exch_valid(exch)):
+                route = self.finish_route(label, [self.dest_coin])
+                if route:
+                    yield route
+        # 2. Final leg: two trades through the best CoinZ of the exchange
+        elif (indirect_allowed and
+                self.calc_hops(label, 2) <= self.max_hops and
+                self.is_last_exch_valid(exch)):
+            coinZ = self.get_manager(exch).get_best_coinZ(coin.id,
+                                                          self.dest_coin.id)
+            if not coinZ:
+                self.logger.warning("Main: No coinZ found in exchange '{}' to"
+                                    " convert '{}' to '{}' Path skipped."
+                                    .format(exch, coin.id, self.dest_coin.id))
+            else:
+                route = self.finish_route(label, [coinZ.coin,
+                                                  self.dest_coin])
+                if route:
+                    yield route
+        # 3. Intermediate leg: trade to a coin that is sent to another exch.
+        if is_first and not indirect_allowed:
+            return
+        if self.calc_hops(label, 1, 1) + 1 > self.max_hops:
+            return
+        bridges = self.snapshot.get_bridge_coins(exch, coin.id)
+        for coinZ_id in sorted(bridges):
+            if coinZ_id == self.dest_coin.id or coinZ_id in label.coins:
+                continue
+            coinZ = self.snapshot.get_coin(coinZ_id)
+            leg, amount, fees = self.perform_leg(label, [coinZ], False)
+            if leg:
+                self.transfer(label, leg, amount, fees)
+        # 4. Intermediate leg through the best CoinZ (only for long routes)
+        if self.calc_hops(label, 2, 1) + 1 > self.max_hops:
+            return
+        for coinZ_id in sorted(self.get_bridged_coins(exch, coin.id)):
+            if coinZ_id == self.dest_coin.id or coinZ_id in label.coins:
+                continue
+            bridge = self.get_manager(exch).get_best_coinZ(coin.id, coinZ_id)
+            if (not bridge or bridge.coin.id in label.coins or
+                    bridge.coin.id == self.dest_coin.id):
+                continue
+            coins = [bridge.coin, self.snapshot.get_coin(coinZ_id)]
+            leg, amount, fees = self.perform_leg(label, coins, False)
+            if leg:
+                self.transfer(label, leg, amount, fees)
+
+    def is_last_exch_valid(self, exch):
+        """Checks the conditions of the last exchange of indirect routes.
+        """
+        return (exch not in self.direct_pair_exch and
+                exch in self.dest_coin_exchanges)
+
+    def get_bridged_coins(self, exch, coin):
+        """Gets the bridge coins that can be reached from 'coin' in 'exch'
+        with two trades, but not with one.
+        """
+        adjacency = self.snapshot.get_adjacent_coins(exch, coin)
+        bridged = set()
+        for coinZ in adjacency:
+            bridged.update(self.snapshot.get_bridge_coins(exch, coinZ))
+        bridged.difference_update(adjacency)
+        bridged.discard(coin)
+        return bridged
+
+    def perform_leg(self, label, coins, is_last):
+        """Trades the coin of 'label' into each of 'coins' in turn, and
+        withdraws the result (required unless it stays in 'dest_loc').
+        Returns: [<Leg>, <amount after withdrawal>, <fees after the leg>]
+        ([None, None, None] if the leg can not be done).
+        """
+        exch = label.exchange
+        manager = self.get_manager(exch)
+        amount = label.amount
+        fees = label.fees
+        sell_coin = label.coin
+        trades = []
+        for buy_coin in coins:
+            trade = manager.perform_trade(amount, sell_coin, buy_coin)
+            # If 'perform_trade()' did not get results, skip path
+            if not trade:
+                self.logger.warning("Main: Trade could not be performed for "
+                                    "{}/{}[{}]. Path skipped."
+                                    .format(sell_coin.id, buy_coin.id, exch))
+                return [None, None, None]
+            trades.append(trade)
+            amount = trade.buy_amt
+            fees += self.to_currency(trade.fee_coin, trade.fee_amt)
+            sell_coin = buy_coin
+        # Calc Withdraw fee and modify amount
+        withdraw_fee = []
+        if not is_last or exch != self.dest_loc.id:
+            withdraw_fee = self.snapshot.calc_fee('Withdrawal', exch,
+                                                  sell_coin, amount,
+                                                  self.logger)
+            if withdraw_fee and withdraw_fee[0] is not None:
+                amount -= withdraw_fee[0]
+                fees += self.to_currency(sell_coin, withdraw_fee[0])
+            else:
+                self.logger.warning("Main: Withdraw Fee not found for {} [{}]."
+                                    " Path skipped.".format(exch,
+                                                            sell_coin.id))
+                return [None, None, None]
+        leg = Leg(manager.exchange, trades, label.deposit_fee, withdraw_fee)
+        return [leg, amount, fees]
+
+    def finish_route(self, label, coins):
+        """Performs the last leg of a route and returns the 'Route' (None if
+        it could not be done).
+        """
+        leg, dest_amt, fees = self.perform_leg(label, coins, True)
+        if not leg:
+            return None
+        if dest_amt < 0:
+            self.logger.warning("Main: Destination amount lower than 0 for "
+                                "{} [{}]. Path skipped."
+                                .format(label.exchange, self.dest_coin.id))
+            return None
+        # Deposit fee in destination (if it is not the last exchange)
+        if self.dest_loc.id != label.exchange:
+            deposit_fee = self.snapshot.calc_fee('Deposit', self.dest_loc.id,
+                                                 self.dest_coin, dest_amt,
+                                                 self.logger)
+            if deposit_fee and deposit_fee[0]:
+                fees += self.to_currency(self.dest_coin, deposit_fee[0])
+        legs = label.legs + (leg,)
+        hops = self.calc_hops(label, len(coins))
+        self.logger.debug("Path Found: {}".format(
+            " --> ".join("{}->{}({})".format(leg.trades[0].sell_coin.id,
+                                             leg.trades[-1].buy_coin.id,
+                                             leg.exchange.id)
+                         for leg in legs)))
+        return Route(legs, hops, dest_amt, fees)
+
+    def transfer(self, label, leg, amount, fees):
+        """Sends the result of 'leg' to the exchanges where it can continue
+        and queues the new labels.
+        """
+        if fees >= self.bound:
+            self.pruned += 1
+            return
+        next_label = self.next_label(label, leg, amount, fees)
+        coin = next_label.coin
+        # If only one trade is left, go only where it can end the route
+        if self.calc_hops(next_label, 1, 1) + 1 > self.max_hops:
+            exchanges = [exch for exch in self.snapshot.get_exch_by_pair(
+                             coin.id, self.dest_coin.id, self.logger)
+                         if self.is_last_exch_valid(exch)]
+        else:
+            exchanges = self.snapshot.get_exch_by_traded_coin(coin.id)
+        for exch in sorted(exchanges):
+            if exch in label.exchanges:
+                continue
+            self.push(self.deposit(next_label, exch))
+
+    def next_label(self, label, leg, amount, fees):
+        """Returns the label of the coin bought in 'leg', once withdrawn
+        (not deposited in the next exchange yet).
+        """
+        return Label(None, leg.trades[-1].buy_coin, amount, None,
+                     label.trades + len(leg.trades), label.legs + (leg,),
+                     label.exchanges,
+                     label.coins + tuple(trade.buy_coin.id
+                                         for trade in leg.trades),
+                     fees)
@@ -0,0 +1,217 @@
+import logging
+import threading
+import multiprocessing
+from threading import Lock
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from crypto_exchange_path.route_engine import RouteEngine
+from crypto_exchange_path.route_batch import route_key
+from crypto_exchange_path.objects import Location
+
+""" ***********************************************************************
+***************************************************************************
+PARALLEL ROUTE SEARCH
+***************************************************************************
+*********************************************************************** """
+
+"""Worker processes used by 'calc_paths' (0 or 1: serial search).
+"""
+PATH_WORKERS = 0
+
+"""Searches with fewer starting exchanges than this are run serially (the
+cost of sending the tasks is higher than the gain).
+"""
+PARALLEL_MIN_EXCHANGES = 16
+
+"""Partitions of the starting exchanges per worker (more partitions balance
+better the load, as some exchanges have many more routes than others).
+"""
+PARTITIONS_PER_WORKER = 4
+
+
+class ParallelRouteEngine(RouteEngine):
+    """'RouteEngine' that splits the search by the exchange where routes
+    start (the first leg) across a pool of worker processes.
+
+    Workers get a copy of the 'MarketSnapshot' when the pool is created (not
+    the DB session), search their exchanges and return the fees and legs of
+    the routes found (and the candidates found by number of hops, merged in
+    'found'). Results are merged in a deterministic order (fees,
+    partition, position) and the winners are recalculated in this process
+    with 'follow()' to build the 'Trade's.
+    With 'top_k', each worker keeps its own 'top_k' best routes, which
+    include all the routes of the global 'top_k'. Searches with
+    'max_labels' are not split (see 'is_parallel').
+    If 'partition' is given, only routes starting in those exchanges are
+    searched (used by the workers).
+    """
+
+    def __init__(self, origin, dest_loc, dest_coin, currency, fee_settings,
+                 logger, snapshot, max_hops=2, max_labels=None, workers=1,
+                 partition=None):
+        super().__init__(origin, dest_loc, dest_coin, currency, fee_settings,
+                         logger, snapshot, max_hops=max_hops,
+                         max_labels=max_labels)
+        self.workers = workers
+        self.partition = partition
+
+    def get_first_exchanges(self):
+        if self.partition is not None:
+            return list(self.partition)
+        return super().get_first_exchanges()
+
+    def is_parallel(self, exchanges):
+        """Checks whether the search is worth running in parallel.
+        Searches with 'max_labels' are always serial: dominance pruning
+        compares labels of all the partitions, so pruning each partition on
+        its own would give different routes.
+        """
+        return (self.workers > 1 and self.max_labels is None and
+                len(exchanges) >= PARALLEL_MIN_EXCHANGES)
+
+    def search(self):
+        if not self.is_parallel(self.get_first_exchanges()):
+            for route in super().search():
+                yield route
+            return
+        for route in self.search_best(None):
+            yield route
+
+    def search_best(self, top_k):
+        exchanges = self.get_first_exchanges()
+        if not self.is_parallel(exchanges):
+            return super().search_best(top_k)
+        # Round robin, so each partition gets big and small exchanges
+        n_partitions = min(len(exchanges),
+                           self.workers * PARTITIONS_PER_WORKER)
+        tasks = [(self.origin.exchange.id, self.origin.amount,
+                  self.origin.coin.id, self.dest_loc.id, self.dest_coin.id,
+                  self.currency, self.fee_settings, self.logger.name,
+                  self.max_hops, self.max_labels, top_k,
+                  exchanges[i::n_partitions])
+                 for i in range(n_partitions)]
+        found = []
+        with use_pool(self.snapshot, self.workers) as pool:
+            results = list(pool.map(search_partition, tasks))
+        for i, (routes, pruned, partition_found) in enumerate(results):
+            self.pruned += pruned
+            for hops, count in partition_found.items():
+                self.found[hops] = self.found.get(hops, 0) + count
+            for j, (fees, legs) in enumerate(routes):
+                found.append((fees, i, j, legs))
+        found.sort()
+        if top_k:
+            found = found[:top_k]
+        self.logger.debug("Main: {} routes found by {} partitions"
+                          .format(len(found), n_partitions))
+        # Winners are recalculated to get their 'Trade's
+        best = []
+        for fees, i, j, legs in found:
+            route = self.follow([(exch, [self.snapshot.get_coin(coin)
+                                         for coin in coins])
+                                 for exch, coins in legs])
+            if route:
+                best.append(route)
+        return best
+
+
+""" ***********************************************************************
+***************************************************************************
+WORKER POOL
+***************************************************************************
+*********************************************************************** """
+
+"""Pool shared by the searches of the process, the snapshot it was created
+with (inherited by the workers), searches using each pool and the lock that
+guards them.
+"""
+_pool = None
+_pool_key = None
+_pool_users = {}
+_pool_lock = Lock()
+_worker_snapshot = None
+
+
+@contextmanager
+def use_pool(snapshot, workers):
+    """Context manager that returns the worker pool for 'snapshot'. The pool
+    is replaced when the snapshot changes, so workers never mix market data
+    versions, but a replaced pool is only shut down when the last search
+    using it is done.
+    """
+    global _pool, _pool_key
+    key = (snapshot.version, snapshot.created, workers)
+    with _pool_lock:
+        if _pool_key != key:
+            if _pool and not _pool_users.get(_pool):
+                _pool.shutdown(wait=False)
+            _pool = create_pool(snapshot, workers)
+            _pool_key = key
+        pool = _pool
+        _pool_users[pool] = _pool_users.get(pool, 0) + 1
+    try:
+        yield pool
+    finally:
+        with _pool_lock:
+            _pool_users[pool] -= 1
+            if not _pool_users[pool]:
+                del _pool_users[pool]
+                if pool is not _pool:
+                    pool.shutdown(wait=False)
+
+
+def create_pool(snapshot, workers):
+    """Returns a new pool of 'workers' processes searching in 'snapshot'
+    (see 'get_worker_snapshot'). The caller shuts it down.
+    Workers are forked (they inherit the snapshot instead of unpickling it)
+    only while this is the only thread of the process, e.g. in the workers
+    of a pre-fork server: forking a threaded process (threaded WSGI server)
+    copies locks held by other threads, so workers are spawned instead.
+    """
+    if ('fork' in multiprocessing.get_all_start_methods() and
+            threading.active_count() == 1):
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context('spawn')
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=init_worker,
+                               initargs=(snapshot,))
+
+
+def init_worker(snapshot):
+    """Stores the snapshot used by the searches of the worker.
+    """
+    global _worker_snapshot
+    _worker_snapshot = snapshot
+
+
+def get_worker_snapshot():
+    """Returns the snapshot of the worker (to be called from tasks run in
+    a pool of 'create_pool').
+    """
+    return _worker_snapshot
+
+
+def search_partition(task):
+    """Searches the routes starting in the exchanges of 'task'.
+    Returns: [[(<fees>, <legs>), ...], <pruned labels>,
+              {<hops>: <candidate routes found>}]
+    """
+    (orig_loc, orig_amt, orig_coin, dest_loc, dest_coin, currency,
+     fee_settings, logger_name, max_hops, max_labels, top_k,
+     exchanges) = task
+    snapshot = get_worker_snapshot()
+    logger = logging.getLogger(logger_name)
+    origin = Location("Origin", snapshot.get_exchange(orig_loc), orig_amt,
+                      snapshot.get_coin(orig_coin), logger, snapshot)
+    engine = ParallelRouteEngine(origin, snapshot.get_exchange(dest_loc),
+                                 snapshot.get_coin(dest_coin), currency,
+                                 fee_settings, logger, snapshot,
+                                 max_hops=max_hops, max_labels=max_labels,
+                                 partition=exchanges)
+    if top_k:
+        routes = engine.search_best(top_k)
+    else:
+        routes = engine.search()
+    routes = [(route.fees, route_key(route)) for route in routes]
+    return [routes, engine.pruned, engine.found]
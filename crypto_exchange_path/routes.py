@@ -1,14 +1,26 @@
-import datetime
+import json
 import math
+import datetime
 import traceback
 from secrets import token_hex
 from flask import (render_template, url_for, redirect, request, make_response,
-                   current_app, Markup, send_from_directory)
+                   current_app, Markup, send_from_directory, Response,
+                   stream_with_context)
 from flask_blogging.views import _get_blogging_engine
 from crypto_exchange_path import app, db, mail
 from crypto_exchange_path.config import Params
 from crypto_exchange_path.forms import SearchForm, FeedbackForm, PromoForm
-from crypto_exchange_path.path_calculator import calc_paths
+from crypto_exchange_path.path_calculator import (calc_paths_cached,
+                                                  iter_paths)
+from crypto_exchange_path.path_cache import path_cache
+from crypto_exchange_path.fx_manager import get_fx_cache
+from crypto_exchange_path.search_jobs import search_jobs
+from crypto_exchange_path.search_register import (SearchProfile,
+                                                  search_register)
+from crypto_exchange_path.market_snapshot import get_snapshot
+from crypto_exchange_path.precompute import (calc_landing_amount,
+                                             get_precomputed_paths,
+                                             LANDING_AMOUNT_USD)
 from crypto_exchange_path.utils import (set_logger,
                                         error_notifier,
                                         feedback_notifier,
@@ -34,7 +46,8 @@ from crypto_exchange_path.utils_db import (get_exch_by_name,
                                            get_promos,
                                            get_coin_by_urlname,
                                            get_coin_by_symbol,
-                                           get_mapping)
+                                           get_mapping,
+                                           set_default_exch)
 from crypto_exchange_path.models import (Feedback,
                                          Subscriber)
 from crypto_exchange_path.info_fetcher import (update_prices,
@@ -248,6 +261,28 @@ def promotions():
                            promos=promos)
 
 
+def calc_registered_paths(session_id, orig_loc, orig_coin, orig_amt,
+                          dest_loc, dest_coin, curr, fee_settings, max_hops,
+                          user_exchanges):
+    """Runs 'calc_paths_cached' and registers the search in 'QueryRegister'
+    (also if it fails, with -1 results).
+    """
+    profile = SearchProfile()
+    results = -1
+    try:
+        paths = calc_paths_cached(orig_loc, orig_coin, orig_amt, dest_loc,
+                                  dest_coin, curr, fee_settings, logger,
+                                  max_hops=max_hops, top_k=Params.MAX_PATHS,
+                                  profile=profile)
+        results = len(paths)
+    finally:
+        profile.finish(results)
+        search_register.register(session_id, orig_amt, orig_coin, orig_loc,
+                                 dest_coin, dest_loc, curr, max_hops,
+                                 user_exchanges, profile)
+    return paths
+
+
 @app.route("/exchanges/search/<url_orig_coin>-to-<url_dest_coin>",
            methods=['GET', 'POST'])
 def exch_results(url_orig_coin=None, url_dest_coin=None):
@@ -320,11 +355,13 @@ def exch_results(url_orig_coin=None, url_dest_coin=None):
                 fee_settings = {"CEP": input_form.cep_promos.data,
                                 "Default": input_form.default_fee.data,
                                 "Binance": input_form.binance_fee.data}
-                # start_time = datetime.datetime.now()
+                # Connections selected by the user bound the search depth
+                max_hops = int(input_form.connection_type.data)
                 try:
-                    paths = calc_paths(orig_loc, orig_coin, orig_amt,
-                                       dest_loc, dest_coin,
-                                       curr, fee_settings, logger)
+                    paths = calc_registered_paths(
+                        session_id or new_session_id, orig_loc, orig_coin,
+                        orig_amt, dest_loc, dest_coin, curr, fee_settings,
+                        max_hops, user_exchanges)
                     path_results = len(paths)
                 # Catch generic exception if anything went wrong in logic
                 except Exception as e:
@@ -347,9 +384,10 @@ def exch_results(url_orig_coin=None, url_dest_coin=None):
                         orig_amt = round_big_number(orig_amt)
                         input_form.orig_amt.data = orig_amt
                         try:
-                            paths = calc_paths(orig_loc, orig_coin, orig_amt,
-                                               dest_loc, dest_coin,
-                                               curr, fee_settings, logger)
+                            paths = calc_registered_paths(
+                                session_id or new_session_id, orig_loc,
+                                orig_coin, orig_amt, dest_loc, dest_coin,
+                                curr, fee_settings, max_hops, user_exchanges)
                             path_results = len(paths)
                             amt_warning = True
                         # Catch generic exception if anything went wrong
@@ -397,15 +435,34 @@ def exch_results(url_orig_coin=None, url_dest_coin=None):
                 if new_symbol:
                     dest_coin = get_coin_by_symbol(new_symbol)
             # Procced with function
+            orig_amt = None
             if orig_coin:
                 input_form.orig_coin.data = orig_coin.long_name
-                amt = fx_exchange('usd-us-dollars', orig_coin.id, 3000, logger)
-                if amt:
-                    amt = round_big_number(amt)
-                    input_form.orig_amt.data = str(math.ceil(amt)) + " "
+                orig_amt = calc_landing_amount(LANDING_AMOUNT_USD,
+                                               orig_coin.id, fx_exchange,
+                                               logger)
+                if orig_amt:
+                    input_form.orig_amt.data = str(orig_amt) + " "
             if dest_coin:
                 input_form.dest_coin.data = dest_coin.long_name
             auto_search = True
+            # If the search was precomputed, show results with no 2nd POST
+            if orig_amt and dest_coin and orig_coin.id != dest_coin.id:
+                orig_loc = get_exch_by_name(set_default_exch(orig_coin.id))
+                dest_loc = get_exch_by_name(set_default_exch(dest_coin.id))
+                paths = None
+                if orig_loc and dest_loc:
+                    paths = get_precomputed_paths(orig_loc, orig_coin,
+                                                  orig_amt, dest_loc,
+                                                  dest_coin, curr, logger)
+                if paths is not None:
+                    input_form.orig_amt.data = orig_amt
+                    input_form.orig_loc.data = orig_loc.name
+                    input_form.dest_loc.data = dest_loc.name
+                    user_exchanges = [exch.id for exch in exchanges]
+                    path_results = len(paths)
+                    sorted_paths = paths[0:Params.MAX_PATHS]
+                    auto_search = False
         # Actions if Feedback Form was filled
         if feedback_form.feedback_submit.data:
             if feedback_form.validate():
@@ -442,6 +499,146 @@ def exch_results(url_orig_coin=None, url_dest_coin=None):
     return resp
 
 
+def get_search_params(args):
+    """Reads the search of the streaming search and the API from 'args'
+    (ids): 'orig_amt', 'orig_coin', 'orig_loc', 'dest_coin', 'dest_loc' and
+    optionally 'currency', 'connection_type' and the fee settings of the
+    search form ('cep_promos', 'default_fee', 'binance_fee').
+    Returns a dictionary with the search (None if it is not valid).
+    """
+    try:
+        orig_amt = float(args.get('orig_amt', ''))
+    except (TypeError, ValueError):
+        return None
+    # 'nan', 'inf' and 'Infinity' are parsed by 'float' (and JSON)
+    if not math.isfinite(orig_amt):
+        return None
+    params = {'orig_amt': orig_amt,
+              'orig_coin': args.get('orig_coin'),
+              'orig_loc': args.get('orig_loc'),
+              'dest_coin': args.get('dest_coin'),
+              'dest_loc': args.get('dest_loc'),
+              'currency': args.get('currency', Params.DEFAULT_CURRENCY)}
+    if (orig_amt <= 0 or not get_coin(params['orig_coin']) or
+            not get_exchange(params['orig_loc']) or
+            not get_coin(params['dest_coin']) or
+            not get_exchange(params['dest_loc']) or
+            not get_coin(params['currency'])):
+        return None
+    max_hops = str(args.get('connection_type', '2'))
+    params['max_hops'] = int(max_hops) if max_hops in ['0', '1', '2'] else 2
+    params['fee_settings'] = {"CEP": args.get('cep_promos', '(CEP)'),
+                              "Default": args.get('default_fee', '(Avg)'),
+                              "Binance": args.get('binance_fee', '(BNB)')}
+    return params
+
+
+@app.route("/exchanges/search/stream", methods=['GET'])
+def exch_results_stream():
+    """Streams the paths of a search as JSON lines, as they are found
+    (direct trades first). Each line has the path found and the best path
+    so far; the last one has the number of results. Arguments as in
+    'get_search_params()' (finite amounts only: lines are strict JSON).
+    """
+    params = get_search_params(request.args)
+    if not params:
+        error = {'event': 'error', 'message': 'Invalid search'}
+        return Response(json.dumps(error) + "\n", status=400,
+                        mimetype='application/x-ndjson')
+    snapshot = get_snapshot()
+    session_id = "stream-{}".format(request.cookies.get('session', '-'))
+    orig_loc = snapshot.get_exchange(params['orig_loc'])
+    orig_coin = snapshot.get_coin(params['orig_coin'])
+    dest_loc = snapshot.get_exchange(params['dest_loc'])
+    dest_coin = snapshot.get_coin(params['dest_coin'])
+    curr = snapshot.get_coin(params['currency'])
+    profile = SearchProfile()
+
+    def generate():
+        best = None
+        results = 0
+        try:
+            for path in iter_paths(orig_loc, orig_coin, params['orig_amt'],
+                                   dest_loc, dest_coin, curr,
+                                   params['fee_settings'], logger,
+                                   snapshot=snapshot,
+                                   max_hops=params['max_hops'],
+                                   profile=profile):
+                results += 1
+                path_dict = path.as_dict()
+                if not best or path.total_fees < best['total_fees']:
+                    best = path_dict
+                yield json.dumps({'event': 'path',
+                                  'path': path_dict,
+                                  'best': {'id': best['id'],
+                                           'total_fees': best['total_fees']}
+                                  }, allow_nan=False) + "\n"
+        # Catch generic exception if anything went wrong in logic
+        except Exception as e:
+            db.session.rollback()
+            error_notifier(type(e).__name__,
+                           traceback.format_exc(),
+                           mail,
+                           logger)
+            results = -1
+            yield json.dumps({'event': 'error',
+                              'message': 'Search failed'}) + "\n"
+            return
+        finally:
+            # Also registered if the client leaves before the end
+            profile.finish(results)
+            search_register.register(session_id, params['orig_amt'],
+                                     orig_coin, orig_loc, dest_coin,
+                                     dest_loc, curr, params['max_hops'], [],
+                                     profile)
+        yield json.dumps({'event': 'done',
+                          'results': results,
+                          'best': best}, allow_nan=False) + "\n"
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
+
+@app.route("/api/v1/searches", methods=['POST'])
+def api_search_create():
+    """Queues a search (JSON body with the arguments of
+    'get_search_params()') and returns the id of its job.
+    """
+    body = request.get_json(silent=True)
+    params = get_search_params(body) if isinstance(body, dict) else None
+    if not params:
+        return make_response(json.dumps({'error': 'Invalid search'}), 400,
+                             {'Content-Type': 'application/json'})
+    job = search_jobs.submit(params)
+    if not job:
+        return make_response(json.dumps({'error': 'Too many searches. '
+                                                  'Try again later'}), 503,
+                             {'Content-Type': 'application/json',
+                              'Retry-After': '5'})
+    job_info = job.as_dict()
+    job_info['url'] = url_for('api_search_get', job_id=job.id)
+    return make_response(json.dumps(job_info), 202,
+                         {'Content-Type': 'application/json',
+                          'Location': job_info['url']})
+
+
+@app.route("/api/v1/searches/<job_id>", methods=['GET'])
+def api_search_get(job_id):
+    """Returns the status of a search job (with its results when done).
+    With 'wait=<seconds>', waits for the results (long polling).
+    """
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = 0
+    job = search_jobs.get(job_id, wait)
+    if not job:
+        return make_response(json.dumps({'error': 'Unknown job'}), 404,
+                             {'Content-Type': 'application/json'})
+    return make_response(json.dumps(job.as_dict()), 200,
+                         {'Content-Type': 'application/json'})
+
+
 @app.route("/exchanges/search/<url_orig_coin>+<url_dest_coin>",
            methods=['GET', 'POST'])
 def exch_results_old_1a(url_orig_coin=None, url_dest_coin=None):
@@ -732,6 +929,18 @@ def update_prcs():
         return traceback.format_exc()
 
 
+@app.route("/stats/path_cache_wpeorituy8ahsdkj3kzxcv")
+def path_cache_stats():
+    stats = path_cache.get_stats()
+    return " | ".join("{}={}".format(key, stats[key]) for key in stats)
+
+
+@app.route("/stats/fx_cache_zmxncbvlaksjdh5qpwoeiruty")
+def fx_cache_stats():
+    stats = get_fx_cache().get_stats()
+    return " | ".join("{}={}".format(key, stats[key]) for key in stats)
+
+
 @app.route("/update/pairs_rqoewirhkfldajvczmcxzvf")
 def update_pairs_route():
     try:
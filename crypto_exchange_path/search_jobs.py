@@ -0,0 +1,165 @@
+import time
+import traceback
+from secrets import token_hex
+from threading import Lock, Event
+from concurrent.futures import ThreadPoolExecutor
+from crypto_exchange_path import app
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.utils import set_logger
+from crypto_exchange_path.market_snapshot import get_snapshot
+from crypto_exchange_path.path_calculator import calc_paths_cached
+from crypto_exchange_path.search_register import (SearchProfile,
+                                                  search_register)
+
+""" ***********************************************************************
+***************************************************************************
+SEARCH JOBS
+***************************************************************************
+*********************************************************************** """
+
+"""Threads that run the searches of the API and maximum number of searches
+waiting or running (further searches are rejected until some finish).
+"""
+JOB_WORKERS = 4
+JOB_MAX_PENDING = 50
+
+"""Seconds the results of a job are kept once finished, and maximum seconds
+a client can wait for them in one request (long polling).
+"""
+JOB_TTL = 10 * 60
+JOB_MAX_WAIT = 30
+
+
+class SearchJob(object):
+    """Search requested through the API. 'params' holds the ids of the
+    search ('orig_amt', 'orig_coin', 'orig_loc', 'dest_coin', 'dest_loc',
+    'currency', 'max_hops' and 'fee_settings').
+    """
+
+    def __init__(self, params):
+        self.id = token_hex(8)
+        self.params = params
+        self.status = 'Pending'
+        self.created = time.time()
+        self.finished = None
+        self.results = None
+        self.error = None
+        self.done = Event()
+
+    def __repr__(self):
+        return "SearchJob({} [{}])".format(self.id, self.status)
+
+    def is_expired(self):
+        return (self.finished is not None and
+                time.time() - self.finished > JOB_TTL)
+
+    def as_dict(self):
+        job = {'job_id': self.id,
+               'status': self.status,
+               'search': self.params}
+        if self.status == 'Done':
+            job['results'] = self.results
+        elif self.status == 'Error':
+            job['error'] = self.error
+        return job
+
+
+class SearchJobManager(object):
+    """Runs the 'SearchJob's in a bounded pool of threads, so requests are
+    not tied up by slow searches. Admission control: 'submit()' rejects new
+    jobs while 'max_pending' jobs are waiting or running.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING):
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.jobs = {}
+        self.pending = 0
+        self.lock = Lock()
+        self.logger = set_logger('SearchJobs', Params.LOGGER_DETAIL)
+
+    def submit(self, params):
+        """Queues the search of 'params'.
+        Returns the 'SearchJob' (None if there are too many pending jobs).
+        """
+        with self.lock:
+            self.remove_expired()
+            if self.pending >= self.max_pending:
+                self.logger.warning("submit: Job rejected ({} pending)"
+                                    .format(self.pending))
+                return None
+            job = SearchJob(params)
+            self.jobs[job.id] = job
+            self.pending += 1
+        self.executor.submit(self.run, job)
+        return job
+
+    def get(self, job_id, wait=0):
+        """Returns the job 'job_id' (None if not found), waiting up to
+        'wait' seconds for it to finish.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job and wait:
+            job.done.wait(min(wait, JOB_MAX_WAIT))
+        return job
+
+    def remove_expired(self):
+        """Removes the finished jobs older than 'JOB_TTL'.
+        Must be called holding 'lock'.
+        """
+        for job_id in [job.id for job in self.jobs.values()
+                       if job.is_expired()]:
+            del self.jobs[job_id]
+
+    def run(self, job):
+        """Calculates the paths of 'job' (run by the pool threads).
+        """
+        job.status = 'Running'
+        params = job.params
+        profile = SearchProfile()
+        snapshot = None
+        try:
+            with app.app_context():
+                snapshot = get_snapshot()
+                paths = calc_paths_cached(
+                    snapshot.get_exchange(params['orig_loc']),
+                    snapshot.get_coin(params['orig_coin']),
+                    params['orig_amt'],
+                    snapshot.get_exchange(params['dest_loc']),
+                    snapshot.get_coin(params['dest_coin']),
+                    snapshot.get_coin(params['currency']),
+                    params['fee_settings'],
+                    self.logger,
+                    snapshot=snapshot,
+                    max_hops=params['max_hops'],
+                    top_k=Params.MAX_PATHS,
+                    profile=profile)
+            job.results = [path.as_dict() for path in paths]
+            job.status = 'Done'
+            profile.finish(len(paths))
+        # Catch generic exception if anything went wrong in logic
+        except Exception as e:
+            self.logger.error("run: {} failed: {}"
+                              .format(job, traceback.format_exc()))
+            job.error = type(e).__name__
+            job.status = 'Error'
+            profile.finish(-1)
+        if snapshot:
+            search_register.register(
+                'api-' + job.id, params['orig_amt'],
+                snapshot.get_coin(params['orig_coin']),
+                snapshot.get_exchange(params['orig_loc']),
+                snapshot.get_coin(params['dest_coin']),
+                snapshot.get_exchange(params['dest_loc']),
+                snapshot.get_coin(params['currency']),
+                params['max_hops'], [], profile)
+        with self.lock:
+            self.pending -= 1
+        job.finished = time.time()
+        job.done.set()
+
+
+"""Job manager shared by the requests of the process.
+"""
+search_jobs = SearchJobManager()
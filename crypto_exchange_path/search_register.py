@@ -0,0 +1,192 @@
+import time
+import queue
+import datetime
+import traceback
+from threading import Thread, Lock
+from contextlib import contextmanager
+from crypto_exchange_path import app, db
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.models import QueryRegister
+from crypto_exchange_path.utils import set_logger
+
+""" ***********************************************************************
+***************************************************************************
+SEARCH REGISTER
+***************************************************************************
+*********************************************************************** """
+
+"""Searches waiting to be written in 'QueryRegister' (further searches are
+not registered until the writer catches up), rows written per commit and
+maximum seconds a search waits to be written.
+"""
+REGISTER_QUEUE_SIZE = 1000
+REGISTER_BATCH_SIZE = 50
+REGISTER_FLUSH_SECONDS = 5
+
+"""Names of the candidate counts stored, by number of hops.
+"""
+HOPS_NAMES = {0: 'direct', 1: '1-hop', 2: '2-hop'}
+
+
+class SearchProfile(object):
+    """Timings (in seconds) of the sections of a search ('snapshot',
+    'search', 'paths', 'cache'...) and of the search until all the routes
+    of each number of hops were found ('direct', '1-hop', '2-hop'),
+    candidate routes found by number of hops, labels pruned and whether the
+    results came from 'path_cache'. Filled in by 'calc_paths',
+    'calc_paths_cached' and 'iter_paths'.
+    """
+
+    def __init__(self):
+        self.start_time = datetime.datetime.now()
+        self.finish_time = None
+        self.sections = {}
+        self.candidates = {}
+        self.pruned = 0
+        self.cache_hit = False
+        self.results = None
+
+    def __repr__(self):
+        return ("SearchProfile({:.1f}ms, {} results, cache_hit={})"
+                .format(self.calc_duration() * 1000, self.results,
+                        self.cache_hit))
+
+    @contextmanager
+    def section(self, name):
+        """Adds the time spent inside the block to the section 'name'.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = (self.sections.get(name, 0) +
+                                   time.perf_counter() - start)
+
+    def add_candidates(self, found, pruned):
+        """Adds the routes found ({<hops>: <routes>}) and labels pruned by a
+        'RouteEngine'.
+        """
+        for hops, count in found.items():
+            self.candidates[hops] = self.candidates.get(hops, 0) + count
+        self.pruned += pruned
+
+    def add_settle_times(self, settle_times):
+        """Adds the seconds a 'RouteEngine' took to find all the routes of
+        each number of hops ({<hops>: <seconds>}).
+        """
+        for hops, elapsed in settle_times.items():
+            name = HOPS_NAMES.get(hops, "{}-hop".format(hops))
+            self.sections[name] = self.sections.get(name, 0) + elapsed
+
+    def finish(self, results):
+        self.results = results
+        self.finish_time = datetime.datetime.now()
+
+    def calc_duration(self):
+        finish_time = self.finish_time or datetime.datetime.now()
+        return (finish_time - self.start_time).total_seconds()
+
+    def get_sections_str(self):
+        return "|".join("{}={:.1f}ms".format(name, elapsed * 1000)
+                        for name, elapsed in sorted(self.sections.items()))
+
+    def get_candidates_str(self):
+        items = ["{}={}".format(HOPS_NAMES.get(hops, "{}-hop".format(hops)),
+                                count)
+                 for hops, count in sorted(self.candidates.items())]
+        items.append("pruned={}".format(self.pruned))
+        return "|".join(items)
+
+
+class SearchRegister(object):
+    """Writes the searches into 'QueryRegister' from a background thread, in
+    batches, so registering a search never adds latency to it. If the queue
+    is full, searches are dropped (and counted in 'dropped').
+    """
+
+    def __init__(self, queue_size=REGISTER_QUEUE_SIZE,
+                 batch_size=REGISTER_BATCH_SIZE,
+                 flush_seconds=REGISTER_FLUSH_SECONDS):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.dropped = 0
+        self.thread = None
+        self.lock = Lock()
+        self.logger = set_logger('SearchRegister', Params.LOGGER_DETAIL)
+
+    def register(self, session_id, orig_amt, orig_coin, orig_loc, dest_coin,
+                 dest_loc, currency, connection_type, exchanges, profile):
+        """Queues the search to be written. Ids of coins and locations are
+        taken from the objects given. 'exchanges' are the ids of the
+        exchanges selected by the user (empty if all of them).
+        """
+        row = {'session_id': session_id or '-',
+               'orig_amt': orig_amt,
+               'orig_coin': orig_coin.id,
+               'orig_loc': orig_loc.id,
+               'dest_coin': dest_coin.id,
+               'dest_loc': dest_loc.id,
+               'currency': currency.id,
+               'connection_type': connection_type,
+               'exchanges': ",".join(exchanges)[:400] or None,
+               'results': profile.results,
+               'start_time': profile.start_time,
+               'finish_time': profile.finish_time,
+               'duration': round(profile.calc_duration(), 4),
+               'sections': profile.get_sections_str()[:200],
+               'candidates': profile.get_candidates_str()[:100],
+               'cache_hit': profile.cache_hit}
+        self.start()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        """Starts the writer thread (if not running yet).
+        """
+        if self.thread:
+            return
+        with self.lock:
+            if not self.thread:
+                self.thread = Thread(target=self.run, name='SearchRegister',
+                                     daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """Loop of the writer thread.
+        """
+        while True:
+            rows = [self.queue.get()]
+            deadline = time.time() + self.flush_seconds
+            while len(rows) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self.write(rows)
+
+    def write(self, rows):
+        """Writes 'rows' in 'QueryRegister' (in one commit).
+        """
+        with app.app_context():
+            try:
+                db.session.add_all([QueryRegister(**row) for row in rows])
+                db.session.commit()
+            # Catch generic exception: registering must never stop
+            except Exception:
+                db.session.rollback()
+                self.logger.error("write: {} searches lost: {}"
+                                  .format(len(rows),
+                                          traceback.format_exc()))
+            finally:
+                db.session.remove()
+
+
+"""Register shared by the requests of the process.
+"""
+search_register = SearchRegister()
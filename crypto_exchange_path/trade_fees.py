@@ -0,0 +1,93 @@
+""" ***********************************************************************
+***************************************************************************
+TRADE FEE RESOLVER
+***************************************************************************
+*********************************************************************** """
+
+
+def calc_fee_literal(fee, scope):
+    """Calcs the fee literal to be later shown in the website.
+    """
+    if scope == "(Maker)":
+        scope_str = "(for Market Makers)"
+    elif scope == "(Taker)":
+        scope_str = "(for Market Takers)"
+    elif scope == "(BNB)":
+        scope_str = "(when paid in BNB)"
+    else:
+        scope_str = "({} trades)".format(scope)
+    return "{}% {}".format(fee, scope_str)
+
+
+class TradeFeeResolver(object):
+    """Trade fees of an exchange for some fee settings, compiled from its
+    'Trade' fees. Fees are chosen by priority:
+        1. 'cep_promo' (our promos)
+        2. 'special_fee' (special fees of the exchange, e.g. '(BNB)')
+        3. Fee of the pair traded ('<sell_coin>/<buy_coin>' scope)
+        4. 'default_fee' ('(Maker)', '(Taker)'...)
+        5. Average of maker and taker fees if 'default_fee' is '(Avg)'
+    If the chosen fee has no amount, the average is used (if allowed).
+    Results are [<amount%>, <fee_coin>, <fee_literal>] ([None, None, None]
+    if there is no fee).
+    """
+
+    def __init__(self, fees, cep_promo, special_fee, default_fee):
+        self.has_fees = bool(fees)
+        top_fee = None
+        pair_fees = {}
+        default = None
+        maker_fee = None
+        taker_fee = None
+        fee_coin_avg = None
+        for fee in fees:
+            # Save 'Maker'/Taker fees in case they are needed latter
+            if fee.scope == '(Maker)':
+                maker_fee = fee.amount
+                fee_coin_avg = fee.fee_coin
+            elif fee.scope == '(Taker)':
+                taker_fee = fee.amount
+                fee_coin_avg = fee.fee_coin
+            if fee.scope == cep_promo:
+                top_fee = fee
+            elif fee.scope == special_fee:
+                if not top_fee or top_fee.scope != cep_promo:
+                    top_fee = fee
+            elif len(fee.scope.split("/")) == 2:
+                pair_fees[tuple(fee.scope.split("/"))] = fee
+            elif fee.scope == default_fee:
+                default = fee
+        # Fee if no other one is found
+        self.avg_fee = [None, None, None]
+        if (default_fee == '(Avg)' and maker_fee is not None and
+                taker_fee is not None):
+            avg_fee = round((maker_fee + taker_fee) / 2, 4)
+            if maker_fee == taker_fee:
+                fee_literal = "{}% (for both Market Makers & Market Takers)"\
+                    .format(avg_fee)
+            else:
+                fee_literal = "{}% (average of Market Makers fee - {}% -"\
+                    " and Market Takers fee - {}% -)"\
+                    .format(avg_fee, maker_fee, taker_fee)
+            self.avg_fee = [avg_fee, fee_coin_avg, fee_literal]
+        # Promos and special fees apply to all the pairs
+        self.pair_fees = {}
+        if top_fee:
+            self.fee = self.compile_fee(top_fee)
+        else:
+            self.fee = self.compile_fee(default)
+            for pair, fee in pair_fees.items():
+                self.pair_fees[pair] = self.compile_fee(fee)
+
+    def compile_fee(self, fee):
+        """Returns the result of choosing 'fee'.
+        """
+        if not fee or fee.amount is None:
+            return self.avg_fee
+        return [fee.amount, fee.fee_coin,
+                calc_fee_literal(fee.amount, fee.scope)]
+
+    def resolve(self, sell_coin, buy_coin):
+        """Returns the fee to trade 'sell_coin' into 'buy_coin' (ids).
+        """
+        return self.pair_fees.get((sell_coin, buy_coin), self.fee)
@@ -290,9 +290,10 @@ def float_to_str(f):
     return float_string
 
 
-def round_amount_by_price(amount, coin):
+def round_amount_by_price(amount, coin, snapshot=None):
     """Returns a rounded amount in FLOAT format that depends
     on the valuation of the coin.
+    If a 'MarketSnapshot' is given, the price is read from it.
     """
     if amount is None:
         return None
@@ -303,9 +304,13 @@ def round_amount_by_price(amount, coin):
         except Exception as e:
             return amount
     else:
-        price = Price.query.filter_by(coin=coin, base_coin='USD').first()
-        if price:
-            price = price.price
+        if snapshot:
+            price = snapshot.get_price(coin, 'USD')
+        else:
+            price = Price.query.filter_by(coin=coin, base_coin='USD').first()
+            if price:
+                price = price.price
+        if price is not None:
             if price > 10000:
                 decs = 7
             elif price > 1000:
@@ -328,9 +333,10 @@ def round_amount_by_price(amount, coin):
         return amount
 
 
-def round_amount_by_price_str(amount, coin):
+def round_amount_by_price_str(amount, coin, snapshot=None):
     """Returns a rounded amount in STRING format that depends
     on the valuation of the coin.
+    If a 'MarketSnapshot' is given, the price is read from it.
     """
     if amount is None:
         return "-"
@@ -341,10 +347,14 @@ def round_amount_by_price_str(amount, coin):
         except Exception as e:
             return amount
     else:
-        price = Price.query.filter_by(coin=coin.id,
-                                      base_coin='eur-euro').first()
-        if price:
-            price = price.price
+        if snapshot:
+            price = snapshot.get_price(coin.id, 'eur-euro')
+        else:
+            price = Price.query.filter_by(coin=coin.id,
+                                          base_coin='eur-euro').first()
+            if price:
+                price = price.price
+        if price is not None:
             if price > 10000:
                 decs = 7
             elif price > 1000:
@@ -1,11 +1,12 @@
 from flask import Markup
-from crypto_exchange_path.models import (Coin, TradePair, Fee, Price,
-                                         Exchange, Mappings, Subscriber)
+from crypto_exchange_path.models import (Coin, Exchange, TradePair, Fee,
+                                         Price, Mappings, Subscriber)
 from crypto_exchange_path import db
 from crypto_exchange_path.config import Params
 from crypto_exchange_path.utils import (is_number,
                                         float_to_str)
-from crypto_exchange_path.fx_manager import set_fx, get_fx
+from crypto_exchange_path.fx_manager import get_fx_cache, NOT_CACHED
+from crypto_exchange_path.price_history import get_price_history
 
 
 def get_coins(pos_limit=999999, type=None, status=None, return_ids=False):
@@ -40,69 +41,78 @@ def get_coins(pos_limit=999999, type=None, status=None, return_ids=False):
 
 
 def get_coin(id):
-    """Returns a Coin object given its symbol.
+    """Returns a Coin record given its id. Coins are read from the market
+    snapshot (no query), as detached read-only records. Coins not found
+    there (e.g. added after the snapshot was loaded) are read from 'Coin'.
     """
-    coin = Coin.query.filter_by(id=id).first()
+    # Imported here: 'market_snapshot' depends on this module
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    coin = get_snapshot().get_coin(id)
+    if coin is None:
+        coin = Coin.query.filter_by(id=id).first()
     return coin
 
 
 def get_coin_by_symbol(symbol):
-    """Returns a Coin object given its symbol.
+    """Returns a Coin record given its symbol.
     """
-    coin = Coin.query.filter_by(symbol=symbol).first()
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    coin = get_snapshot().get_coin_by_symbol(symbol)
+    if coin is None:
+        coin = Coin.query.filter_by(symbol=symbol).first()
     return coin
 
 
 def get_coin_by_longname(longname):
-    """Returns a Coin object given its longname.
+    """Returns a Coin record given its longname.
     """
-    coin = Coin.query.filter_by(long_name=longname).first()
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    coin = get_snapshot().get_coin_by_longname(longname)
+    if coin is None:
+        coin = Coin.query.filter_by(long_name=longname).first()
     return coin
 
 
 def get_coin_by_urlname(url_name):
-    """Returns a Coin object given its url name.
+    """Returns a Coin record given its url name.
     """
-    coin = Coin.query.filter_by(url_name=url_name).first()
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    coin = get_snapshot().get_coin_by_urlname(url_name)
+    if coin is None:
+        coin = Coin.query.filter_by(url_name=url_name).first()
     return coin
 
 
 def get_exchange(id):
-    """Returns the exchange object with the given 'id'.
+    """Returns the exchange record with the given 'id'. Exchanges are read
+    from the market snapshot (no query), as detached read-only records.
+    Exchanges not found there are read from 'Exchange'.
     """
-    exchange = Exchange.query.filter_by(id=id).first()
-    if exchange:
-        return exchange
-    else:
-        return None
+    # Imported here: 'market_snapshot' depends on this module
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    exchange = get_snapshot().get_exchange(id)
+    if exchange is None:
+        exchange = Exchange.query.filter_by(id=id).first()
+    return exchange
 
 
 def get_exch_by_name(name):
-    """Returns the exchange object with the given 'name'.
+    """Returns the exchange record with the given 'name'.
     """
-    exchange = Exchange.query.filter_by(name=name).first()
-    if exchange:
-        return exchange
-    else:
-        return None
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    exchange = get_snapshot().get_exch_by_name(name)
+    if exchange is None:
+        exchange = Exchange.query.filter_by(name=name).first()
+    return exchange
 
 
 def get_exchanges(types=[], status=None):
-    """Returns the list of exchanges available in 'Exchange' table.
+    """Returns the list of exchanges available in 'Exchange' table (read
+    from the market snapshot, reloaded by all the workers whenever the
+    market data is published), sorted by id.
     """
-    exchanges = []
-    if types and status:
-        for type in types:
-            exchanges += Exchange.query\
-                .filter_by(type=type, status=status).all()
-    elif types:
-        for type in types:
-            exchanges += Exchange.query.filter_by(type=type).all()
-    elif status:
-        exchanges += Exchange.query.filter_by(status=status).all()
-    else:
-        exchanges = Exchange.query.all()
-    return sorted(exchanges, key=lambda x: x.id)
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    return get_snapshot().get_exchanges(types, status)
 
 
 def get_exchange_choices(types=[], status=None):
@@ -393,15 +403,24 @@ def calc_fee(action, exchange, coin, amt, logger):
                                     action=action,
                                     scope=coin.id,
                                     status='Active').first()
+    return apply_fee(fee_query, coin, amt, get_coin, fx_exchange, logger)
+
+
+def apply_fee(fee_query, coin, amt, coin_getter, fx_function, logger):
+    """Applies the deposit or withdrawal fee 'fee_query' to 'amt' of 'coin'.
+    Coins and FX are resolved with 'coin_getter' and 'fx_function', so the
+    same rules serve both the DB and the 'MarketSnapshot'.
+    Returns: [<fee_amt>, <fee_details>]
+    """
     if fee_query and (fee_query.amount is not None):
         # If Type == 'Absolute', just return value
         if fee_query.type == 'Absolute':
             # Check if fee is provided in another coin
             if ((fee_query.fee_coin != '-') and
                     (fee_query.fee_coin != fee_query.scope)):
-                fee_coin = get_coin(fee_query.fee_coin)
+                fee_coin = coin_getter(fee_query.fee_coin)
                 if fee_coin:
-                    fx_amt = fx_exchange(fee_coin.id,
+                    fx_amt = fx_function(fee_coin.id,
                                          coin.id,
                                          fee_query.amount,
                                          logger)
@@ -428,7 +447,7 @@ def calc_fee(action, exchange, coin, amt, logger):
                 return [wd_fee, lit]
         # If Type == 'Less1kUSD', get amount in USD and check if less than 1k
         elif fee_query.type == 'Less1kUSD':
-            amount_usd = fx_exchange(coin.id, 'usd-us-dollars', amt, logger)
+            amount_usd = fx_function(coin.id, 'usd-us-dollars', amt, logger)
             if amount_usd < 1000:
                 lit = "{} {} (fixed amount for deposits of less than $1000)"\
                     .format(fee_query.amount, coin.symbol)
@@ -443,12 +462,16 @@ def calc_fee(action, exchange, coin, amt, logger):
 
 def is_crypto(crypto):
     """Checks whether a coin is a crypto(True) or a fiat coin(False).
+    Uses the coin types of the market snapshot (no query). Coins not found
+    there are read from 'Coin' (see 'get_coin').
     """
+    # Imported here: 'market_snapshot' depends on this module
+    from crypto_exchange_path.market_snapshot import get_snapshot
+    snapshot = get_snapshot()
+    if snapshot.get_coin(crypto):
+        return snapshot.is_crypto(crypto)
     coin = Coin.query.filter_by(id=crypto).first()
-    if coin and coin.type == 'Crypto':
-        return True
-    else:
-        return False
+    return bool(coin and coin.type == 'Crypto')
 
 
 def set_default_exch(coin_id):
@@ -513,29 +536,51 @@ def make_unique_field(field, value):
     return value
 
 
-def fx_exchange(orig_coin, dest_coin, amount, logger):
+def fx_exchange(orig_coin, dest_coin, amount, logger, as_of=None):
+    """Converts 'amount' of 'orig_coin' into 'dest_coin' with the current
+    prices or, if 'as_of' is given (datetime or timestamp), with the prices
+    of the price history at that moment.
+    """
     if amount is None:
         logger.warning("fx_exchange: FX could not be calculated for '{}"
                        "-{}' (amount=None)".format(orig_coin, dest_coin))
         return None
-    stored_fx = get_fx(orig_coin, dest_coin)
-    if stored_fx:
-        return round(stored_fx * amount, 8)
     # If 'orig_coin'='dest_coin', return 'amount' directly
     if orig_coin == dest_coin:
         return amount
+    if as_of is not None:
+        history = get_price_history()
+        fx = history.get_fx_rate(orig_coin, dest_coin, as_of) \
+            if history else None
+    else:
+        # Keep the cache: rates are stored with the prices they come from
+        fx_cache = get_fx_cache()
+        fx = fx_cache.get(orig_coin, dest_coin)
+        if fx is NOT_CACHED:
+            fx = calc_fx(orig_coin, dest_coin)
+            fx_cache.set(orig_coin, dest_coin, fx)
+    # If the FX could not be calculated, return 'None'
+    if fx is None:
+        logger.warning("fx_exchange: FX could not be calculated for '{}"
+                       "/{}'".format(orig_coin, dest_coin))
+        return None
+    return round(fx * amount, 8)
+
+
+def calc_fx(orig_coin, dest_coin):
+    """Calculates the FX to convert 'orig_coin' into 'dest_coin' from the
+    'Price' table. Returns None if it can not be calculated.
+    """
     # If Price is found & 'dest_coin' is a 'base_coin', return price
     prc = Price.query.filter_by(coin=orig_coin, base_coin=dest_coin)\
                      .first()
     if prc:
-        set_fx(orig_coin, dest_coin, prc.price)
-        return round(prc.price * amount, 8)
+        return prc.price
     # If Price is found & 'dest_coin' is a 'coin', return 1/price
     prc = Price.query.filter_by(coin=dest_coin, base_coin=orig_coin)\
                      .first()
-    if prc and (prc.price != 0):
-        set_fx(orig_coin, dest_coin, 1 / prc.price)
-        return round(1 / prc.price * amount, 8)
+    if prc and prc.price:
+        return 1 / prc.price
     # Else, triangulate FX using USD prices (Case if Type=Crypto)
     prc_orig_usd = Price.query.filter_by(coin=orig_coin,
                                          base_coin='usd-us-dollars')\
@@ -543,12 +588,8 @@ def fx_exchange(orig_coin, dest_coin, amount, logger):
     prc_dest_usd = Price.query.filter_by(coin=dest_coin,
                                          base_coin='usd-us-dollars')\
         .first()
-    fx_triangulation = 0
-    if prc_dest_usd and (prc_dest_usd.price != 0):
-        fx_triangulation = prc_orig_usd.price / prc_dest_usd.price
-    if prc_orig_usd and prc_dest_usd:
-        set_fx(orig_coin, dest_coin, fx_triangulation)
-        return round(prc_orig_usd.price / prc_dest_usd.price * amount, 8)
+    if prc_orig_usd and prc_dest_usd and prc_dest_usd.price:
+        return prc_orig_usd.price / prc_dest_usd.price
     # Else, triangulate FX using BTC prices (Case if Type=Fiat)
     prc_orig_fiat = Price.query.filter_by(coin='btc-bitcoin',
                                           base_coin=orig_coin)\
@@ -556,17 +597,8 @@ def fx_exchange(orig_coin, dest_coin, amount, logger):
     prc_dest_fiat = Price.query.filter_by(coin='btc-bitcoin',
                                           base_coin=dest_coin)\
         .first()
-    fx_triangulation = 0
-    if prc_dest_fiat and (prc_dest_fiat.price != 0):
-        fx_triangulation = prc_dest_fiat.price / prc_orig_fiat.price
-    if prc_orig_fiat and prc_dest_fiat:
-        set_fx(orig_coin,
-               dest_coin,
-               fx_triangulation)
-        return round(prc_dest_fiat.price / prc_orig_fiat.price * amount, 8)
-    # If the FX could not be calculated, return 'None'
-    logger.warning("fx_exchange: FX could not be calculated for '{}"
-                   "/{}'".format(orig_coin, dest_coin))
+    if prc_orig_fiat and prc_dest_fiat and prc_orig_fiat.price:
+        return prc_dest_fiat.price / prc_orig_fiat.price
     return None
 
 
@@ -0,0 +1,21 @@
+from sqlalchemy import inspect, text
+from crypto_exchange_path import app, db
+from crypto_exchange_path.models import QueryRegister
+
+# Adds the columns of 'QueryRegister' missing in the database (the search
+# profile: 'duration', 'sections', 'candidates' and 'cache_hit'). Columns
+# already there are skipped, so it can be run more than once.
+with app.app_context():
+    table = QueryRegister.__table__
+    dialect = db.engine.dialect
+    preparer = dialect.identifier_preparer
+    columns = {column['name']
+               for column in inspect(db.engine).get_columns(table.name)}
+    for column in table.columns:
+        if column.name in columns:
+            continue
+        db.session.execute(text("ALTER TABLE {} ADD COLUMN {} {}".format(
+            preparer.format_table(table), preparer.format_column(column),
+            column.type.compile(dialect=dialect))))
+        print("OK - Column '{}.{}' added".format(table.name, column.name))
+    db.session.commit()
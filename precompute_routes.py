@@ -0,0 +1,19 @@
+import sys
+from crypto_exchange_path import app
+from crypto_exchange_path.config import Params
+from crypto_exchange_path.utils import set_logger
+from crypto_exchange_path.precompute import precompute_routes
+
+# Precompute the searches of popular pairs with the new prices. Run by
+# 'update_prices.py' after every price update, in the host of the app
+# (optional argument: file with the symbols of the coins, one per line).
+logger = set_logger('Precompute', Params.LOGGER_DETAIL)
+coins_file = sys.argv[1] if len(sys.argv) > 1 else None
+
+try:
+    with app.app_context():
+        precompute_routes(logger, coins_file)
+except Exception as e:
+    logger.exception("precompute_routes: Failed [{}]".format(e))
+    print("KO - Error precomputing routes")
+    sys.exit(1)
@@ -0,0 +1,106 @@
+import logging
+from collections import namedtuple
+import pytest
+from crypto_exchange_path import app, db
+from crypto_exchange_path.market_snapshot import (MarketSnapshot, CoinRecord,
+                                                  ExchangeRecord, FeeRecord)
+from crypto_exchange_path.objects import Location
+
+"""Rows of 'TradePair' and 'Price' used to build the test market.
+"""
+PairRecord = namedtuple('PairRecord', ['exchange', 'coin', 'base_coin',
+                                       'volume'])
+PriceRecord = namedtuple('PriceRecord', ['coin', 'base_coin', 'price'])
+
+"""Small fixed market (see 'build_market'):
+    - 'ex1' trades AAA/BBB directly.
+    - 'ex2' and 'ex3' only trade AAA and BBB against BTC, ETH and USDT
+      (one-hop paths and two-hop paths between them).
+    - 'ex4' trades both against BTC, but withdrawing BBB costs more than
+      what the search delivers (destination amount lower than 0).
+"""
+COINS = [('usd-us-dollars', 'USD', 'Fiat', 1.0),
+         ('btc-bitcoin', 'BTC', 'Crypto', 30000.0),
+         ('eth-ethereum', 'ETH', 'Crypto', 2000.0),
+         ('usdt-tether', 'USDT', 'Crypto', 1.0),
+         ('aaa-coin', 'AAA', 'Crypto', 10.0),
+         ('bbb-coin', 'BBB', 'Crypto', 4.0)]
+PAIRS = {'ex1': [('aaa-coin', 'bbb-coin', 500),
+                 ('aaa-coin', 'btc-bitcoin', 90),
+                 ('bbb-coin', 'btc-bitcoin', 80)],
+         'ex2': [('aaa-coin', 'btc-bitcoin', 100),
+                 ('aaa-coin', 'eth-ethereum', 60),
+                 ('aaa-coin', 'usdt-tether', 300),
+                 ('bbb-coin', 'btc-bitcoin', 70),
+                 ('bbb-coin', 'usdt-tether', 200)],
+         'ex3': [('bbb-coin', 'btc-bitcoin', 120),
+                 ('bbb-coin', 'eth-ethereum', 50),
+                 ('bbb-coin', 'usdt-tether', 400),
+                 ('aaa-coin', 'eth-ethereum', 30)],
+         'ex4': [('aaa-coin', 'btc-bitcoin', 40),
+                 ('bbb-coin', 'btc-bitcoin', 40)]}
+TRADE_FEES = {'ex1': (0.1, 0.2), 'ex2': (0.15, 0.25), 'ex3': (0.05, 0.1),
+              'ex4': (0.2, 0.2)}
+WITHDRAWAL_FEES = {'btc-bitcoin': 0.0005, 'eth-ethereum': 0.01,
+                   'usdt-tether': 1.0, 'aaa-coin': 0.5, 'bbb-coin': 2.0}
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    """Runs each test in an app context with an empty in-memory database.
+    """
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.testing = True
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def logger():
+    return logging.getLogger('tests')
+
+
+def build_market():
+    """Returns the 'MarketSnapshot' of the test market.
+    """
+    coins = [CoinRecord(coin_id, symbol, symbol + ' coin', symbol.lower(),
+                        rank, symbol.lower() + '.png', type, 'Active')
+             for rank, (coin_id, symbol, type, _) in enumerate(COINS, 1)]
+    exchanges = [ExchangeRecord(exch, exch.upper(), 'Exchange', '', '', '',
+                                '', 'Active') for exch in sorted(PAIRS)]
+    exchanges.append(ExchangeRecord('wallet', 'Wallet', 'Wallet', '', '', '',
+                                    '', 'Active'))
+    fees = []
+    pairs = []
+    for exch, exch_pairs in PAIRS.items():
+        maker, taker = TRADE_FEES[exch]
+        fees.append(FeeRecord(exch, 'Trade', '(Maker)', maker, None, '-',
+                              'Percentage', 'Active'))
+        fees.append(FeeRecord(exch, 'Trade', '(Taker)', taker, None, '-',
+                              'Percentage', 'Active'))
+        for coin, base_coin, volume in exch_pairs:
+            pairs.append(PairRecord(exch, coin, base_coin, volume))
+        for coin, amount in WITHDRAWAL_FEES.items():
+            if exch == 'ex4' and coin == 'bbb-coin':
+                amount = 1000000.0
+            fees.append(FeeRecord(exch, 'Withdrawal', coin, amount, None,
+                                  '-', 'Absolute', 'Active'))
+    prices = [PriceRecord(coin_id, 'usd-us-dollars', usd)
+              for coin_id, _, _, usd in COINS[1:]]
+    return MarketSnapshot(1, coins, exchanges, fees, pairs, prices)
+
+
+@pytest.fixture
+def market():
+    return build_market()
+
+
+@pytest.fixture
+def origin(market, logger):
+    """100 AAA in the wallet.
+    """
+    return Location("Origin", market.get_exchange('wallet'), 100,
+                    market.get_coin('aaa-coin'), logger, market)
@@ -0,0 +1,44 @@
+from crypto_exchange_path import coin_types
+from crypto_exchange_path.coin_types import CoinTypes, STABLECOIN
+from crypto_exchange_path.route_batch import route_key
+from crypto_exchange_path.route_engine import RouteEngine
+from conftest import build_market
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+def test_categories_flag_coins_by_symbol(market):
+    coin_types = CoinTypes(market.coins.values())
+    assert coin_types.get_flags('usdt-tether') & STABLECOIN
+    assert not coin_types.is_bridge('usdt-tether')
+    assert coin_types.is_bridge('btc-bitcoin')
+    assert not coin_types.is_bridge('usd-us-dollars')
+
+
+def test_bridges_leave_out_stablecoins(market):
+    # 'ex2' trades AAA and BBB against BTC and USDT
+    coinZs = {coinZ for coinZ, _ in market.get_coinZs('ex2', 'aaa-coin')}
+    assert coinZs >= {'btc-bitcoin', 'usdt-tether'}
+    assert set(market.get_bridge_coins('ex2', 'aaa-coin')) == \
+        {'btc-bitcoin', 'eth-ethereum'}
+    assert all('usdt-tether' not in coins
+               for exch in market.bridges.values()
+               for coins in exch.values())
+
+
+def test_stablecoins_are_not_transferred(market, origin, logger,
+                                         monkeypatch):
+    # The original search compared the ids with 'USDT' (never equal to
+    # 'usdt-tether'), so it did transfer USDT between exchanges
+    dest_loc = market.get_exchange('ex3')
+    dest_coin = market.get_coin('bbb-coin')
+
+    def transferred(snapshot):
+        engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                             FEE_SETTINGS, logger, snapshot, max_hops=2)
+        return {route_key(route)[0][1][-1] for route in engine.search()
+                if len(route.legs) > 1}
+
+    assert transferred(market) == {'btc-bitcoin', 'eth-ethereum'}
+    monkeypatch.setattr(coin_types, 'COIN_CATEGORIES', {})
+    assert 'usdt-tether' in transferred(build_market())
@@ -0,0 +1,33 @@
+from conftest import build_market
+from crypto_exchange_path.exchange_manager import get_exchange_manager
+
+
+def test_managers_are_shared_by_relevant_fee_settings(market, logger):
+    settings = {'CEP': '(CEP)', 'Default': '(Avg)'}
+    manager = get_exchange_manager('ex1', settings, logger, market)
+    assert manager.exchange.id == 'ex1'
+    # Special fees of other exchanges do not change the manager
+    assert get_exchange_manager('ex1', dict(settings, ex2='(BNB)'), logger,
+                                market) is manager
+    for changed in ({'Default': '(Maker)'}, {'CEP': None},
+                    {'ex1': '(BNB)'}):
+        other = get_exchange_manager('ex1', dict(settings, **changed),
+                                     logger, market)
+        assert other is not manager
+        assert get_exchange_manager('ex1', dict(settings, **changed),
+                                    logger, market) is other
+    assert get_exchange_manager('ex2', settings, logger, market) is \
+        not manager
+
+
+def test_managers_are_dropped_with_the_snapshot(market, logger):
+    settings = {'Default': '(Avg)'}
+    manager = get_exchange_manager('ex2', settings, logger, market)
+    coinZ = manager.get_best_coinZ('aaa-coin', 'bbb-coin')
+    assert coinZ.coin.id == 'usdt-tether'
+    # Results are memoised for all the searches of the snapshot
+    assert manager.get_best_coinZ('aaa-coin', 'bbb-coin') is coinZ
+    new_market = build_market()
+    new_manager = get_exchange_manager('ex2', settings, logger, new_market)
+    assert new_manager is not manager
+    assert new_manager.snapshot is new_market
@@ -0,0 +1,28 @@
+from crypto_exchange_path import db
+from crypto_exchange_path.fx_manager import get_fx_cache, reset_fx
+from crypto_exchange_path.models import Price
+from crypto_exchange_path.utils_db import fx_exchange
+
+
+def test_zero_rates_and_misses_are_cached_until_reset(logger):
+    reset_fx()
+    db.session.add(Price(coin='aaa-coin', base_coin='usd-us-dollars',
+                         price=0.0))
+    db.session.commit()
+    for _ in range(2):
+        assert fx_exchange('aaa-coin', 'usd-us-dollars', 5, logger) == 0
+        assert fx_exchange('ccc-coin', 'usd-us-dollars', 5, logger) is None
+    stats = get_fx_cache().get_stats()
+    assert (stats['rates'], stats['misses'], stats['hits'],
+            stats['negative']) == (2, 2, 1, 1)
+    # New prices are only used once the cache is replaced
+    db.session.add(Price(coin='ccc-coin', base_coin='usd-us-dollars',
+                         price=2.0))
+    db.session.commit()
+    assert fx_exchange('ccc-coin', 'usd-us-dollars', 5, logger) is None
+    old_cache = reset_fx()
+    assert old_cache.get_stats()['negative'] == 2
+    assert fx_exchange('ccc-coin', 'usd-us-dollars', 5, logger) == 10
+    stats = get_fx_cache().get_stats()
+    assert stats['version'] == old_cache.version + 1
+    assert (stats['rates'], stats['misses'], stats['negative']) == (1, 1, 0)
@@ -0,0 +1,53 @@
+import pytest
+from crypto_exchange_path import db, fx_matrix
+from crypto_exchange_path.fx_matrix import FxMatrix
+from crypto_exchange_path.models import Price
+from crypto_exchange_path.utils_db import calc_fx
+
+"""Prices covering all the rules of 'FxMatrix' (pairs, reverse pairs, USD
+and BTC triangulations and zero prices).
+"""
+PRICES = {('btc-bitcoin', 'usd-us-dollars'): 30000.0,
+          ('eth-ethereum', 'usd-us-dollars'): 2000.0,
+          ('aaa-coin', 'usd-us-dollars'): 10.0,
+          ('ccc-coin', 'usd-us-dollars'): 0.0,
+          ('aaa-coin', 'eth-ethereum'): 0.006,
+          ('bbb-coin', 'aaa-coin'): 0.5,
+          ('btc-bitcoin', 'eur-euro'): 27000.0,
+          ('btc-bitcoin', 'gbp-pound'): 24000.0}
+COINS = sorted({coin for pair in PRICES for coin in pair}) + ['ddd-coin']
+
+
+def test_rates_follow_the_rules_of_fx_exchange():
+    for (coin, base_coin), price in PRICES.items():
+        db.session.add(Price(coin=coin, base_coin=base_coin, price=price))
+    db.session.commit()
+    fx = FxMatrix(PRICES)
+    for orig_coin in COINS:
+        for dest_coin in COINS:
+            if orig_coin != dest_coin:
+                assert fx.get_rate(orig_coin, dest_coin) == \
+                    pytest.approx(calc_fx(orig_coin, dest_coin))
+    assert fx.get_rate('aaa-coin', 'bbb-coin') == 2
+    assert fx.get_rate('eur-euro', 'gbp-pound') == pytest.approx(24 / 27)
+    assert fx.get_rate('usd-us-dollars', 'ccc-coin') is None
+
+
+def test_batch_rates_match_single_rates(monkeypatch):
+    fx = FxMatrix(PRICES)
+    orig_coins = [coin for coin in COINS for _ in COINS]
+    dest_coins = COINS * len(COINS)
+    rates = [fx.get_rate(orig_coin, dest_coin)
+             for orig_coin, dest_coin in zip(orig_coins, dest_coins)]
+    assert fx.get_rates(orig_coins, dest_coins) == pytest.approx(rates)
+    amounts = [2.5] * len(orig_coins)
+    converted = [fx.convert(orig_coin, dest_coin, 2.5)
+                 for orig_coin, dest_coin in zip(orig_coins, dest_coins)]
+    assert fx.convert_many(orig_coins, dest_coins, amounts) == converted
+    assert fx.convert_many(['btc-bitcoin', 'ddd-coin'], 'eur-euro',
+                           [1, 1]) == [27000.0, None]
+    # Without NumPy
+    monkeypatch.setattr(fx_matrix, 'np', None)
+    fx = FxMatrix(PRICES)
+    assert fx.arrays is None
+    assert fx.get_rates(orig_coins, dest_coins) == rates
@@ -0,0 +1,61 @@
+from conftest import PairRecord
+from crypto_exchange_path.market_snapshot import (MarketSnapshot, CoinRecord,
+                                                  ExchangeRecord)
+
+
+def brute_force_bridge(snapshot, exchange, coin, base_coin):
+    """Best coinZ of all the coins traded against both coins.
+    """
+    coinZs = snapshot.get_adjacent_coins(exchange, coin)
+    base_coinZs = snapshot.get_adjacent_coins(exchange, base_coin)
+    common = [(min(coinZs[coinZ] or 0, base_coinZs[coinZ] or 0),
+               coinZ == 'btc-bitcoin', coinZ)
+              for coinZ in coinZs if coinZ in base_coinZs]
+    if not common:
+        return None
+    coinZ = sorted(common, key=lambda item: (-item[0], not item[1],
+                                             item[2]))[0][2]
+    return (coinZ, coinZs[coinZ], base_coinZs[coinZ])
+
+
+def test_best_bridges_match_all_the_candidates(market):
+    found = 0
+    for exch in market.adjacency:
+        coins = sorted(market.adjacency[exch])
+        for coin in coins:
+            for base_coin in coins:
+                if coin == base_coin:
+                    continue
+                best = market.get_best_bridge(exch, coin, base_coin)
+                assert best == brute_force_bridge(market, exch, coin,
+                                                  base_coin)
+                found += best is not None
+    assert found
+
+
+def test_best_bridge_ties():
+    coins = [CoinRecord(coin_id, coin_id[:3].upper(), coin_id, coin_id, i,
+                        '', 'Crypto', 'Active')
+             for i, coin_id in enumerate(['aaa-coin', 'bbb-coin',
+                                          'btc-bitcoin', 'ccc-coin',
+                                          'ddd-coin', 'eee-coin'])]
+    exchanges = [ExchangeRecord(exch, exch.upper(), 'Exchange', '', '', '',
+                                '', 'Active') for exch in ('ex1', 'ex2')]
+    pairs = []
+    # 'ex1': 'btc-bitcoin' prevails among coins of the same liquidity
+    for coinZ, liq_a, liq_b in [('ddd-coin', 50, 10), ('btc-bitcoin', 10, 20),
+                                ('ccc-coin', 10, 10)]:
+        pairs.append(PairRecord('ex1', 'aaa-coin', coinZ, liq_a))
+        pairs.append(PairRecord('ex1', 'bbb-coin', coinZ, liq_b))
+    # 'ex2': the lowest id among the rest, missing volumes count as 0
+    for coinZ, liq_a, liq_b in [('eee-coin', 5, None), ('ddd-coin', None, 5),
+                                ('ccc-coin', 0, 0)]:
+        pairs.append(PairRecord('ex2', 'aaa-coin', coinZ, liq_a))
+        pairs.append(PairRecord('ex2', 'bbb-coin', coinZ, liq_b))
+    snapshot = MarketSnapshot(1, coins, exchanges, [], pairs, [])
+    best = snapshot.get_best_bridge('ex1', 'aaa-coin', 'bbb-coin')
+    assert best == ('btc-bitcoin', 10, 20)
+    assert snapshot.get_best_bridge('ex1', 'aaa-coin', 'bbb-coin') is best
+    assert snapshot.get_best_bridge('ex2', 'aaa-coin', 'bbb-coin') == \
+        ('ccc-coin', 0, 0)
+    assert snapshot.get_best_bridge('ex2', 'aaa-coin', 'btc-bitcoin') is None
@@ -0,0 +1,55 @@
+import pytest
+from crypto_exchange_path import objects
+from crypto_exchange_path.path_calculator import calc_paths
+from crypto_exchange_path.route_engine import RouteEngine
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+def search(market, logger):
+    return calc_paths(market.get_exchange('wallet'),
+                      market.get_coin('aaa-coin'), 100,
+                      market.get_exchange('wallet'),
+                      market.get_coin('bbb-coin'),
+                      market.get_coin('usd-us-dollars'), FEE_SETTINGS,
+                      logger, snapshot=market, top_k=5)
+
+
+def test_literals_are_formatted_when_accessed(market, logger, monkeypatch):
+    calls = []
+    round_str = objects.round_amount_by_price_str
+
+    def counted_round_str(*args):
+        calls.append(args)
+        return round_str(*args)
+
+    monkeypatch.setattr(objects, 'round_amount_by_price_str',
+                        counted_round_str)
+    paths = search(market, logger)
+    assert paths and not calls
+    trade = paths[0].hop_1.trade
+    assert trade.buy_amt_str.endswith(' ' + trade.buy_coin.symbol)
+    assert paths[0].destination.amount_str.endswith(' BBB')
+    assert len(calls) == 2
+
+
+def test_path_objects_have_no_instance_dict(market, logger):
+    path = search(market, logger)[0]
+    for obj in (path, path.origin, path.destination, path.hop_1,
+                path.hop_1.trade):
+        assert not hasattr(obj, '__dict__')
+        with pytest.raises(AttributeError):
+            obj.unknown = None
+
+
+def test_total_fees_match_the_route_fees(market, origin, logger):
+    engine = RouteEngine(origin, market.get_exchange('wallet'),
+                         market.get_coin('bbb-coin'), 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    routes = engine.search_best(5)
+    paths = search(market, logger)
+    assert [path.total_fees for path in paths] == \
+        pytest.approx([route.fees for route in routes])
+    for path in paths:
+        assert path.hop_2 is (path.hops[1] if len(path.hops) > 1 else None)
+        assert path.as_dict()['total_fees'] == path.total_fees
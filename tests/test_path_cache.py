@@ -0,0 +1,68 @@
+import pytest
+from crypto_exchange_path import path_calculator
+from crypto_exchange_path.path_cache import PathCache
+from crypto_exchange_path.path_calculator import (calc_paths,
+                                                  calc_paths_cached,
+                                                  calc_path_key)
+from crypto_exchange_path.search_register import SearchProfile
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = PathCache(size=2)
+    monkeypatch.setattr(path_calculator, 'path_cache', cache)
+    return cache
+
+
+def search(market, logger, amount, cached=True, **kwargs):
+    func = calc_paths_cached if cached else calc_paths
+    return func(market.get_exchange('wallet'), market.get_coin('aaa-coin'),
+                amount, market.get_exchange('wallet'),
+                market.get_coin('bbb-coin'),
+                market.get_coin('usd-us-dollars'), FEE_SETTINGS, logger,
+                snapshot=market, **kwargs)
+
+
+def summary(paths):
+    return [(calc_path_key(path), path.total_fees) for path in paths]
+
+
+def test_cached_searches_match_the_search(market, logger, cache):
+    expected = summary(search(market, logger, 100, cached=False, top_k=3))
+    assert summary(search(market, logger, 100, top_k=3)) == expected
+    profile = SearchProfile()
+    paths = search(market, logger, 100, top_k=3, profile=profile)
+    assert profile.cache_hit
+    assert summary(paths) == expected
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_other_amounts_are_searched_again(market, logger, cache):
+    search(market, logger, 100, top_k=3)
+    # The routes feasible (and the 'top_k' best) depend on the amount
+    expected = summary(search(market, logger, 105, cached=False, top_k=3))
+    assert summary(search(market, logger, 105, top_k=3)) == expected
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_least_recently_used_searches_are_evicted(market, logger, cache):
+    for amount in (10, 20, 10, 30):
+        search(market, logger, amount)
+    assert cache.hits == 1
+    assert len(cache.entries) == 2
+    # '20' was the least recently used search when '30' was stored
+    search(market, logger, 10)
+    search(market, logger, 20)
+    assert (cache.hits, cache.misses) == (2, 4)
+
+
+def test_new_market_versions_drop_the_cache(market, logger, cache):
+    search(market, logger, 100)
+    market.version += 1
+    profile = SearchProfile()
+    search(market, logger, 100, profile=profile)
+    assert not profile.cache_hit
+    assert cache.version == market.version
+    assert (cache.hits, cache.misses) == (0, 2)
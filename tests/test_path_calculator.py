@@ -0,0 +1,120 @@
+import pytest
+from crypto_exchange_path import route_batch
+from crypto_exchange_path.path_calculator import (calc_paths, iter_paths,
+                                                  calc_paths_sweep,
+                                                  calc_path_key)
+from crypto_exchange_path.route_batch import route_key
+from crypto_exchange_path.route_engine import RouteEngine
+from crypto_exchange_path.search_register import SearchProfile
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+def test_iter_paths_yields_paths_by_hops_in_one_search(market, origin,
+                                                       logger):
+    dest_loc = market.get_exchange('wallet')
+    dest_coin = market.get_coin('bbb-coin')
+    currency = market.get_coin('usd-us-dollars')
+    profile = SearchProfile()
+    paths = list(iter_paths(origin.exchange, origin.coin, origin.amount,
+                            dest_loc, dest_coin, currency, FEE_SETTINGS,
+                            logger, snapshot=market, profile=profile))
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    routes = list(engine.search())
+    assert [path.type for path in paths] == \
+        sorted(route.hops for route in routes)
+    assert sorted(calc_path_key(path) for path in paths) == \
+        sorted(route_key(route) for route in routes)
+    # Each route was found once
+    assert profile.candidates == engine.found
+
+
+def test_direct_trades_come_before_the_search_ends(market, origin, logger):
+    engine = RouteEngine(origin, market.get_exchange('wallet'),
+                         market.get_coin('bbb-coin'), 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    routes = engine.search_by_hops()
+    assert next(routes).hops == 0
+    assert engine.settled_hops < engine.max_hops + 1 and engine.queue
+    hops = [route.hops for route in routes]
+    assert hops == sorted(hops) and 2 in hops
+
+
+def test_vectorised_search_needs_top_k(market, origin, logger):
+    args = (origin.exchange, origin.coin, origin.amount,
+            market.get_exchange('wallet'), market.get_coin('bbb-coin'),
+            market.get_coin('usd-us-dollars'), FEE_SETTINGS, logger)
+    scalar = [(path.type, calc_path_key(path))
+              for path in calc_paths(*args, snapshot=market)]
+    # Without 'top_k', the scalar search runs (all the paths, not sorted)
+    assert [(path.type, calc_path_key(path))
+            for path in calc_paths(*args, snapshot=market,
+                                   vectorised=True)] == scalar
+    best = calc_paths(*args, snapshot=market, top_k=2)
+    assert [calc_path_key(path) for path in
+            calc_paths(*args, snapshot=market, top_k=2, vectorised=True)] \
+        == [calc_path_key(path) for path in best]
+
+
+def test_calc_paths_only_builds_the_top_k_paths(market, origin, logger):
+    paths = calc_paths(origin.exchange, origin.coin, origin.amount,
+                       market.get_exchange('wallet'),
+                       market.get_coin('bbb-coin'),
+                       market.get_coin('usd-us-dollars'), FEE_SETTINGS,
+                       logger, snapshot=market, top_k=2)
+    engine = RouteEngine(origin, market.get_exchange('wallet'),
+                         market.get_coin('bbb-coin'), 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    assert [calc_path_key(path) for path in paths] == \
+        [route_key(route) for route in engine.search_best(2)]
+    assert paths[0].total_fees <= paths[1].total_fees
+
+
+def run_sweep(market, logger, amounts, top_k=None):
+    return calc_paths_sweep(market.get_exchange('wallet'),
+                            market.get_coin('aaa-coin'), amounts,
+                            market.get_exchange('wallet'),
+                            market.get_coin('bbb-coin'),
+                            market.get_coin('usd-us-dollars'), FEE_SETTINGS,
+                            logger, snapshot=market, top_k=top_k)
+
+
+def test_sweep_matches_one_search_per_amount(market, logger):
+    amounts = [1, 10, 100, 1000]
+    curves, best = run_sweep(market, logger, amounts)
+    assert len(best) == len(amounts)
+    for i, amount in enumerate(amounts):
+        paths = sorted(calc_paths(market.get_exchange('wallet'),
+                                  market.get_coin('aaa-coin'), amount,
+                                  market.get_exchange('wallet'),
+                                  market.get_coin('bbb-coin'),
+                                  market.get_coin('usd-us-dollars'),
+                                  FEE_SETTINGS, logger, snapshot=market),
+                       key=lambda path: path.total_fees)
+        fees = {calc_path_key(path): path.total_fees for path in paths}
+        # Routes not feasible for an amount have no fee
+        assert {curve.legs: curve.fees[i] for curve in curves
+                if curve.fees[i] is not None} == pytest.approx(fees)
+        assert calc_path_key(best[i]) == calc_path_key(paths[0])
+    # Small amounts can not pay the withdrawal fees of some routes
+    assert any(None in curve.fees for curve in curves)
+
+
+@pytest.mark.skipif(route_batch.np is None, reason="NumPy not available")
+def test_sweep_without_numpy_gives_the_same_curves(market, logger,
+                                                   monkeypatch):
+    amounts = [1, 10, 100, 1000]
+    curves, best = run_sweep(market, logger, amounts, top_k=2)
+    monkeypatch.setattr(route_batch, 'np', None)
+    scalar_curves, scalar_best = run_sweep(market, logger, amounts, top_k=2)
+    assert [curve.legs for curve in scalar_curves] == \
+        [curve.legs for curve in curves]
+    for curve, scalar_curve in zip(curves, scalar_curves):
+        assert [fee is None for fee in curve.fees] == \
+            [fee is None for fee in scalar_curve.fees]
+        assert [fee for fee in curve.fees if fee is not None] == \
+            pytest.approx([fee for fee in scalar_curve.fees
+                           if fee is not None])
+    assert [calc_path_key(path) for path in scalar_best] == \
+        [calc_path_key(path) for path in best]
@@ -0,0 +1,22 @@
+from crypto_exchange_path import precompute, path_calculator
+from crypto_exchange_path.config import Params
+
+
+def test_precomputed_routes_are_replayed(market, logger, tmp_path,
+                                         monkeypatch):
+    monkeypatch.setattr(precompute, 'get_snapshot', lambda: market)
+    monkeypatch.setattr(path_calculator, 'get_snapshot', lambda: market)
+    monkeypatch.setattr(precompute, 'PRECOMPUTED_ROUTES_FILE',
+                        str(tmp_path / 'routes.json'))
+    assert precompute.precompute_routes(logger, workers=1)
+    data = precompute.load_precomputed_routes(logger)
+    # Only the amount of the landing searches is precomputed
+    assert all(key.endswith('|{}'.format(precompute.LANDING_AMOUNT_USD))
+               for key in data['routes'])
+    wallet = market.get_exchange('wallet')
+    paths = precompute.get_precomputed_paths(
+        wallet, market.get_coin('aaa-coin'), 300, wallet,
+        market.get_coin('bbb-coin'), market.get_coin(Params.DEFAULT_CURRENCY),
+        logger)
+    assert paths and [path.total_fees for path in paths] == \
+        sorted(path.total_fees for path in paths)
@@ -0,0 +1,31 @@
+from crypto_exchange_path.price_history import (append_prices, read_coin_ids,
+                                                PriceHistory)
+from conftest import PriceRecord
+
+
+def test_append_prices_extends_coin_ids(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    coins_path = str(tmp_path / 'coins.txt')
+    assert append_prices([PriceRecord('btc', 'usd', 30000.0)], 1.0, path,
+                         coins_path)
+    # Indexes come from the coins file, whether the history is mapped or not
+    assert append_prices([PriceRecord('eth', 'usd', 2000.0),
+                          PriceRecord('btc', 'usd', 31000.0)], 2.0, path,
+                         coins_path)
+    assert read_coin_ids(coins_path) == ['btc', 'usd', 'eth']
+    history = PriceHistory(path, coins_path)
+    assert history.get_prices(0) == {('btc', 'usd'): 30000.0}
+    assert history.get_prices(1) == {('eth', 'usd'): 2000.0,
+                                     ('btc', 'usd'): 31000.0}
+
+
+def test_append_prices_needs_coin_ids_of_history(tmp_path):
+    path = str(tmp_path / 'history.bin')
+    coins_path = str(tmp_path / 'coins.txt')
+    append_prices([PriceRecord('btc', 'usd', 30000.0)], 1.0, path, coins_path)
+    (tmp_path / 'coins.txt').unlink()
+    size = (tmp_path / 'history.bin').stat().st_size
+    assert not append_prices([PriceRecord('eth', 'usd', 2000.0)], 2.0, path,
+                             coins_path)
+    assert not (tmp_path / 'coins.txt').exists()
+    assert (tmp_path / 'history.bin').stat().st_size == size
@@ -0,0 +1,59 @@
+from crypto_exchange_path import db, price_table, market_snapshot
+from crypto_exchange_path.fx_manager import get_fx_cache
+from crypto_exchange_path.models import Price
+
+
+def test_workers_reload_published_data(tmp_path, monkeypatch):
+    path = str(tmp_path / 'prices.bin')
+    refreshed = []
+    monkeypatch.setattr(price_table, '_table', None)
+    monkeypatch.setattr(price_table.get_price_table, '__defaults__',
+                        (path,))
+    monkeypatch.setattr(market_snapshot, 'refresh_snapshot',
+                        lambda logger=None: refreshed.append(True))
+    db.session.add(Price(coin='btc', base_coin='usd', price=30000.0))
+    db.session.commit()
+    table = price_table.publish_prices(path)
+    assert (table.version, table.data_version) == (1, 0)
+    assert table.records() == [('btc', 'usd', 30000.0)]
+
+    def publish_in_other_worker(publish):
+        # Another worker replaces the file: this one still maps 'table'
+        new_table = publish(path)
+        monkeypatch.setattr(price_table, '_table', table)
+        return new_table
+
+    # New market data: only the snapshot is reloaded
+    fx_version = get_fx_cache().version
+    new_table = publish_in_other_worker(price_table.publish_market_data)
+    assert (new_table.version, new_table.data_version) == (1, 1)
+    price_table.check_price_table()
+    assert refreshed == [True] and get_fx_cache().version == fx_version
+    price_table.check_price_table()
+    assert refreshed == [True]
+    # New prices: the FX cache is replaced as well
+    table = price_table.get_price_table()
+    new_table = publish_in_other_worker(price_table.publish_prices)
+    assert (new_table.version, new_table.data_version) == (2, 1)
+    price_table.check_price_table()
+    assert refreshed == [True, True]
+    assert get_fx_cache().version == fx_version + 1
+
+
+def test_tables_of_other_databases_are_ignored(tmp_path, monkeypatch):
+    path = str(tmp_path / 'prices.bin')
+    monkeypatch.setattr(price_table, '_table', None)
+    monkeypatch.setattr(price_table.get_price_table, '__defaults__',
+                        (path,))
+    db.session.add(Price(coin='btc', base_coin='usd', price=30000.0))
+    db.session.commit()
+    with monkeypatch.context() as m:
+        m.setattr(price_table, 'get_db_key', lambda: b'otherdb!')
+        price_table.publish_prices(path)
+        assert price_table.get_price_table(path).db_key == b'otherdb!'
+    assert price_table.get_price_table(path) is None
+    # The snapshot reads the 'Price' table instead
+    db.session.query(Price).update({'price': 31000.0})
+    db.session.commit()
+    snapshot = market_snapshot.load_snapshot(1)
+    assert snapshot.get_price('btc', 'usd') == 31000.0
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from crypto_exchange_path import app, db
+from crypto_exchange_path import query_stats
+from crypto_exchange_path.query_stats import (QueryBudgetExceeded,
+                                              SQL_STATS_HEADER, check_budget,
+                                              sql_section, start_stats,
+                                              stop_stats)
+
+
+def run_statements(count):
+    for _ in range(count):
+        db.session.execute(text("SELECT 1"))
+
+
+def test_statements_are_counted_by_section():
+    start_stats('test')
+    try:
+        run_statements(2)
+        with sql_section('inner'):
+            run_statements(3)
+    finally:
+        stats = stop_stats()
+    assert stats.count == 5
+    assert stats.sections['inner'][0] == 3
+    assert stats.as_header().startswith('count=5;')
+
+
+def test_budget_is_checked_in_test_mode(monkeypatch):
+    monkeypatch.setitem(query_stats.QUERY_BUDGETS, 'test', 2)
+    start_stats('test')
+    try:
+        run_statements(2)
+        check_budget(query_stats.get_stats(), 'test')
+        run_statements(1)
+        with pytest.raises(QueryBudgetExceeded):
+            check_budget(query_stats.get_stats(), 'test')
+    finally:
+        stop_stats()
+
+
+def test_failed_statements_drop_their_start_time():
+    start_stats('test')
+    try:
+        with pytest.raises(OperationalError):
+            db.session.execute(text("SELECT * FROM missing_table"))
+        db.session.rollback()
+        conn = db.session.connection()
+        run_statements(1)
+        assert not conn.info.get('query_start')
+    finally:
+        stats = stop_stats()
+    assert stats.count == 1
+
+
+def test_exch_results_reports_and_checks_sql_stats(monkeypatch):
+    # Needs the full application (the routes are not importable without it)
+    pytest.importorskip('flask_blogging')
+    url = '/exchanges/search/btc-to-eth'
+    with app.test_client() as client:
+        response = client.get(url)
+        count = response.headers[SQL_STATS_HEADER]
+        assert count.startswith('count=')
+        assert int(count.split(';')[0][6:]) <= \
+            query_stats.QUERY_BUDGETS['exch_results']
+        monkeypatch.setitem(query_stats.QUERY_BUDGETS, 'exch_results', 0)
+        with pytest.raises(QueryBudgetExceeded):
+            client.get(url)
@@ -0,0 +1,201 @@
+import pytest
+from crypto_exchange_path.exchange_manager import ExchangeManager
+from crypto_exchange_path.route_engine import RouteEngine
+from crypto_exchange_path import route_batch
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+def enumerate_baseline(market, origin, dest_loc, dest_coin, logger,
+                       one_hop_min_amount=True):
+    """Enumeration of the original 0/1/2-hop sections of 'calc_paths' on
+    'market'. Returns {(<hops>, <route key>): <destination amount>}.
+    If 'one_hop_min_amount', one-hop paths with a destination amount lower
+    than 0 are skipped (as 'RouteEngine' does for all the paths).
+    """
+    orig_coin = origin.coin
+    paths = {}
+
+    def manager(exch):
+        return ExchangeManager(market.get_exchange(exch), FEE_SETTINGS,
+                               logger, market)
+
+    def start(exch):
+        amount = origin.amount - (origin.withdraw_fee or 0)
+        if exch != origin.exchange.id:
+            fee = market.calc_fee('Deposit', exch, orig_coin, amount, logger)
+            if fee and fee[0] is not None:
+                amount -= fee[0]
+        return amount
+
+    def withdraw(exch, coin, amount):
+        fee = market.calc_fee('Withdrawal', exch, coin, amount, logger)
+        if not fee or fee[0] is None:
+            return None
+        return amount - fee[0]
+
+    direct_pair_exch = market.get_exch_by_pair(orig_coin.id, dest_coin.id,
+                                               logger)
+    orig_exchanges = market.get_exch_by_coin(orig_coin.id)
+    dest_exchanges = market.get_exch_by_coin(dest_coin.id)
+    # 1. Direct exchange (no hops)
+    for exch in direct_pair_exch & orig_exchanges:
+        trade = manager(exch).perform_trade(start(exch), orig_coin,
+                                            dest_coin)
+        if not trade:
+            continue
+        dest_amt = trade.buy_amt
+        if exch != dest_loc.id:
+            dest_amt = withdraw(exch, dest_coin, dest_amt)
+            if dest_amt is None or dest_amt < 0:
+                continue
+        paths[(0, ((exch, (dest_coin.id,)),))] = dest_amt
+    # 2. Indirect exchange (one hop)
+    orig_exchanges = orig_exchanges - direct_pair_exch
+    dest_exchanges = dest_exchanges - direct_pair_exch
+    for exch in orig_exchanges & dest_exchanges:
+        exchange = manager(exch)
+        coinZ = exchange.get_best_coinZ(orig_coin.id, dest_coin.id)
+        if not coinZ:
+            continue
+        trade_1 = exchange.perform_trade(start(exch), orig_coin, coinZ.coin)
+        if not trade_1:
+            continue
+        trade_2 = exchange.perform_trade(trade_1.buy_amt, coinZ.coin,
+                                         dest_coin)
+        if not trade_2:
+            continue
+        dest_amt = trade_2.buy_amt
+        if exch != dest_loc.id:
+            dest_amt = withdraw(exch, dest_coin, dest_amt)
+            if dest_amt is None:
+                continue
+            if one_hop_min_amount and dest_amt < 0:
+                continue
+        paths[(1, ((exch, (coinZ.coin.id, dest_coin.id)),))] = dest_amt
+    # 3. Indirect exchange (two hops)
+    for exch_A in orig_exchanges:
+        coinZs_A = manager(exch_A).get_all_cryptoZs(orig_coin.id)
+        for exch_B in dest_exchanges:
+            if exch_A == exch_B:
+                continue
+            coinZs_B = manager(exch_B).get_all_cryptoZs(dest_coin.id)
+            for coinZ in {item[0] for item in coinZs_A} & \
+                    {item[0] for item in coinZs_B}:
+                coin = market.get_coin(coinZ)
+                trade_1 = manager(exch_A).perform_trade(start(exch_A),
+                                                        orig_coin, coin)
+                if not trade_1:
+                    continue
+                amount = withdraw(exch_A, coin, trade_1.buy_amt)
+                if amount is None:
+                    continue
+                fee = market.calc_fee('Deposit', exch_B, coin, amount,
+                                      logger)
+                if fee and fee[0] is not None:
+                    amount -= fee[0]
+                trade_2 = manager(exch_B).perform_trade(amount, coin,
+                                                        dest_coin)
+                if not trade_2:
+                    continue
+                dest_amt = trade_2.buy_amt
+                if exch_B != dest_loc.id:
+                    dest_amt = withdraw(exch_B, dest_coin, dest_amt)
+                    if dest_amt is None or dest_amt < 0:
+                        continue
+                key = ((exch_A, (coinZ,)), (exch_B, (dest_coin.id,)))
+                paths[(2, key)] = dest_amt
+    return paths
+
+
+def search_routes(engine):
+    return {(route.hops, route_batch.route_key(route)): route.dest_amt
+            for route in engine.search()}
+
+
+def test_engine_matches_baseline_enumeration(market, origin, logger):
+    dest_loc = market.get_exchange('wallet')
+    dest_coin = market.get_coin('bbb-coin')
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    routes = search_routes(engine)
+    baseline = enumerate_baseline(market, origin, dest_loc, dest_coin,
+                                  logger)
+    assert routes == baseline
+    # All the path types are covered by the test market
+    assert {hops for hops, _ in routes} == {0, 1, 2}
+
+
+def test_engine_skips_one_hop_paths_below_zero(market, origin, logger):
+    dest_loc = market.get_exchange('wallet')
+    dest_coin = market.get_coin('bbb-coin')
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=1)
+    routes = search_routes(engine)
+    baseline = enumerate_baseline(market, origin, dest_loc, dest_coin,
+                                  logger, one_hop_min_amount=False)
+    # The original one-hop section kept the path through 'ex4'
+    skipped = [key for key in baseline
+               if key[0] == 1 and key[1][0][0] == 'ex4']
+    assert skipped and all(baseline[key] < 0 for key in skipped)
+    assert not any(key in routes for key in skipped)
+    assert routes == {key: amount for key, amount in baseline.items()
+                      if key[0] <= 1 and key not in skipped}
+
+
+@pytest.mark.skipif(route_batch.np is None, reason="NumPy not available")
+def test_batch_evaluation_matches_engine(market, origin, logger):
+    dest_loc = market.get_exchange('ex3')
+    dest_coin = market.get_coin('bbb-coin')
+    batch = route_batch.RouteBatch(origin, dest_loc, dest_coin,
+                                   'usd-us-dollars', FEE_SETTINGS, logger,
+                                   market, max_hops=2)
+    candidates = list(batch.search())
+    fees = batch.evaluate([route.dest_amt for route in candidates],
+                          [batch.reference.start_label()])[:, 0]
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    routes = {route_batch.route_key(route): route
+              for route in engine.search()}
+    assert len(candidates) == len(fees) and routes
+    for candidate, fee in zip(candidates, fees):
+        route = routes.pop(route_batch.route_key(candidate), None)
+        if route is None:
+            assert fee == float('inf')
+        else:
+            assert fee == pytest.approx(route.fees,
+                                        rel=route_batch.RouteBatch.TOLERANCE)
+    assert not routes
+    # Winners are recalculated with the scalar engine
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    assert [route.fees for route in batch.search_best(3)] == \
+        [route.fees for route in engine.search_best(3)]
+
+
+def test_top_k_returns_the_best_routes(market, origin, logger):
+    dest_loc = market.get_exchange('wallet')
+    dest_coin = market.get_coin('bbb-coin')
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    routes = sorted(engine.search(), key=lambda route: route.fees)
+    assert len(routes) > 3
+    for top_k in (1, 3, len(routes), len(routes) + 5):
+        engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                             FEE_SETTINGS, logger, market, max_hops=2)
+        assert [route.fees for route in engine.search_best(top_k)] == \
+            [route.fees for route in routes[:top_k]]
+
+
+def test_top_k_bounds_the_search(market, origin, logger):
+    args = (origin, market.get_exchange('wallet'),
+            market.get_coin('bbb-coin'), 'usd-us-dollars', FEE_SETTINGS,
+            logger, market)
+    exhaustive = RouteEngine(*args, max_hops=2)
+    list(exhaustive.search())
+    bounded = RouteEngine(*args, max_hops=2)
+    bounded.search_best(1)
+    # Labels that already paid more than the best route are not expanded
+    assert bounded.bound < float('inf')
+    assert bounded.pruned > exhaustive.pruned
+    assert sum(bounded.found.values()) < sum(exhaustive.found.values())
@@ -0,0 +1,44 @@
+from crypto_exchange_path import route_pool
+from crypto_exchange_path.route_batch import route_key
+from crypto_exchange_path.route_engine import RouteEngine
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+def test_parallel_search_matches_serial(market, origin, logger, monkeypatch):
+    monkeypatch.setattr(route_pool, 'PARALLEL_MIN_EXCHANGES', 1)
+    dest_loc = market.get_exchange('wallet')
+    dest_coin = market.get_coin('bbb-coin')
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2)
+    parallel = route_pool.ParallelRouteEngine(origin, dest_loc, dest_coin,
+                                              'usd-us-dollars', FEE_SETTINGS,
+                                              logger, market, max_hops=2,
+                                              workers=2)
+    best = engine.search_best(100)
+    assert parallel.is_parallel(parallel.get_first_exchanges())
+    assert [(route.fees, route_key(route)) for route in
+            parallel.search_best(100)] == \
+        [(route.fees, route_key(route)) for route in best]
+    # Candidates found by the workers are merged
+    assert parallel.found == engine.found and sum(engine.found.values())
+
+
+def test_pruned_search_is_serial(market, origin, logger, monkeypatch):
+    monkeypatch.setattr(route_pool, 'PARALLEL_MIN_EXCHANGES', 1)
+    dest_loc = market.get_exchange('wallet')
+    dest_coin = market.get_coin('bbb-coin')
+    engine = RouteEngine(origin, dest_loc, dest_coin, 'usd-us-dollars',
+                         FEE_SETTINGS, logger, market, max_hops=2,
+                         max_labels=1)
+    parallel = route_pool.ParallelRouteEngine(origin, dest_loc, dest_coin,
+                                              'usd-us-dollars', FEE_SETTINGS,
+                                              logger, market, max_hops=2,
+                                              max_labels=1, workers=2)
+    best = engine.search_best(100)
+    assert engine.pruned
+    assert not parallel.is_parallel(parallel.get_first_exchanges())
+    assert [(route.fees, route_key(route)) for route in
+            parallel.search_best(100)] == \
+        [(route.fees, route_key(route)) for route in best]
+    assert parallel.pruned == engine.pruned
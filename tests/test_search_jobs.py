@@ -0,0 +1,73 @@
+from threading import Event
+import pytest
+from crypto_exchange_path import path_calculator, search_jobs
+from crypto_exchange_path.path_cache import PathCache
+from crypto_exchange_path.search_jobs import SearchJobManager
+
+PARAMS = {'orig_amt': 100, 'orig_coin': 'aaa-coin', 'orig_loc': 'wallet',
+          'dest_coin': 'bbb-coin', 'dest_loc': 'wallet',
+          'currency': 'usd-us-dollars', 'max_hops': 2,
+          'fee_settings': {'Default': '(Avg)'}}
+
+
+@pytest.fixture
+def jobs(market, monkeypatch):
+    """Job manager searching in the test market (searches are registered
+    in 'registered' instead of the DB).
+    """
+    monkeypatch.setattr(search_jobs, 'get_snapshot', lambda: market)
+    monkeypatch.setattr(path_calculator, 'path_cache', PathCache())
+    registered = []
+    monkeypatch.setattr(search_jobs.search_register, 'register',
+                        lambda session_id, *args: registered.append(
+                            session_id))
+    manager = SearchJobManager(workers=1, max_pending=1)
+    manager.registered = registered
+    yield manager
+    manager.executor.shutdown()
+
+
+def test_jobs_return_the_paths_found(jobs):
+    job = jobs.submit(PARAMS)
+    assert jobs.get(job.id, wait=10) is job
+    data = job.as_dict()
+    assert data['status'] == 'Done' and data['search'] == PARAMS
+    fees = [path['total_fees'] for path in data['results']]
+    assert fees and fees == sorted(fees)
+    assert jobs.registered == ['api-' + job.id] and not jobs.pending
+
+
+def test_jobs_above_max_pending_are_rejected(jobs, monkeypatch):
+    release = Event()
+
+    def blocked_search(*args, **kwargs):
+        release.wait(10)
+        return []
+
+    monkeypatch.setattr(search_jobs, 'calc_paths_cached', blocked_search)
+    job = jobs.submit(PARAMS)
+    assert jobs.submit(PARAMS) is None
+    release.set()
+    assert jobs.get(job.id, wait=10).status == 'Done'
+    assert jobs.submit(PARAMS) is not None
+
+
+def test_failed_jobs_report_the_error(jobs, monkeypatch):
+    def failed_search(*args, **kwargs):
+        raise ValueError("Wrong search")
+
+    monkeypatch.setattr(search_jobs, 'calc_paths_cached', failed_search)
+    job = jobs.get(jobs.submit(PARAMS).id, wait=10)
+    assert job.as_dict() == {'job_id': job.id, 'status': 'Error',
+                             'search': PARAMS, 'error': 'ValueError'}
+    assert not jobs.pending
+
+
+def test_finished_jobs_expire(jobs):
+    job = jobs.get(jobs.submit(PARAMS).id, wait=10)
+    assert not job.is_expired()
+    job.finished -= search_jobs.JOB_TTL + 1
+    assert job.is_expired()
+    # Expired jobs are removed when the next job is submitted
+    new_job = jobs.get(jobs.submit(PARAMS).id, wait=10)
+    assert jobs.get(job.id) is None and jobs.get(new_job.id) is new_job
@@ -0,0 +1,20 @@
+from crypto_exchange_path.path_calculator import calc_paths
+from crypto_exchange_path.search_register import SearchProfile
+
+FEE_SETTINGS = {'Default': '(Avg)'}
+
+
+def test_profile_times_each_number_of_hops(market, origin, logger):
+    profile = SearchProfile()
+    paths = calc_paths(origin.exchange, origin.coin, origin.amount,
+                       market.get_exchange('wallet'),
+                       market.get_coin('bbb-coin'),
+                       market.get_coin('usd-us-dollars'), FEE_SETTINGS,
+                       logger, snapshot=market, profile=profile)
+    profile.finish(len(paths))
+    sections = profile.sections
+    assert 0 <= sections['direct'] <= sections['1-hop'] <= \
+        sections['2-hop'] <= sections['search']
+    assert set(profile.candidates) == {0, 1, 2}
+    assert len(profile.get_sections_str()) <= 200
+    assert profile.get_candidates_str().startswith('direct=1|')
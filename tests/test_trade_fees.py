@@ -0,0 +1,59 @@
+from crypto_exchange_path.market_snapshot import FeeRecord
+from crypto_exchange_path.trade_fees import TradeFeeResolver
+
+
+def trade_fee(scope, amount, fee_coin='-'):
+    return FeeRecord('ex1', 'Trade', scope, amount, None, fee_coin,
+                     'Percentage', 'Active')
+
+
+FEES = [trade_fee('(Maker)', 0.1),
+        trade_fee('(Taker)', 0.3),
+        trade_fee('aaa-coin/bbb-coin', 0.05),
+        trade_fee('(BNB)', 0.075, 'bnb-binance-coin'),
+        trade_fee('(CEP)', 0.02)]
+
+
+def test_fees_are_chosen_by_priority():
+    # 1. Promos, 2. special fees (in any order in the fee list)
+    for fees in (FEES, FEES[::-1]):
+        resolver = TradeFeeResolver(fees, '(CEP)', '(BNB)', '(Maker)')
+        assert resolver.resolve('aaa-coin', 'bbb-coin')[0] == 0.02
+        resolver = TradeFeeResolver(fees, None, '(BNB)', '(Maker)')
+        assert resolver.resolve('aaa-coin', 'bbb-coin') == \
+            [0.075, 'bnb-binance-coin', '0.075% (when paid in BNB)']
+    # 3. Fee of the pair (only in the direction of its scope), 4. default
+    resolver = TradeFeeResolver(FEES, None, None, '(Maker)')
+    assert resolver.resolve('aaa-coin', 'bbb-coin') == \
+        [0.05, '-', '0.05% (aaa-coin/bbb-coin trades)']
+    assert resolver.resolve('bbb-coin', 'aaa-coin') == \
+        [0.1, '-', '0.1% (for Market Makers)']
+    # 5. Average of maker and taker fees
+    resolver = TradeFeeResolver(FEES[:2], None, None, '(Avg)')
+    assert resolver.resolve('aaa-coin', 'bbb-coin') == \
+        [0.2, '-', '0.2% (average of Market Makers fee - 0.1% - and '
+                   'Market Takers fee - 0.3% -)']
+
+
+def test_fees_without_amount_fall_back_to_the_average():
+    fees = FEES[:2] + [trade_fee('(CEP)', None)]
+    resolver = TradeFeeResolver(fees, '(CEP)', None, '(Avg)')
+    assert resolver.resolve('aaa-coin', 'bbb-coin')[0] == 0.2
+    # The average is only used with '(Avg)'
+    resolver = TradeFeeResolver(fees, '(CEP)', None, '(Maker)')
+    assert resolver.resolve('aaa-coin', 'bbb-coin') == [None, None, None]
+
+
+def test_exchanges_without_trade_fees():
+    resolver = TradeFeeResolver([], None, None, '(Avg)')
+    assert not resolver.has_fees
+    assert resolver.resolve('aaa-coin', 'bbb-coin') == [None, None, None]
+
+
+def test_resolvers_are_compiled_once_per_fee_settings(market):
+    resolver = market.get_trade_fee_resolver('ex1', None, None, '(Avg)')
+    assert market.get_trade_fee_resolver('ex1', None, None, '(Avg)') is \
+        resolver
+    assert market.get_trade_fee_resolver('ex1', None, None, '(Maker)') is \
+        not resolver
+    assert resolver.resolve('aaa-coin', 'bbb-coin')[0] == 0.15
@@ -0,0 +1,43 @@
+import pytest
+from crypto_exchange_path import db, market_snapshot, utils_db
+from crypto_exchange_path.models import Coin, Exchange
+
+
+@pytest.fixture
+def snapshot(market, monkeypatch):
+    monkeypatch.setattr(market_snapshot, 'get_snapshot', lambda: market)
+    return market
+
+
+def test_coins_missing_in_snapshot_are_read_from_db(snapshot):
+    assert utils_db.get_coin('btc-bitcoin') is snapshot.get_coin('btc-bitcoin')
+    assert utils_db.get_coin('ccc-coin') is None
+    db.session.add(Coin(id='ccc-coin', symbol='CCC', long_name='CCC coin',
+                        url_name='ccc', ranking=7, type='Crypto',
+                        status='Active'))
+    db.session.commit()
+    assert utils_db.get_coin('ccc-coin').symbol == 'CCC'
+    assert utils_db.get_coin_by_symbol('CCC').id == 'ccc-coin'
+    assert utils_db.get_coin_by_longname('CCC coin').id == 'ccc-coin'
+    assert utils_db.get_coin_by_urlname('ccc').id == 'ccc-coin'
+
+
+def test_exchanges_missing_in_snapshot_are_read_from_db(snapshot):
+    assert utils_db.get_exchange('ex1') is snapshot.get_exchange('ex1')
+    assert utils_db.get_exch_by_name('EX5') is None
+    db.session.add(Exchange(id='ex5', name='EX5', type='Exchange',
+                            affiliate='', status='Active'))
+    db.session.commit()
+    assert utils_db.get_exchange('ex5').name == 'EX5'
+    assert utils_db.get_exch_by_name('EX5').id == 'ex5'
+
+
+def test_coin_types_missing_in_snapshot_are_read_from_db(snapshot):
+    assert utils_db.is_crypto('btc-bitcoin')
+    assert not utils_db.is_crypto('usd-us-dollars')
+    assert not utils_db.is_crypto('ccc-coin')
+    db.session.add(Coin(id='ccc-coin', symbol='CCC', long_name='CCC coin',
+                        url_name='ccc', ranking=7, type='Crypto',
+                        status='Active'))
+    db.session.commit()
+    assert utils_db.is_crypto('ccc-coin')
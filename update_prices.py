@@ -1,3 +1,6 @@
+import os
+import sys
+import subprocess
 from urllib.request import urlopen
 
 
@@ -6,3 +9,9 @@ try:
     urlopen("https://www.cryptofeesaver.com/update/prices_slfjh23hk353mh4567df")
 except Exception as e:
     print("KO - Error opening link")
+else:
+    # Precompute the searches of popular pairs with the new prices (this
+    # script must run in the host of the app)
+    subprocess.run([sys.executable,
+                    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'precompute_routes.py')])